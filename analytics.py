@@ -0,0 +1,372 @@
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from board import Board
+from generator import COLORS
+from solver import AStarSolver
+
+LENGTH_BINS = 256  # longer solutions are counted in the last bin
+BRANCHING_BINS = 300  # bins of 0.01 moves between 1 and 4
+# The effective branching of the short solutions often exceeds 4 (bins of
+# 0.01 between 1 and 16)
+EFFECTIVE_BRANCHING_BINS = 1500
+NODE_BINS = 48  # bins of powers of 2
+SHARE_BINS = 100  # bins of 0.01 of the share of backtracking moves
+
+
+def puzzleRng(seed, index):
+    """
+    Return the random Generator placing the color cases of the puzzle [index]
+    of the population [seed] (the puzzles do not depend on the processes)
+
+    :seed: seed of the population
+    :index: index of the puzzle
+    :return: numpy random Generator
+    """
+    return np.random.default_rng((seed, index))
+
+
+class DifficultyStatistics:
+    """
+    Python Class accumulating the difficulty of solved puzzles in running
+    histograms, so that its size does not depend on the number of puzzles:
+    - lengths: length of the optimal solution
+    - branching: mean number of legal moves along the optimal solution
+    - effectiveBranching: nodes expanded ** (1 / length), the branching of a
+      uniform tree giving the effort of the solver
+    - nodes: nodes expanded by the solver (bins of powers of 2)
+    - backtracks: moves of the solution bringing the piece back to the case
+      it left the move before (out and back into a dead end)
+    - backtrackShares: backtracks / length (bins of 0.01), how much of the
+      solution is spent in dead ends
+    - borderColors: color cases on the border of the grid (2 neighbors),
+      crossed with the lengths in lengthsByBorderColors
+    Two instances are merged with +=.
+    """
+
+    def __init__(self, n):
+        """
+        Creation of empty statistics
+
+        :n: number of lines of the boards
+        """
+        self.n = n
+        self.puzzles = 0
+        self.unsolved = 0
+        self.hardest = (-1, -1)  # (length, index) of the longest solution
+        self.lengths = np.zeros(LENGTH_BINS, dtype=np.int64)
+        self.branching = np.zeros(BRANCHING_BINS + 1, dtype=np.int64)
+        self.effectiveBranching = np.zeros(EFFECTIVE_BRANCHING_BINS + 1, dtype=np.int64)
+        self.nodes = np.zeros(NODE_BINS, dtype=np.int64)
+        self.backtracks = np.zeros(LENGTH_BINS, dtype=np.int64)
+        self.backtrackShares = np.zeros(SHARE_BINS + 1, dtype=np.int64)
+        self.lengthsByBorderColors = np.zeros(
+            (len(COLORS), LENGTH_BINS), dtype=np.int64
+        )
+
+    def add(self, index, length, legalMoves, nodes, backtracks, borderColors):
+        """
+        Count a solved puzzle
+
+        :index: index of the puzzle (see puzzleRng)
+        :length: length of the optimal solution
+        :legalMoves: total number of legal moves of the states of the solution
+        :nodes: nodes expanded by the solver
+        :backtracks: backtracking moves of the solution
+        :borderColors: color cases on the border of the grid
+        :return: nothing
+        """
+        self.puzzles += 1
+        lengthBin = min(length, LENGTH_BINS - 1)
+        self.lengths[lengthBin] += 1
+        self.lengthsByBorderColors[borderColors, lengthBin] += 1
+        self.backtracks[min(backtracks, LENGTH_BINS - 1)] += 1
+        self.nodes[min(max(nodes, 1).bit_length() - 1, NODE_BINS - 1)] += 1
+        if length > 0:
+            self.branching[self.branchingBin(legalMoves / length)] += 1
+            self.effectiveBranching[
+                self.branchingBin(
+                    max(nodes, 1) ** (1 / length), EFFECTIVE_BRANCHING_BINS
+                )
+            ] += 1
+            self.backtrackShares[int(SHARE_BINS * backtracks / length)] += 1
+        self.hardest = max(self.hardest, (length, index))
+
+    @staticmethod
+    def branchingBin(value, bins=BRANCHING_BINS):
+        """
+        Return the bin of a branching factor (bins of 0.01 from 1, the last
+        bin for the larger values)
+
+        :value: branching factor
+        :bins: number of bins before the last one
+        :return: int
+        """
+        return min(max(int(round((value - 1) * 100)), 0), bins)
+
+    def __iadd__(self, other):
+        assert self.n == other.n
+        self.puzzles += other.puzzles
+        self.unsolved += other.unsolved
+        self.hardest = max(self.hardest, other.hardest)
+        for name in (
+            "lengths",
+            "branching",
+            "effectiveBranching",
+            "nodes",
+            "backtracks",
+            "backtrackShares",
+            "lengthsByBorderColors",
+        ):
+            getattr(self, name)[:] += getattr(other, name)
+        return self
+
+    @staticmethod
+    def quantile(histogram, q):
+        """
+        Return the bin of the quantile [q] of a histogram
+
+        :histogram: array of counts
+        :q: quantile between 0 and 1
+        :return: int (-1 if the histogram is empty)
+        """
+        total = histogram.sum()
+        if total == 0:
+            return -1
+        return int(np.searchsorted(np.cumsum(histogram), q * total))
+
+    @staticmethod
+    def mean(histogram, values):
+        """
+        Return the mean of a histogram
+
+        :histogram: array of counts
+        :values: value of each bin
+        :return: float (nan if the histogram is empty)
+        """
+        total = histogram.sum()
+        return float(histogram @ values / total) if total else float("nan")
+
+    def summary(self):
+        """
+        Return a dictionary of the main figures (one row of the table printed
+        by the command line)
+
+        :return: dictionary
+        """
+        lengths = np.arange(LENGTH_BINS)
+        branching = 1 + np.arange(BRANCHING_BINS + 1) / 100
+        return {
+            "lines": self.n,
+            "puzzles": self.puzzles,
+            "unsolved": self.unsolved,
+            "meanLength": self.mean(self.lengths, lengths),
+            "p10": self.quantile(self.lengths, 0.1),
+            "p50": self.quantile(self.lengths, 0.5),
+            "p90": self.quantile(self.lengths, 0.9),
+            "p99": self.quantile(self.lengths, 0.99),
+            "maxLength": self.hardest[0],
+            "hardestPuzzle": self.hardest[1],
+            "branching": self.mean(self.branching, branching),
+            "effectiveBranching": self.mean(
+                self.effectiveBranching,
+                1 + np.arange(EFFECTIVE_BRANCHING_BINS + 1) / 100,
+            ),
+            "medianNodes": 2 ** self.quantile(self.nodes, 0.5),
+            "meanBacktracks": self.mean(self.backtracks, lengths),
+            "backtrackShareP50": self.quantile(self.backtrackShares, 0.5) / SHARE_BINS,
+            "backtrackShareP90": self.quantile(self.backtrackShares, 0.9) / SHARE_BINS,
+            "backtrackShareP99": self.quantile(self.backtrackShares, 0.99) / SHARE_BINS,
+        }
+
+    def toDict(self):
+        """
+        Return the statistics as a JSON serializable dictionary
+
+        :return: dictionary
+        """
+        return dict(
+            self.summary(),
+            lengths=self.lengths.tolist(),
+            branching=self.branching.tolist(),
+            effectiveBranching=self.effectiveBranching.tolist(),
+            nodes=self.nodes.tolist(),
+            backtracks=self.backtracks.tolist(),
+            backtrackShares=self.backtrackShares.tolist(),
+            lengthsByBorderColors=self.lengthsByBorderColors.tolist(),
+        )
+
+
+def analyzeChunk(n, seed, start, stop):
+    """
+    Solve the puzzles [start] to [stop] of a population with AStarSolver and
+    return their statistics
+
+    :n: number of lines of the boards
+    :seed: seed of the population
+    :start: index of the first puzzle
+    :stop: index after the last puzzle
+    :return: a DifficultyStatistics
+    """
+    board = Board(COLORS, n)
+    board.verbose = False
+    grid = board.grid
+    borderCases = np.count_nonzero(grid.neighbors >= 0, axis=1) <= 2
+    statistics = DifficultyStatistics(n)
+    for index in range(start, stop):
+        board.reset(puzzleRng(seed, index))
+        borderColors = int(np.count_nonzero(borderCases[grid.cells != 0]))
+        solver = AStarSolver(board)
+        solution = solver.solve()
+        if solution is None:
+            statistics.unsolved += 1
+            continue
+
+        # The solution is played to count the legal moves and the backtracks
+        legalMoves = backtracks = 0
+        previous = None
+        for direction in solution:
+            legalMoves += sum(1 for _ in board.legalMoves())
+            position = board.playerPosition
+            board.move(direction)
+            backtracks += board.playerPosition == previous
+            previous = position
+        statistics.add(
+            index,
+            len(solution),
+            legalMoves,
+            solver.nodesExpanded,
+            backtracks,
+            borderColors,
+        )
+    return statistics
+
+
+def analyze(n, puzzles, seed=0, chunkSize=1000, workers=None):
+    """
+    Solve [puzzles] puzzles placed by Board.randomizeColorCases with a pool of
+    processes, the statistics of the chunks are merged as they come so that
+    the memory does not grow with the number of puzzles
+
+    :n: number of lines of the boards
+    :puzzles: number of puzzles
+    :seed: seed of the population
+    :chunkSize: number of puzzles solved by a task
+    :workers: number of processes (number of CPUs if None)
+    :return: a DifficultyStatistics
+    """
+    statistics = DifficultyStatistics(n)
+    workers = workers or os.cpu_count()
+    chunks = iter(range(0, puzzles, chunkSize))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # At most 2 tasks per process are pending
+        pending = set()
+        while True:
+            for start in chunks:
+                stop = min(start + chunkSize, puzzles)
+                pending.add(executor.submit(analyzeChunk, n, seed, start, stop))
+                if len(pending) >= 2 * workers:
+                    break
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                statistics += future.result()
+    return statistics
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(
+        description="Difficulty of seeded populations of random puzzles"
+    )
+    parser.add_argument("lines", type=int, nargs="+")
+    parser.add_argument("--puzzles", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", default=None)
+    arguments = parser.parse_args()
+
+    rows = []
+    results = []
+    for n in arguments.lines:
+        startTime = time.perf_counter()
+        statistics = analyze(
+            n, arguments.puzzles, arguments.seed, arguments.chunk, arguments.workers
+        )
+        elapsed = time.perf_counter() - startTime
+        rows.append(
+            dict(statistics.summary(), puzzlesPerSecond=statistics.puzzles / elapsed)
+        )
+        results.append(statistics)
+
+    # Distribution of the lengths of each size (share of the puzzles by bins
+    # of 4 moves)
+    for statistics in results:
+        print("lines %d, optimal solution lengths:" % statistics.n)
+        lengths = statistics.lengths
+        total = max(lengths.sum(), 1)
+        for start in range(0, statistics.hardest[0] + 1, 4):
+            share = lengths[start : start + 4].sum() / total
+            print(
+                "  %3d-%-3d %6.2f%% %s"
+                % (start, start + 3, 100 * share, "#" * round(60 * share))
+            )
+        print("  color cases on the border: mean length")
+        for count, row in enumerate(statistics.lengthsByBorderColors):
+            if row.sum():
+                print(
+                    "  %d: %5.1f (%.1f%% of the puzzles)"
+                    % (
+                        count,
+                        statistics.mean(row, np.arange(LENGTH_BINS)),
+                        100 * row.sum() / total,
+                    )
+                )
+        # Share of the moves of the solutions spent in dead ends (bins of 5%)
+        print("  share of backtracking moves:")
+        shares = statistics.backtrackShares
+        for start in range(0, SHARE_BINS + 1, 5):
+            share = shares[start : start + 5].sum() / max(shares.sum(), 1)
+            print(
+                "  %3d-%3d%% %6.2f%% %s"
+                % (
+                    start,
+                    min(start + 4, SHARE_BINS),
+                    100 * share,
+                    "#" * round(60 * share),
+                )
+            )
+
+    columns = [
+        ("lines", "%5d"),
+        ("puzzles", "%8d"),
+        ("unsolved", "%8d"),
+        ("meanLength", "%10.1f"),
+        ("p10", "%4d"),
+        ("p50", "%4d"),
+        ("p90", "%4d"),
+        ("p99", "%4d"),
+        ("maxLength", "%9d"),
+        ("branching", "%9.2f"),
+        ("effectiveBranching", "%18.2f"),
+        ("medianNodes", "%11d"),
+        ("meanBacktracks", "%14.2f"),
+        ("backtrackShareP50", "%17.2f"),
+        ("backtrackShareP90", "%17.2f"),
+        ("backtrackShareP99", "%17.2f"),
+        ("puzzlesPerSecond", "%16.1f"),
+    ]
+    print(" ".join(name for name, _ in columns))
+    for row in rows:
+        print(" ".join(pattern % row[name] for name, pattern in columns))
+
+    if arguments.output is not None:
+        with open(arguments.output, "w") as file:
+            json.dump([statistics.toDict() for statistics in results], file)
@@ -0,0 +1,139 @@
+import numpy as np
+
+from grid import TetraGrid
+from coloredPiece import FACE_BITS, FACE_MASK, FACES, ROLL_TABLES
+
+# ROLLS[directionCode, packedFaces] is the packed faces after the roll
+ROLLS = np.stack([np.frombuffer(table, dtype=np.uint16) for table in ROLL_TABLES])
+
+# One bit per face, used to check that every face is colored
+FACES_LOW_BITS = sum(1 << (FACE_BITS * k) for k in range(len(FACES)))
+
+
+class BatchEnvironment:
+    """
+    Python Class representing [size] boards of the Tetahedron game stepped
+    in lockstep with numpy (tetra mode only)
+
+    The boards are stored as stacked arrays:
+    - cells: (size, number of cases) int8 color of each case indexed by the
+      case ids of TetraGrid (same layout as TetraGrid.cells, the case under
+      the piece holds its color)
+    - playerCells: (size,) case id of the piece of each board
+    - faces: (size,) uint16 packed faces of each piece (same packing as
+      ColoredTetahedron.packedFaces)
+    """
+
+    def __init__(self, n, size, seed=None):
+        """
+        Create [size] random boards with [n] lines ([n] must be even)
+
+        :n: number of lines of the grids
+        :size: number of boards
+        :seed: seed of the random generator used by reset
+        """
+        self.grid = TetraGrid(n)
+        self.size = size
+        self.neighbors = self.grid.neighbors
+        self.casesNumber = len(self.grid.validIndices)
+        self.startCell = self.grid.cellIds[1, n - 1]  # same as Board
+
+        # Case ids of each connected component without the starting case
+        self.componentCells = [
+            cells[cells != self.startCell] for cells in self.grid.componentCells
+        ]
+
+        self.boardIndices = np.arange(size)
+        self.cells = np.zeros((size, self.casesNumber), dtype=np.int8)
+        self.playerCells = np.zeros(size, dtype=np.int32)
+        self.faces = np.zeros(size, dtype=np.uint16)
+        self.reset(seed)
+
+    def reset(self, seed=None):
+        """
+        Place the piece at its starting case and one color per connected
+        component on every board (like Board.randomizeColorCases)
+
+        :seed: seed of the random generator
+        :return: nothing
+        """
+        rng = np.random.default_rng(seed)
+        self.cells[:] = 0
+        self.playerCells[:] = self.startCell
+        self.faces[:] = 0
+        # Random assignment of the colors 1 to 4 to the components
+        colors = np.argsort(rng.random((self.size, 4)), axis=1).astype(np.int8) + 1
+        for k, cells in enumerate(self.componentCells):
+            selection = cells[rng.integers(0, len(cells), self.size)]
+            self.cells[self.boardIndices, selection] = colors[:, k]
+
+    def loadBoards(self, boards):
+        """
+        Copy the states of Board objects in the first boards of the batch
+
+        :boards: list of Board (with the same number of lines)
+        :return: nothing
+        """
+        for index, board in enumerate(boards):
+            self.cells[index] = board.grid.cells
+            self.playerCells[index] = self.grid.cellIds[board.playerPosition]
+            self.faces[index] = board.playerPiece.packedFaces
+
+    def isValidMove(self, actions):
+        """
+        Return for each board if the piece can move toward its action
+
+        :actions: (size,) array of direction codes
+        :return: (size,) array of booleans
+        """
+        return self.neighbors[self.playerCells, actions] >= 0
+
+    def checkWin(self):
+        """
+        Return for each board if all the faces of the piece are colored
+
+        :return: (size,) array of booleans
+        """
+        faces = self.faces
+        colored = (faces | faces >> 1 | faces >> 2 | faces >> 3) & FACES_LOW_BITS
+        return colored == FACES_LOW_BITS
+
+    def step(self, actions):
+        """
+        Apply one move per board (the boards whose move is not valid are left
+        unchanged), with the same rules as Board.move
+
+        :actions: (size,) array of direction codes
+        :return: (size,) booleans of the valid moves, (size,) float32 rewards
+        (1 for the boards won by this move) and (size,) booleans of the won
+        boards
+        """
+        wasWon = self.checkWin()
+        destinations = self.neighbors[self.playerCells, actions]
+        valid = destinations >= 0
+        moved = self.boardIndices[valid]
+        destinations = destinations[valid]
+
+        # The face landing on the destination exchanges its color with it
+        destColors = self.cells[moved, destinations].astype(np.uint16)
+        rolled = ROLLS[actions[valid], self.faces[moved]]
+        self.cells[moved, destinations] = rolled & FACE_MASK
+        self.faces[moved] = (rolled & ~np.uint16(FACE_MASK)) | destColors
+        self.playerCells[moved] = destinations
+
+        won = self.checkWin()
+        rewards = (won & ~wasWon).astype(np.float32)
+        return valid, rewards, won
+
+
+if __name__ == "__main__":
+    import time
+
+    environment = BatchEnvironment(8, 100000, seed=0)
+    rng = np.random.default_rng(0)
+    steps = 100
+    startTime = time.perf_counter()
+    for _ in range(steps):
+        environment.step(rng.integers(0, 4, environment.size))
+    elapsed = time.perf_counter() - startTime
+    print(round(steps * environment.size / elapsed), "moves/s")
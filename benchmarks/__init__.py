@@ -0,0 +1,8 @@
+"""
+Benchmarks of the throughput of the game engine, the puzzle generation, the
+solvers and the renderer
+
+Run them from the root of the repository:
+    python -m benchmarks run --output results.json
+    python -m benchmarks compare baseline.json results.json
+"""
@@ -0,0 +1,46 @@
+import argparse
+import json
+import sys
+
+from benchmarks.cases import BENCHMARKS
+from benchmarks.runner import compareResults, runBenchmarks
+
+parser = argparse.ArgumentParser(
+    prog="python -m benchmarks", description="Run or compare the benchmarks"
+)
+commands = parser.add_subparsers(dest="command", required=True)
+run = commands.add_parser("run", help="run the benchmarks")
+run.add_argument("--output", help="JSON file of the results")
+run.add_argument("--only", nargs="+", choices=list(BENCHMARKS))
+run.add_argument("--quick", action="store_true", help="smaller benchmarks")
+compare = commands.add_parser("compare", help="flag the regressions")
+compare.add_argument("baseline", help="JSON file of the reference results")
+compare.add_argument("current", help="JSON file of the new results")
+compare.add_argument("--tolerance", type=float, default=0.1)
+arguments = parser.parse_args()
+
+if arguments.command == "run":
+    results = runBenchmarks(arguments.only, quick=arguments.quick)
+    for name, metrics in results["results"].items():
+        for metricName, measure in metrics.items():
+            print(
+                "%-40s %14.6g %s"
+                % (name + "." + metricName, measure["value"], measure["unit"])
+            )
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(results, file, indent=2)
+else:
+    with open(arguments.baseline) as file:
+        baseline = json.load(file)
+    with open(arguments.current) as file:
+        current = json.load(file)
+    rows = compareResults(baseline, current, tolerance=arguments.tolerance)
+    for name, metricName, reference, value, change, status in rows:
+        print(
+            "%-40s %12.6g -> %12.6g %+7.1f%% %s"
+            % (name + "." + metricName, reference, value, 100 * change, status)
+        )
+    regressions = sum(row[-1] == "regression" for row in rows)
+    print(regressions, "regression(s)")
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,243 @@
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import grid as gridModule
+from board import Board
+from grid import DIRECTIONS, TetraGrid
+from solver import AStarSolver, BFSSolver
+
+# Default case color first (only the number of colors matters without display)
+COLORS = ["white", "black", "red", "green", "blue"]
+
+# Registered benchmarks in their order of execution (see benchmark)
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """
+    Decorator registering a benchmark function under [name], the function
+    takes the quick flag and returns a dictionary {metric name: metric} where
+    a metric is built by metric()
+
+    :name: name of the benchmark
+    :return: the decorator
+    """
+
+    def register(function):
+        BENCHMARKS[name] = function
+        return function
+
+    return register
+
+
+def metric(value, unit, better="higher"):
+    """
+    Return a metric of a benchmark
+
+    :value: measured value
+    :unit: unit of the value
+    :better: "higher" or "lower", the direction of an improvement
+    :return: dictionary
+    """
+    return {"value": value, "unit": unit, "better": better}
+
+
+def rate(function, minTime=0.2, rounds=3):
+    """
+    Return the best number of calls per second of [function] over [rounds]
+    rounds of at least [minTime] seconds each
+
+    :function: function without argument
+    :minTime: minimal duration of a round
+    :rounds: number of rounds
+    :return: calls per second
+    """
+    best = 0.0
+    for _ in range(rounds):
+        calls = 0
+        startTime = time.perf_counter()
+        elapsed = 0.0
+        while elapsed < minTime:
+            function()
+            calls += 1
+            elapsed = time.perf_counter() - startTime
+        best = max(best, calls / elapsed)
+    return best
+
+
+def newBoard(n=8, seed=0):
+    """
+    Return a silent Board of [n] lines with color cases drawn with [seed]
+
+    :n: number of lines
+    :seed: seed of the color cases
+    :return: a Board
+    """
+    board = Board(COLORS, n)
+    board.verbose = False
+    board.reset(np.random.default_rng(seed))
+    return board
+
+
+@benchmark("board")
+def benchmarkBoard(quick):
+    """
+    Throughput of Board.move and Board.isValidMove on random valid moves
+    """
+    board = newBoard()
+    rng = np.random.default_rng(0)
+    directions = [DIRECTIONS[d] for d in rng.integers(0, 4, 4096)]
+    moves = 1024
+
+    def play():
+        played = 0
+        for direction in directions:
+            if board.isValidMove(direction):
+                board.move(direction)
+                played += 1
+                if played == moves:
+                    return
+
+    def check():
+        for direction in directions:
+            board.isValidMove(direction)
+
+    return {
+        "move": metric(rate(play) * moves, "moves/s"),
+        "isValidMove": metric(rate(check) * len(directions), "calls/s"),
+    }
+
+
+@benchmark("grid")
+def benchmarkGrid(quick):
+    """
+    Construction time of TetraGrid for boards of 8 to 1000 lines, with the
+    geometry computed and (for the large boards) read from the cache on disk
+    """
+    sizes = [8, 32, 128] if quick else [8, 32, 128, 512, 1000]
+    results = {}
+
+    def construction(n, rounds):
+        best = float("inf")
+        for _ in range(rounds):
+            gridModule.geometries.clear()
+            startTime = time.perf_counter()
+            TetraGrid(n)
+            best = min(best, time.perf_counter() - startTime)
+        return metric(best, "s", better="lower")
+
+    cacheDirectory = gridModule.GEOMETRY_CACHE_DIRECTORY
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for n in sizes:
+                rounds = 3 if n <= 128 else 1
+                gridModule.GEOMETRY_CACHE_DIRECTORY = ""
+                results["construction-%d" % n] = construction(n, rounds)
+                if n >= gridModule.GEOMETRY_CACHE_MIN_LINES:
+                    gridModule.GEOMETRY_CACHE_DIRECTORY = directory
+                    construction(n, 1)  # writes the cache
+                    results["cached-construction-%d" % n] = construction(n, rounds)
+    finally:
+        gridModule.GEOMETRY_CACHE_DIRECTORY = cacheDirectory
+        gridModule.geometries.clear()
+    return results
+
+
+@benchmark("generator")
+def benchmarkGenerator(quick):
+    """
+    Number of color layouts placed per second with
+    TetraGrid.selectRandomCasesWithSolution
+    """
+    grid = TetraGrid(8)
+    rng = np.random.default_rng(0)
+
+    def select():
+        grid.selectRandomCasesWithSolution(wantedValue=0, rng=rng)
+
+    return {"selectRandomCasesWithSolution": metric(rate(select), "puzzles/s")}
+
+
+@benchmark("solver")
+def benchmarkSolver(quick):
+    """
+    Median time to solve and nodes expanded per second of the solvers on the
+    same boards
+    """
+    boards = [newBoard(seed=seed) for seed in range(5 if quick else 20)]
+    results = {}
+    for solverClass in (BFSSolver, AStarSolver):
+        times = []
+        nodes = 0
+        for board in boards:
+            solver = solverClass(board)
+            solver.solve()
+            times.append(solver.wallTime)
+            nodes += solver.nodesExpanded
+        name = solverClass.__name__
+        results[name + "-time"] = metric(float(np.median(times)), "s", "lower")
+        results[name + "-nodes"] = metric(nodes / sum(times), "nodes/s")
+    return results
+
+
+@benchmark("render")
+def benchmarkRender(quick):
+    """
+    Frame time of Game.render (full redraw and redraw after a move) with the
+    dummy video driver of SDL, on the default board and on a board of 128
+    lines seen through the camera
+    """
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import pygame
+
+    from main import Game
+
+    results = {}
+    for prefix, lineNumber in (("", None), ("large-", 128)):
+        game = Game(COLORS, lineNumber=lineNumber)
+        game.board.verbose = False
+
+        def fullFrame():
+            game.drawnCells = None
+            game.render()
+
+        def moveFrame():
+            direction = next(game.board.legalMoves())
+            game.board.move(direction)
+            game.render()
+
+        results[prefix + "full-frame"] = metric(
+            1 / rate(fullFrame), "s", better="lower"
+        )
+        results[prefix + "move-frame"] = metric(
+            1 / rate(moveFrame), "s", better="lower"
+        )
+    pygame.quit()
+    return results
+
+
+@benchmark("policy")
+def benchmarkPolicy(quick):
+    """
+    Decisions per second of the policy network (PolicyNetwork.chooseMoves,
+    random weights) for batches of 1 to 4096 boards
+    """
+    from batchEnvironment import BatchEnvironment
+    from policy import PolicyNetwork
+
+    network = PolicyNetwork.random(8, seed=0)
+    results = {}
+    for batchSize in (1, 64, 4096) if quick else (1, 16, 256, 4096):
+        environment = BatchEnvironment(8, batchSize, seed=0)
+        arrays = environment.cells, environment.playerCells, environment.faces
+
+        def decide():
+            network.chooseMoves(*arrays)
+
+        results["batch-%d" % batchSize] = metric(
+            batchSize * rate(decide), "decisions/s"
+        )
+    return results
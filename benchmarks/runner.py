@@ -0,0 +1,64 @@
+import platform
+import time
+
+import numpy as np
+
+from benchmarks.cases import BENCHMARKS
+
+
+def runBenchmarks(names=None, quick=False, log=print):
+    """
+    Run the benchmarks [names] (all of them if None)
+
+    :names: list of benchmark names (see cases.BENCHMARKS)
+    :quick: run smaller versions of the benchmarks
+    :log: function called with the progress messages
+    :return: dictionary {"meta": ..., "results": {benchmark: {metric: metric}}}
+    """
+    names = list(BENCHMARKS) if names is None else names
+    results = {}
+    for name in names:
+        startTime = time.perf_counter()
+        results[name] = BENCHMARKS[name](quick)
+        log("%s done in %.1f s" % (name, time.perf_counter() - startTime))
+    meta = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "quick": quick,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    return {"meta": meta, "results": results}
+
+
+def compareResults(baseline, current, tolerance=0.1):
+    """
+    Compare the metrics measured in both runs
+
+    :baseline: results of the reference run (see runBenchmarks)
+    :current: results of the new run
+    :tolerance: relative change below which a metric is considered unchanged
+    :return: list of (benchmark, metric, baseline value, current value,
+    relative change, status) where status is "regression", "improvement" or
+    "unchanged" (the metrics missing from a run are skipped)
+    """
+    rows = []
+    for name, metrics in current["results"].items():
+        for metricName, measure in metrics.items():
+            reference = baseline["results"].get(name, {}).get(metricName)
+            if reference is None or not reference["value"]:
+                continue
+            change = measure["value"] / reference["value"] - 1
+            # Positive gain means better, whatever the direction of the metric
+            gain = change if measure["better"] == "higher" else -change
+            if gain < -tolerance:
+                status = "regression"
+            elif gain > tolerance:
+                status = "improvement"
+            else:
+                status = "unchanged"
+            rows.append(
+                (name, metricName, reference["value"], measure["value"], change, status)
+            )
+    return rows
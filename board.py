@@ -1,4 +1,6 @@
-from grid import TetraGrid
+import numpy as np
+
+from grid import DIRECTIONS, TetraGrid
 from coloredPiece import ColoredTetahedron
 
 
@@ -40,24 +42,69 @@ class Board:
         self.numberOfColors = len(self.colors) - 1  # default color does not count
         self.outOfBoardCaseValue = -1
         self.defaultCaseValue = 0
-        self.underPlayerPieceCaseValue = 0
 
-        # Place the player on the grid
-        self.grid.changeValue(
-            self.playerPosition[0],
-            self.playerPosition[1],
-            0.5,  # special value to represent the player's piece on the board
-        )
+        # Print each move (disabled by headless users of the board)
+        self.verbose = True
+
+        # Undo entries of the moves played with push (see pop)
+        self.history = []
 
-        # Place the color cases on the grid where the board is free
+        # TrajectoryWriter recording the games (see recording.py)
+        self.recorder = None
+
+        # Place the color cases on the grid where the board is free (the case
+        # of the player's piece is kept uncolored)
         self.randomizeColorCases()
 
-    def randomizeColorCases(self):
+    @property
+    def underPlayerPieceCaseValue(self):
+        """
+        Color of the case under the player's piece (the grid keeps the value of
+        this case, the piece is not stored in the grid)
+        """
+        i, j = self.playerPosition
+        return self.grid.getValue(i, j)
+
+    @underPlayerPieceCaseValue.setter
+    def underPlayerPieceCaseValue(self, value):
+        i, j = self.playerPosition
+        self.grid.changeValue(i, j, value)
+
+    def reset(self, rng=None, colorCases=None, seed=None):
+        """
+        Put the board back in its initial state (uncolored piece at its
+        starting case) with new color cases, the grid is updated in place
+
+        :rng: numpy random Generator used to place the color cases (the
+        global numpy random state is used if None)
+        :colorCases: list of the (int,int) cases of the colors (in the order
+        of the colors, see placeColorCases) used instead of random cases
+        :seed: seed of the placement of the color cases, recorded with the
+        game if the board has a recorder (the Generator is created from it if
+        [rng] is None)
+        :return: nothing
+        """
+        if rng is None and seed is not None:
+            rng = np.random.default_rng(seed)
+        self.grid.cells[:] = self.defaultCaseValue
+        self.playerPiece = ColoredTetahedron(defaultColor=self.defaultCaseValue)
+        self.playerPosition = (1, self.grid.height - 1)
+        self.history.clear()
+        if colorCases is None:
+            self.randomizeColorCases(rng)
+        else:
+            self.placeColorCases(colorCases)
+        if self.recorder is not None:
+            self.recorder.begin(self, seed)
+
+    def randomizeColorCases(self, rng=None):
         """
         The color cases are randomly selected among the cases with value
         [defaultValue] and set to the possible colors (one for each color of
         the board except the default color)
 
+        :rng: numpy random Generator (the global numpy random state is used
+        if None)
         :return: nothing
         """
         #  (worked but does not always give a solution)
@@ -68,10 +115,24 @@ class Board:
 
         # Use connected components to find positions for the cases with a solution
         # for the game
-        randomSelection = self.grid.selectRandomCasesWithSolution(wantedValue=0)
-        assert len(self.colors) - 1 == len(randomSelection)
+        i, j = self.playerPosition
+        randomSelection = self.grid.selectRandomCasesWithSolution(
+            wantedValue=0, rng=rng, excluded=(self.grid.cellIdsTable[i][j],)
+        )
+        self.placeColorCases(randomSelection)
+
+    def placeColorCases(self, colorCases):
+        """
+        Set the cases [colorCases] to the possible colors (one for each color
+        of the board except the default color)
+
+        :colorCases: list of (int,int), the first case gets the first color
+        after the default one and so on
+        :return: nothing
+        """
+        assert len(self.colors) - 1 == len(colorCases)
         c = 1  # skip the default color by starting at position 1
-        for i, j in randomSelection:
+        for i, j in colorCases:
             self.grid.changeValue(i, j, c)
             c += 1
 
@@ -93,23 +154,74 @@ class Board:
         :direction: direction string (either left,right,up or down)
         :return: nothing
         """
-        print("move", direction)
+        if self.verbose:
+            print("move", direction)
         # 1. Compute destination position and color
         i, j = self.playerPosition
         destPosX, destPosY = self.grid.getDestinationPosition(i, j, direction)
-        destColor = self.grid.grid[destPosX, destPosY]
+        destId = self.grid.cellIdsTable[destPosX][destPosY]
+        destColor = self.grid.cells[destId]
 
         # 2. Update the player's piece according to the move
         changedColor = self.playerPiece.move(direction, destColor)
-        self.grid.changeValue(destPosX, destPosY, 0.5)
-
-        # 3. Update the case that was under the player's piece
-        self.grid.changeValue(i, j, self.underPlayerPieceCaseValue)
 
-        # 4. Keep in memory the new value of the case under the player's piece
-        self.underPlayerPieceCaseValue = changedColor
+        # 3. The destination case (now under the player's piece) takes the
+        # previous color of the face touching it
+        self.grid.cells[destId] = changedColor
 
         self.playerPosition = destPosX, destPosY
+        if self.recorder is not None:
+            self.recorder.recordMove(
+                self.grid.directionCode(direction), int(destColor), changedColor
+            )
+
+    def legalMoves(self):
+        """
+        Yield the directions toward which the player can move
+
+        :return: generator of direction strings
+        """
+        i, j = self.playerPosition
+        neighbors = self.grid.neighborsTable[self.grid.cellIdsTable[i][j]]
+        for code, direction in enumerate(DIRECTIONS):
+            if neighbors[code] >= 0:
+                yield direction
+
+    def push(self, direction="left"):
+        """
+        Play the move toward [direction] (supposed valid) and remember how to
+        undo it (see pop), so a search can explore the moves on a single board
+
+        :direction: direction string (either left,right,up or down) or its
+        integer code
+        :return: nothing
+        """
+        i, j = self.grid.getDestinationPosition(*self.playerPosition, direction)
+        self.history.append(
+            (
+                self.playerPosition,
+                self.grid.getValue(i, j),
+                self.playerPiece.packedFaces,
+                self.playerPiece.coloredMask,
+            )
+        )
+        self.move(direction)
+
+    def pop(self):
+        """
+        Undo the last move played with push, the board gets back exactly its
+        previous state
+
+        :return: nothing
+        """
+        position, destColor, packedFaces, coloredMask = self.history.pop()
+        self.grid.changeValue(self.playerPosition[0], self.playerPosition[1], destColor)
+        self.playerPosition = position
+        self.playerPiece.packedFaces = packedFaces
+        self.playerPiece.coloredMask = coloredMask
+        # After the undo so that an empty history leaves the recording intact
+        if self.recorder is not None:
+            self.recorder.undoMove()
 
     def checkWin(self):
         """
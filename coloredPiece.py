@@ -1,4 +1,68 @@
 import abc  # Module for abstract classes in OOP
+import array
+from collections.abc import Mapping
+
+import numpy as np
+
+from grid import DIRECTION_CODES
+
+# Order of the faces in the packed state of a ColoredTetahedron, each face
+# color is stored on FACE_BITS bits
+FACES = ["board", "left", "right", "other"]
+FACE_INDICES = {face: index for index, face in enumerate(FACES)}
+FACE_BITS = 4
+FACE_MASK = (1 << FACE_BITS) - 1
+FULLY_COLORED_MASK = (1 << len(FACES)) - 1
+
+# ROLL_SOURCES[directionCode][k] is the index of the face that becomes the
+# face FACES[k] when the tetahedron rolls toward the direction
+ROLL_SOURCES = [
+    [1, 3, 0, 2],  # left
+    [2, 0, 3, 1],  # right
+    [3, 1, 2, 0],  # up
+    [3, 1, 2, 0],  # down
+]
+
+
+def buildRollTable(sources):
+    """
+    Return the lookup table applying the permutation [sources] to every
+    possible packed faces value (rolled = table[packed])
+
+    :sources: list of the source face index of each face
+    :return: array of uint16 indexed by the packed faces
+    """
+    packed = np.arange(1 << (FACE_BITS * len(FACES)), dtype=np.uint32)
+    rolled = np.zeros_like(packed)
+    for target, source in enumerate(sources):
+        color = (packed >> (FACE_BITS * source)) & FACE_MASK
+        rolled |= color << (FACE_BITS * target)
+    return array.array("H", rolled.astype(np.uint16).tobytes())
+
+
+def buildMaskRollTable(sources):
+    """
+    Return the lookup table applying the permutation [sources] to a mask
+    with one bit per face
+
+    :sources: list of the source face index of each face
+    :return: list of 16 int
+    """
+    return [
+        sum(((mask >> source) & 1) << target for target, source in enumerate(sources))
+        for mask in range(1 << len(FACES))
+    ]
+
+
+ROLL_TABLES = [buildRollTable(sources) for sources in ROLL_SOURCES]
+MASK_ROLL_TABLES = [buildMaskRollTable(sources) for sources in ROLL_SOURCES]
+
+# Tables of each direction by direction string and by direction code
+ROLLS = {
+    key: (ROLL_TABLES[code], MASK_ROLL_TABLES[code])
+    for direction, code in DIRECTION_CODES.items()
+    for key in (direction, code)
+}
 
 
 class AbstractColoredPiece(abc.ABC):
@@ -43,6 +107,34 @@ class AbstractColoredPiece(abc.ABC):
         return self.defaultColor not in self.faces.values()
 
 
+class FacesView(Mapping):
+    """
+    Read-only dictionary view {face name: color} over the packed faces of a
+    ColoredTetahedron
+    """
+
+    def __init__(self, piece):
+        """
+        Creation of the view
+
+        :piece: the ColoredTetahedron whose faces are viewed
+        """
+        self.piece = piece
+
+    def __getitem__(self, face):
+        shift = FACE_BITS * FACE_INDICES[face]
+        return (self.piece.packedFaces >> shift) & FACE_MASK
+
+    def __iter__(self):
+        return iter(FACES)
+
+    def __len__(self):
+        return len(FACES)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
 class ColoredTetahedron(AbstractColoredPiece):
     """
     Python Class to represent a colored Tetahedron
@@ -54,10 +146,16 @@ class ColoredTetahedron(AbstractColoredPiece):
     "right" the face oriented to the right,
     "board" the face of the tetahedron that touches the board,
     and "other" the remaining face.
+
+    The colors of the faces are packed in a single integer (FACE_BITS bits
+    per face in the order of FACES) and a roll is applied with the lookup
+    tables ROLL_TABLES. A mask with one bit per colored face is kept up to
+    date so that the win check is a single comparison.
     """
 
     defaultColor = None
-    faces = None
+    packedFaces = None
+    coloredMask = None
 
     def __init__(self, defaultColor=0):
         """
@@ -66,13 +164,33 @@ class ColoredTetahedron(AbstractColoredPiece):
 
         :defaultColor: the color value that the player wants to get rid of
         """
+        assert 0 <= defaultColor <= FACE_MASK
         self.defaultColor = defaultColor
-        self.faces = {
-            "board": self.defaultColor,  # color of the face touching the board
-            "left": self.defaultColor,  # color of the face oriented to left
-            "right": self.defaultColor,  # color of the face oriented to right
-            "other": self.defaultColor,  # color of the remaining face
-        }
+        self.packedFaces = 0
+        for index in range(len(FACES)):
+            self.packedFaces |= self.defaultColor << (FACE_BITS * index)
+        self.coloredMask = 0
+        self._facesView = FacesView(self)
+
+    @property
+    def faces(self):
+        """
+        Read-only dictionary view of the colors of the faces
+        """
+        return self._facesView
+
+    def setPackedFaces(self, packedFaces):
+        """
+        Set the colors of all the faces at once
+
+        :packedFaces: colors of the faces packed like packedFaces
+        :return: nothing
+        """
+        self.packedFaces = int(packedFaces)
+        self.coloredMask = 0
+        for index in range(len(FACES)):
+            color = (self.packedFaces >> (FACE_BITS * index)) & FACE_MASK
+            self.coloredMask |= (color != self.defaultColor) << index
 
     def move(self, direction, colorOfDestination):
         """
@@ -80,37 +198,36 @@ class ColoredTetahedron(AbstractColoredPiece):
         destination case (because when the Tetahedron touches the board it
         changes its color with the corresponding case)
 
-        :direction: the direction string (either left, right, up or down)
+        :direction: the direction string (either left, right, up or down) or
+        its integer code
         :colorOfDestination: the color value (integer) of the destination case
-        :return: nothing
+        :return: the previous color of the face now touching the board
         """
-        left, right, board, other = (
-            self.faces["left"],
-            self.faces["right"],
-            self.faces["board"],
-            self.faces["other"],
+        try:
+            rollTable, maskRollTable = ROLLS[direction]
+        except KeyError:
+            raise ValueError("Direction not valid")
+
+        # rotate the tetahedron, the face previously oriented towards the
+        # direction becomes the board face
+        rolled = rollTable[self.packedFaces]
+
+        # The board face takes the destination color and the previous color
+        # of this face is returned
+        colorOfDestination = int(colorOfDestination)
+        self.packedFaces = (rolled & ~FACE_MASK) | colorOfDestination
+        self.coloredMask = (maskRollTable[self.coloredMask] & ~1) | (
+            colorOfDestination != self.defaultColor
         )
+        return rolled & FACE_MASK
 
-        # The board face takes the destination color
-        self.faces["board"] = colorOfDestination
-
-        # rotate the tetahedron and return the value of the color that was
-        # previously oriented towards the direction
-        if direction == "left":
-            self.faces["left"] = other
-            self.faces["right"] = board
-            self.faces["other"] = right
-            return left
-        elif direction == "right":
-            self.faces["left"] = board
-            self.faces["right"] = other
-            self.faces["other"] = left
-            return right
-        elif direction == "up" or direction == "down":
-            self.faces["other"] = board
-            return other
-        else:
-            raise ValueError("Direction not valid")
+    def isFullyColored(self):
+        """
+        Return True if all its faces are different from the default color
+
+        :return: a boolean
+        """
+        return self.coloredMask == FULLY_COLORED_MASK
 
 
 if __name__ == "__main__":
@@ -0,0 +1,469 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from grid import DIRECTIONS, TetraGrid
+from solver import AbstractSolver
+
+# Distance of the states from which the game cannot be won
+UNKNOWN = 255
+
+# Directory of the tables at their default path (see databasePath), the same
+# whatever the working directory
+DATABASE_DIRECTORY = os.environ.get(
+    "TETAHEDRON_DATABASES",
+    os.path.join(os.path.expanduser("~"), ".cache", "tetahedronAI"),
+)
+
+
+def databasePath(n):
+    """
+    Return the default path of the database of the boards of [n] lines (in
+    DATABASE_DIRECTORY)
+
+    :n: number of lines of the boards
+    :return: string
+    """
+    return os.path.join(DATABASE_DIRECTORY, "distances-%d.bin" % n)
+
+
+def openDatabase(n, path=None):
+    """
+    Return the database of the boards of [n] lines if its table is complete
+
+    :n: number of lines of the boards
+    :path: path of the table (see databasePath if None)
+    :return: a DistanceDatabase or None if the table is missing or its build
+    is not finished
+    """
+    database = DistanceDatabase(n, path)
+    return database if database.isComplete() else None
+
+
+class DistanceDatabase:
+    """
+    Python Class giving the minimal number of moves to win from every state of
+    the boards of [n] lines, read from a uint8 table on disk
+
+    The states are the ones of StateEncoder. The index of a state in the table
+    is a perfect hash: the case id of the piece and the rank of the field of
+    each component (rank of the case in TetraGrid.componentCells, or the size
+    of the component if the color is on the piece) written in mixed radix.
+    The table is memory-mapped the first time it is read so opening a
+    database costs nothing, and a lookup is a single read. A table whose
+    build is not finished (see DatabaseBuilder) is refused, its unknown
+    distances would be read as states from which the game cannot be won.
+    """
+
+    def __init__(self, n, path=None):
+        """
+        Open the database of the boards of [n] lines
+
+        :n: number of lines of the boards
+        :path: path of the table (see databasePath if None)
+        """
+        self.n = n
+        self.path = databasePath(n) if path is None else path
+        self.grid = TetraGrid(n)
+        self.casesNumber = len(self.grid.validIndices)
+
+        # Radix of each field: the cases of the component and the piece
+        self.sizes = [len(cells) for cells in self.grid.componentCells]
+        self.radixes = [size + 1 for size in self.sizes]
+        self.strides = [1] * 4
+        for k in range(2, -1, -1):
+            self.strides[k] = self.strides[k + 1] * self.radixes[k + 1]
+        self.playerStride = self.strides[0] * self.radixes[0]
+        self.statesNumber = self.casesNumber * self.playerStride
+
+        # Rank of each case in the bucket of its component
+        self.caseRanks = np.zeros(self.casesNumber, dtype=np.int64)
+        for cells in self.grid.componentCells:
+            self.caseRanks[cells] = np.arange(len(cells))
+        self.caseRanksTable = self.caseRanks.tolist()
+        self.cellComponents = self.grid.cellComponents.astype(np.int64) - 1
+        self._table = None
+
+    def isComplete(self):
+        """
+        Return if the build of the table is finished (its progress file is
+        written by DatabaseBuilder) and the table has the size of the states
+        (not truncated nor replaced since)
+
+        :return: a boolean
+        """
+        try:
+            with open(self.path + ".json") as file:
+                complete = bool(json.load(file)["complete"])
+            return complete and os.path.getsize(self.path) == self.statesNumber
+        except FileNotFoundError:
+            return False
+
+    @property
+    def table(self):
+        """
+        uint8 distances indexed by the index of the states (memory-mapped on
+        first use, ValueError if the build of the table is not finished)
+        """
+        if self._table is None:
+            if not self.isComplete():
+                raise ValueError(
+                    "%s is not a complete database (python database.py build %d)"
+                    % (self.path, self.n)
+                )
+            self._table = np.memmap(
+                self.path, dtype=np.uint8, mode="r", shape=(self.statesNumber,)
+            )
+        return self._table
+
+    def index(self, encoder, state):
+        """
+        Return the index of [state] in the table
+
+        :encoder: the StateEncoder of [state] (for a board of [n] lines)
+        :state: a packed state
+        :return: an integer
+        """
+        mask, pieceCode = encoder.mask, encoder.pieceCode
+        index = (state & mask) * self.playerStride
+        for k in range(4):
+            field = (state >> encoder.shifts[k + 1]) & mask
+            rank = self.sizes[k] if field == pieceCode else self.caseRanksTable[field]
+            index += rank * self.strides[k]
+        return index
+
+    def decodeIndices(self, indices):
+        """
+        Return the case ids of the pieces and the ranks of the fields of an
+        array of indices
+
+        :indices: array of indices
+        :return: array of case ids, (len(indices), 4) array of ranks
+        """
+        players, rest = np.divmod(indices, self.playerStride)
+        ranks = np.empty((len(indices), 4), dtype=np.int64)
+        for k in range(4):
+            ranks[:, k], rest = np.divmod(rest, self.strides[k])
+        return players, ranks
+
+    def encodeIndices(self, players, ranks):
+        """
+        Return the indices of the states given by the case ids of the pieces
+        and the ranks of the fields (see decodeIndices)
+
+        :players: array of case ids
+        :ranks: (len(players), 4) array of ranks
+        :return: array of indices
+        """
+        return players * self.playerStride + ranks @ np.array(self.strides)
+
+    def layoutDistances(self, playerCell, layouts):
+        """
+        Return the distances of the states where the uncolored piece stands on
+        [playerCell] and the colors are on the cases of [layouts] (the colors
+        do not change the distance, only their cases)
+
+        :playerCell: case id of the piece
+        :layouts: (count, 4) array of case ids, one in each component (see
+        PuzzleGenerator.sampleLayouts)
+        :return: (count,) uint8 array of distances (UNKNOWN if the game
+        cannot be won)
+        """
+        strides = np.array(self.strides)[self.cellComponents[layouts]]
+        ranks = self.caseRanks[layouts]
+        return self.table[playerCell * self.playerStride + (ranks * strides).sum(1)]
+
+    def distance(self, encoder, state):
+        """
+        Return the minimal number of moves to win from [state]
+
+        :encoder: the StateEncoder of [state]
+        :state: a packed state
+        :return: an integer or None if the game cannot be won from [state]
+        """
+        distance = int(self.table[self.index(encoder, state)])
+        return None if distance == UNKNOWN else distance
+
+    def bestMove(self, encoder, state):
+        """
+        Return an optimal move from [state]
+
+        :encoder: the StateEncoder of [state]
+        :state: a packed state
+        :return: a direction code or None if [state] is won or cannot be won
+        """
+        distance = self.distance(encoder, state)
+        if not distance:
+            return None
+        for d, nextState in encoder.successors(state):
+            if self.table[self.index(encoder, nextState)] == distance - 1:
+                return d
+
+    def solution(self, encoder, state):
+        """
+        Return a shortest list of moves from [state] to a win
+
+        :encoder: the StateEncoder of [state]
+        :state: a packed state
+        :return: list of direction codes or None if the game cannot be won
+        """
+        if self.distance(encoder, state) is None:
+            return None
+        path = []
+        move = self.bestMove(encoder, state)
+        while move is not None:
+            path.append(move)
+            state = encoder.nextState(state, move)
+            move = self.bestMove(encoder, state)
+        return path
+
+
+def expandLayer(n, path, distance, start, stop):
+    """
+    Give the distance [distance] + 1 to the unknown predecessors of the states
+    at [distance] whose index is in [start, stop) (the processes expanding the
+    other ranges only write the same value so they can share the table)
+
+    :n: number of lines of the boards
+    :path: path of the table
+    :distance: distance of the layer to expand
+    :start: first index of the range
+    :stop: index after the range
+    :return: nothing
+    """
+    database = DistanceDatabase(n, path)
+    table = np.memmap(path, dtype=np.uint8, mode="r+", shape=(database.statesNumber,))
+    neighbors = database.grid.neighbors
+    sizes = np.array(database.sizes)
+    for chunk in range(start, stop, 1 << 22):
+        frontier = np.flatnonzero(
+            table[chunk : min(stop, chunk + (1 << 22))] == distance
+        )
+        if not len(frontier):
+            continue
+        players, ranks = database.decodeIndices(frontier + chunk)
+
+        # Undo the exchange of colors between the landing face and the case of
+        # the piece (the exchange is its own inverse, see
+        # StateEncoder.predecessors)
+        components = database.cellComponents[players]
+        rows = np.arange(len(players))
+        field = ranks[rows, components]
+        playerRanks = database.caseRanks[players]
+        size = sizes[components]
+        ranks[rows, components] = np.where(
+            field == playerRanks,
+            size,
+            np.where(field == size, playerRanks, field),
+        )
+        partial = ranks @ np.array(database.strides)
+
+        # The piece comes from one of the neighbors of its case
+        for d in range(4):
+            origins = neighbors[players, d]
+            valid = origins >= 0
+            predecessors = origins[valid] * database.playerStride + partial[valid]
+            predecessors = predecessors[table[predecessors] == UNKNOWN]
+            table[predecessors] = distance + 1
+    table.flush()
+
+
+class DatabaseBuilder:
+    """
+    Python Class building a DistanceDatabase by retrograde analysis: a
+    breadth-first search from the winning states run backward, one layer of
+    distance at a time, with the ranges of the table expanded by a pool of
+    processes
+
+    The progress is saved in a JSON file next to the table after each layer,
+    an interrupted build is resumed from the last complete layer.
+    """
+
+    def __init__(self, n, path=None):
+        """
+        Prepare the build of the database of the boards of [n] lines
+
+        :n: number of lines of the boards
+        :path: path of the table (see databasePath if None)
+        """
+        self.database = DistanceDatabase(n, path)
+        self.path = self.database.path
+        self.progressPath = self.path + ".json"
+        if os.path.exists(self.progressPath):
+            with open(self.progressPath) as file:
+                self.progress = json.load(file)
+        else:
+            self.progress = {"lines": n, "layers": [], "complete": False}
+
+    def saveProgress(self):
+        """
+        Write the progress atomically
+
+        :return: nothing
+        """
+        temporaryPath = self.progressPath + ".tmp"
+        with open(temporaryPath, "w") as file:
+            json.dump(self.progress, file)
+        os.replace(temporaryPath, self.progressPath)
+
+    def initialize(self):
+        """
+        Create the table with the winning states (all the colors on the piece)
+        at distance 0 and every other state unknown
+
+        :return: nothing
+        """
+        database = self.database
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        table = np.memmap(
+            self.path, dtype=np.uint8, mode="w+", shape=(database.statesNumber,)
+        )
+        table[:] = UNKNOWN
+        players = np.arange(database.casesNumber)
+        ranks = np.tile(database.sizes, (database.casesNumber, 1))
+        table[database.encodeIndices(players, ranks)] = 0
+        table.flush()
+        self.progress["layers"] = [database.casesNumber]
+        self.saveProgress()
+
+    def build(self, workers=None):
+        """
+        Build (or resume the build of) the table
+
+        :workers: number of processes (number of CPUs if None)
+        :return: list of the number of states at each distance
+        """
+        if not self.progress["layers"]:
+            self.initialize()
+        statesNumber = self.database.statesNumber
+        workers = workers or os.cpu_count()
+        bounds = np.linspace(0, statesNumber, 4 * workers + 1).astype(np.int64)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            while not self.progress["complete"]:
+                distance = len(self.progress["layers"]) - 1
+                if distance + 1 >= UNKNOWN:
+                    raise ValueError("Distances do not fit in the uint8 table")
+                futures = [
+                    executor.submit(
+                        expandLayer,
+                        self.database.n,
+                        self.path,
+                        distance,
+                        int(start),
+                        int(stop),
+                    )
+                    for start, stop in zip(bounds[:-1], bounds[1:])
+                ]
+                for future in futures:
+                    future.result()
+                table = np.memmap(
+                    self.path, dtype=np.uint8, mode="r", shape=(statesNumber,)
+                )
+                count = int(np.count_nonzero(table == distance + 1))
+                del table
+                if count:
+                    self.progress["layers"].append(count)
+                else:
+                    self.progress["complete"] = True
+                self.saveProgress()
+        return self.progress["layers"]
+
+
+class DatabaseSolver(AbstractSolver):
+    """
+    Python Class finding a shortest winning sequence of moves for a Board by
+    following the distances of a DistanceDatabase (one lookup per move)
+    """
+
+    def __init__(self, board, maxLength=None, table=None, database=None):
+        """
+        Creation of the solver
+
+        :board: the Board to solve (it is not modified by the solver)
+        :maxLength: the solutions longer than [maxLength] moves are not
+        returned (no limit if None)
+        :table: optional TranspositionTable (see AbstractSolver)
+        :database: the DistanceDatabase of the boards of the same number of
+        lines (the one at the default path if None)
+        """
+        super().__init__(board, maxLength=maxLength, table=table)
+        if database is None:
+            database = DistanceDatabase(board.grid.height)
+        self.database = database
+
+    def search(self, start):
+        """
+        Return a shortest list of moves from [start] to a winning state
+
+        :start: packed state which is not a winning state
+        :return: list of direction strings or None if there is no solution
+        (of at most maxLength moves)
+        """
+        distance = self.database.distance(self.encoder, start)
+        if distance is None or (
+            self.maxLength is not None and distance > self.maxLength
+        ):
+            return None
+        path = self.database.solution(self.encoder, start)
+        self.nodesExpanded = len(path)
+        return [DIRECTIONS[d] for d in path]
+
+
+def verify(n, path=None, samples=200, seed=0):
+    """
+    Compare the distances of the database with the lengths of the solutions
+    of AStarSolver on random boards (new games and states after random moves)
+    and check that the optimal moves of the database win the game
+
+    :n: number of lines of the boards
+    :path: path of the table (see databasePath if None)
+    :samples: number of boards
+    :seed: seed of the random boards
+    :return: nothing (AssertionError if a distance is wrong)
+    """
+    from board import Board
+    from generator import COLORS
+    from solver import AStarSolver
+
+    database = DistanceDatabase(n, path)
+    rng = np.random.default_rng(seed)
+    board = Board(COLORS, n)
+    board.verbose = False
+    for sample in range(samples):
+        board.reset(rng)
+        for _ in range(rng.integers(0, 2 * n)):
+            board.push(rng.choice(list(board.legalMoves())))
+        expected = AStarSolver(board).solve()
+        solver = DatabaseSolver(board, database=database)
+        solution = solver.solve()
+        assert len(solution) == len(expected), (sample, solution, expected)
+        for direction in solution:
+            board.push(direction)
+        assert board.checkWin(), sample
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(
+        description="Build or verify the distance-to-win database"
+    )
+    parser.add_argument("command", choices=["build", "verify"])
+    parser.add_argument("lines", type=int)
+    parser.add_argument("--path", default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--samples", type=int, default=200)
+    arguments = parser.parse_args()
+
+    startTime = time.perf_counter()
+    if arguments.command == "build":
+        builder = DatabaseBuilder(arguments.lines, arguments.path)
+        layers = builder.build(workers=arguments.workers)
+        print("states at each distance:", layers)
+    else:
+        verify(arguments.lines, arguments.path, samples=arguments.samples)
+        print(arguments.samples, "boards verified")
+    print(round(time.perf_counter() - startTime, 1), "s")
@@ -0,0 +1,355 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from board import Board
+from database import openDatabase
+from generator import COLORS, PuzzleGenerator
+from grid import DIRECTION_CODES, TetraGrid
+
+MANIFEST_NAME = "manifest.json"
+RECORD_FORMAT = 2  # version of the layout of the records (see recordDtype)
+
+
+def recordDtype(casesNumber, recordFormat=RECORD_FORMAT):
+    """
+    Return the numpy dtype of the records of a board with [casesNumber] cases
+
+    A record is a state of a game and the optimal move played from it:
+    - cells: color of each case indexed by the case ids of TetraGrid (the case
+      under the piece holds its color, like TetraGrid.cells)
+    - playerCell: case id of the piece (int16, int32 beyond 32768 cases)
+    - faces: packed faces of the piece (see ColoredTetahedron.packedFaces)
+    - move: direction code of the optimal move
+    - distance: number of moves left to win (this move included, int16)
+
+    :casesNumber: number of cases of the grid
+    :recordFormat: format of the records given by the manifest (the format 1
+    had int8 distances and always int16 case ids)
+    :return: numpy structured dtype
+    """
+    if recordFormat == 1:
+        playerCell, distance = np.int16, np.int8
+    else:
+        playerCell = np.int16 if casesNumber <= 1 << 15 else np.int32
+        distance = np.int16
+    return np.dtype(
+        [
+            ("cells", np.int8, (casesNumber,)),
+            ("playerCell", playerCell),
+            ("faces", np.uint16),
+            ("move", np.int8),
+            ("distance", distance),
+        ]
+    )
+
+
+def shardName(index):
+    """
+    Return the file name of the shard [index]
+
+    :index: index of the shard
+    :return: string
+    """
+    return "shard-%05d.bin" % index
+
+
+def writeShard(
+    path, n, seed, index, records, minLength, maxLength, solver, databasePath=None
+):
+    """
+    Fill a new shard of [records] records with the states of solved games, the
+    games are generated with a seed derived from [seed] and [index] so that
+    the shard does not depend on the process nor on the other shards
+
+    :path: path of the shard file (written under a temporary name first)
+    :n: number of lines of the boards
+    :seed: seed of the dataset
+    :index: index of the shard
+    :records: number of records of the shard
+    :minLength: minimal length of the optimal solutions
+    :maxLength: maximal length of the optimal solutions (no limit if None)
+    :solver: "database" to solve with the DistanceDatabase at
+    [databasePath], "astar" for AStarSolver (they may choose different optimal
+    moves)
+    :databasePath: path of the table of the database (see databasePath if None)
+    :return: number of games recorded in the shard
+    """
+    database = False
+    if solver == "database":
+        database = openDatabase(n, databasePath)
+        if database is None:
+            raise ValueError("The dataset needs the complete database of %d lines" % n)
+    generator = PuzzleGenerator(
+        n,
+        minLength=minLength,
+        maxLength=maxLength,
+        seed=np.random.SeedSequence(seed, spawn_key=(index,)),
+        database=database,
+    )
+    grid = generator.board.grid
+    board = Board(COLORS, n)
+    board.verbose = False
+
+    temporaryPath = path + ".tmp"
+    dtype = recordDtype(len(grid.validIndices))
+    maxDistance = np.iinfo(dtype["distance"]).max
+    data = np.memmap(temporaryPath, dtype=dtype, mode="w+", shape=(records,))
+    written = 0
+    games = 0
+    puzzles = generator.puzzles()
+    while written < records:
+        layout, solution = next(puzzles)
+        if len(solution) > maxDistance:
+            raise ValueError(
+                "Solution of %d moves too long for the records" % len(solution)
+            )
+        board.reset(colorCases=generator.colorCases(layout))
+        games += 1
+        # The end of the last game is cut so that the shard is full
+        for k, direction in enumerate(solution[: records - written]):
+            record = data[written]
+            playerCell = grid.cellIds[board.playerPosition]
+            record["cells"] = board.grid.cells
+            record["playerCell"] = playerCell
+            record["faces"] = board.playerPiece.packedFaces
+            record["move"] = DIRECTION_CODES[direction]
+            record["distance"] = len(solution) - k
+            board.move(direction)
+            written += 1
+    data.flush()
+    del data
+    os.replace(temporaryPath, path)
+    return games
+
+
+class DatasetWriter:
+    """
+    Python Class writing a dataset of (state, optimal move) records of solved
+    games into fixed size memory-mapped shards with a pool of processes
+
+    The manifest of the directory records the settings of the dataset and the
+    shards already written, a run can then be resumed or extended with more
+    shards and gives the same shards whatever the number of processes
+    """
+
+    def __init__(
+        self,
+        directory,
+        n=8,
+        recordsPerShard=65536,
+        seed=0,
+        minLength=0,
+        maxLength=None,
+        databasePath=None,
+    ):
+        """
+        Open the dataset of [directory] (created if it does not exist)
+
+        :directory: directory of the manifest and the shards
+        :n: number of lines of the boards (must be even)
+        :recordsPerShard: number of records of each shard
+        :seed: seed of the dataset
+        :minLength: minimal length of the optimal solutions of the games
+        :maxLength: maximal length of the optimal solutions (no limit if None)
+        :databasePath: path of the table of the distance database (see
+        databasePath if None)
+        """
+        self.directory = directory
+        self.databasePath = databasePath
+        self.manifestPath = os.path.join(directory, MANIFEST_NAME)
+        settings = {
+            "lines": n,
+            "casesNumber": len(TetraGrid(n).validIndices),
+            "recordsPerShard": recordsPerShard,
+            "seed": seed,
+            "minLength": minLength,
+            "maxLength": maxLength,
+            "recordFormat": RECORD_FORMAT,
+        }
+        if os.path.exists(self.manifestPath):
+            with open(self.manifestPath) as file:
+                self.manifest = json.load(file)
+            self.manifest.setdefault("recordFormat", 1)
+            self.manifest.setdefault("solver", "astar")
+            for key, value in settings.items():
+                if self.manifest[key] != value:
+                    raise ValueError(
+                        "%s is %r in %s" % (key, self.manifest[key], self.manifestPath)
+                    )
+        else:
+            os.makedirs(directory, exist_ok=True)
+            # The games of a new dataset are solved with the distance
+            # database if it is built (much faster), and always the same way
+            # when the dataset is extended
+            solver = "astar" if openDatabase(n, databasePath) is None else "database"
+            self.manifest = dict(settings, solver=solver, shards=[])
+
+    def saveManifest(self):
+        """
+        Write the manifest atomically (a crash keeps the previous manifest)
+
+        :return: nothing
+        """
+        self.manifest["shards"].sort(key=lambda shard: shard["index"])
+        temporaryPath = self.manifestPath + ".tmp"
+        with open(temporaryPath, "w") as file:
+            json.dump(self.manifest, file, indent=2)
+        os.replace(temporaryPath, self.manifestPath)
+
+    def write(self, shards, workers=None):
+        """
+        Write the missing shards among the first [shards] ones, the manifest is
+        updated as soon as a shard is complete
+
+        :shards: total number of shards wanted in the dataset
+        :workers: number of processes (number of CPUs if None)
+        :return: list of the indices of the shards written
+        """
+        done = {shard["index"] for shard in self.manifest["shards"]}
+        missing = [index for index in range(shards) if index not in done]
+        settings = self.manifest
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(
+                    writeShard,
+                    os.path.join(self.directory, shardName(index)),
+                    settings["lines"],
+                    settings["seed"],
+                    index,
+                    settings["recordsPerShard"],
+                    settings["minLength"],
+                    settings["maxLength"],
+                    settings["solver"],
+                    self.databasePath,
+                ): index
+                for index in missing
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                self.manifest["shards"].append(
+                    {
+                        "index": index,
+                        "file": shardName(index),
+                        "records": settings["recordsPerShard"],
+                        "games": future.result(),
+                    }
+                )
+                self.saveManifest()
+        if not missing:
+            self.saveManifest()
+        return missing
+
+
+class DatasetReader:
+    """
+    Python Class reading the records of a dataset written by DatasetWriter,
+    the shards are memory-mapped so only the records used are loaded
+    """
+
+    def __init__(self, directory):
+        """
+        Open the dataset of [directory]
+
+        :directory: directory of the manifest and the shards
+        """
+        self.directory = directory
+        with open(os.path.join(directory, MANIFEST_NAME)) as file:
+            self.manifest = json.load(file)
+        self.dtype = recordDtype(
+            self.manifest["casesNumber"], self.manifest.get("recordFormat", 1)
+        )
+        self.grid = TetraGrid(self.manifest["lines"])
+
+    def __len__(self):
+        return sum(shard["records"] for shard in self.manifest["shards"])
+
+    def shards(self):
+        """
+        Iterate over the shards of the dataset
+
+        :return: iterator of read-only np.memmap of records
+        """
+        for shard in self.manifest["shards"]:
+            yield np.memmap(
+                os.path.join(self.directory, shard["file"]),
+                dtype=self.dtype,
+                mode="r",
+                shape=(shard["records"],),
+            )
+
+    def batches(self, batchSize=4096):
+        """
+        Iterate over the records by batches (the last batch of each shard may
+        be smaller)
+
+        :batchSize: number of records of the batches
+        :return: iterator of arrays of records
+        """
+        for data in self.shards():
+            for start in range(0, len(data), batchSize):
+                yield np.array(data[start : start + batchSize])
+
+    def makeBoard(self, record):
+        """
+        Return a Board in the state of [record]
+
+        :record: record of the dataset
+        :return: a Board
+        """
+        board = Board(COLORS, self.manifest["lines"])
+        board.verbose = False
+        board.grid.cells[:] = record["cells"]
+        board.playerPosition = self.grid.cellPositionsTable[int(record["playerCell"])]
+        board.playerPiece.setPackedFaces(record["faces"])
+        return board
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(
+        description="Generate or read a dataset of (state, optimal move) records"
+    )
+    parser.add_argument("command", choices=["generate", "read"])
+    parser.add_argument("directory")
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--records", type=int, default=65536)
+    parser.add_argument("--lines", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-length", type=int, default=0)
+    parser.add_argument("--max-length", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--database", default=None, help="path of the distance table")
+    arguments = parser.parse_args()
+
+    if arguments.command == "generate":
+        writer = DatasetWriter(
+            arguments.directory,
+            n=arguments.lines,
+            recordsPerShard=arguments.records,
+            seed=arguments.seed,
+            minLength=arguments.min_length,
+            maxLength=arguments.max_length,
+            databasePath=arguments.database,
+        )
+        startTime = time.perf_counter()
+        written = writer.write(arguments.shards, workers=arguments.workers)
+        elapsed = time.perf_counter() - startTime
+        print(
+            len(written),
+            "shards written in",
+            round(elapsed, 1),
+            "s",
+            round(len(written) * arguments.records / elapsed),
+            "records/s",
+        )
+    else:
+        reader = DatasetReader(arguments.directory)
+        moves = np.zeros(4, dtype=np.int64)
+        for batch in reader.batches():
+            moves += np.bincount(batch["move"], minlength=4)
+        print(len(reader), "records, moves per direction:", moves)
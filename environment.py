@@ -0,0 +1,110 @@
+import numpy as np
+
+from board import Board
+from grid import DIRECTIONS
+
+# Default case color first (only the number of colors matters without display)
+COLORS = ["white", "black", "red", "green", "blue"]
+
+
+class TetahedronEnvironment:
+    """
+    Python Class wrapping a Board in a headless environment for agents
+    (nothing is displayed or printed)
+
+    The actions are the direction codes of grid.DIRECTIONS. The observation
+    is a dictionary of read-only numpy views that are updated in place:
+    - "cells": the colors of the cases indexed by their ids (see
+      TetraGrid.cells, the case under the piece holds its color)
+    - "piece": line, column, color of the case under the piece and colors of
+      the faces of the piece in the order of coloredPiece.FACES
+    """
+
+    def __init__(self, n=8, mode="tetra"):
+        """
+        Creation of the environment with a board of [n] lines
+
+        :n: number of lines of the board (must be even)
+        :mode: "tetra" (or "octa" but not implemented yet)
+        """
+        self.board = Board(COLORS, n, mode=mode)
+        self.board.verbose = False
+
+        # int32: the columns of boards of more than 64 lines exceed int8
+        self.pieceState = np.zeros(7, dtype=np.int32)
+        self.cellsView = self.board.grid.cells.view()
+        self.cellsView.flags.writeable = False
+        self.pieceView = self.pieceState.view()
+        self.pieceView.flags.writeable = False
+        self.updatePieceState()
+
+    def reset(self, seed=None):
+        """
+        Start a new game
+
+        :seed: seed of the random placement of the color cases
+        :return: the observation
+        """
+        self.board.reset(np.random.default_rng(seed), seed=seed)
+        self.updatePieceState()
+        return self.observation()
+
+    def step(self, action):
+        """
+        Move the piece toward [action] if the move is valid
+
+        :action: direction code (or direction string)
+        :return: the observation, the reward (1 for the winning move, 0
+        otherwise), True if the game is won and an info dictionary telling
+        if the move was valid
+        """
+        wasWon = self.board.checkWin()
+        valid = self.board.isValidMove(action)
+        if valid:
+            self.board.move(action)
+            self.updatePieceState()
+        won = self.board.checkWin()
+        reward = 1.0 if won and not wasWon else 0.0
+        return self.observation(), reward, won, {"valid": valid}
+
+    def legalActions(self):
+        """
+        Return the direction codes of the valid moves
+
+        :return: list of int
+        """
+        return [
+            code
+            for code in range(len(DIRECTIONS))
+            if self.board.isValidMove(direction=code)
+        ]
+
+    def observation(self):
+        """
+        Return the current observation (read-only views, no copy)
+
+        :return: dictionary {"cells": view, "piece": view}
+        """
+        return {"cells": self.cellsView, "piece": self.pieceView}
+
+    def updatePieceState(self):
+        """
+        Copy the state of the piece into the array viewed by the observation
+
+        :return: nothing
+        """
+        board = self.board
+        state = self.pieceState
+        state[0], state[1] = board.playerPosition
+        state[2] = board.underPlayerPieceCaseValue
+        state[3:] = list(board.playerPiece.faces.values())
+
+
+if __name__ == "__main__":
+    environment = TetahedronEnvironment()
+    environment.reset(seed=0)
+    rng = np.random.default_rng(0)
+    for _ in range(10):
+        actions = environment.legalActions()
+        observation, reward, won, info = environment.step(rng.choice(actions))
+    print(observation["piece"])
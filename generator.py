@@ -0,0 +1,171 @@
+import itertools
+
+import numpy as np
+
+from board import Board
+from database import UNKNOWN, DatabaseSolver, openDatabase
+from solver import AStarSolver
+
+# Default case color first (only the number of colors matters to generate)
+COLORS = ["white", "black", "red", "green", "blue"]
+
+
+class PuzzleGenerator:
+    """
+    Python Class generating puzzles for boards of [n] lines: the cases of the
+    4 colors when the uncolored piece stands on its starting case
+
+    A layout takes one case in the bucket of each connected component
+    (TetraGrid.componentCells) so that it always has a solution, sampling a
+    layout is then O(k) for k colors. The puzzles are kept only if their
+    optimal solution length is in the target range [minLength, maxLength].
+
+    With a DistanceDatabase (4 to 8 lines) the lengths of a whole batch of
+    layouts are read at once and only the kept puzzles are solved, by
+    following the database (thousands of puzzles per second on 8 lines).
+    Otherwise every layout is solved with [solverClass] (AStarSolver, a few
+    dozen puzzles per second on 8 lines).
+    """
+
+    def __init__(
+        self,
+        n=8,
+        minLength=0,
+        maxLength=None,
+        seed=None,
+        table=None,
+        database=None,
+        databasePath=None,
+    ):
+        """
+        Creation of the generator
+
+        :n: number of lines of the boards (must be even)
+        :minLength: minimal length of the optimal solutions
+        :maxLength: maximal length of the optimal solutions (no limit if None)
+        :seed: seed of the numpy random Generator
+        :table: optional TranspositionTable shared by the solvers
+        :database: DistanceDatabase of the boards of [n] lines (the complete
+        one at [databasePath] if None, see openDatabase, and no database if
+        False)
+        :databasePath: path of the table of the database (see databasePath if
+        None)
+        """
+        self.n = n
+        self.minLength = minLength
+        self.maxLength = maxLength
+        self.rng = np.random.default_rng(seed)
+        self.solverClass = AStarSolver
+        self.table = table
+        if database is None:
+            database = openDatabase(n, databasePath)
+        self.database = database or None
+
+        # Board reused to solve every puzzle
+        self.board = Board(COLORS, n)
+        self.board.verbose = False
+        grid = self.board.grid
+        self.startCell = grid.cellIds[self.board.playerPosition]
+        self.componentCells = [
+            cells[cells != self.startCell] for cells in grid.componentCells
+        ]
+        self.layoutsSolved = 0
+
+    def sampleLayouts(self, count):
+        """
+        Return [count] random layouts with one color per connected component
+
+        :count: number of layouts
+        :return: (count, 4) array of case ids, column c holding the case of the
+        color c + 1
+        """
+        cases = np.stack(
+            [
+                cells[self.rng.integers(0, len(cells), count)]
+                for cells in self.componentCells
+            ],
+            axis=1,
+        )
+        # Random assignment of the colors to the components
+        order = np.argsort(self.rng.random((count, len(self.componentCells))), axis=1)
+        return np.take_along_axis(cases, order, axis=1)
+
+    def colorCases(self, layout):
+        """
+        Return the cases of the colors of [layout]
+
+        :layout: array of 4 case ids
+        :return: list of (int,int) (see Board.placeColorCases)
+        """
+        return [self.board.grid.cellPositionsTable[caseId] for caseId in layout]
+
+    def makeBoard(self, layout):
+        """
+        Return a new Board with the color cases of [layout]
+
+        :layout: array of 4 case ids
+        :return: a Board
+        """
+        board = Board(COLORS, self.n)
+        board.reset(colorCases=self.colorCases(layout))
+        return board
+
+    def puzzles(self, batchSize=256):
+        """
+        Iterate endlessly over puzzles whose optimal solution length is in the
+        target range (the solver stops as soon as a solution would be too long)
+
+        :batchSize: number of layouts sampled at once
+        :return: iterator of (layout, solution), the solution being a shortest
+        list of direction strings
+        """
+        while True:
+            layouts = self.sampleLayouts(batchSize)
+            if self.database is not None:
+                # Only the layouts whose length is in the range are solved
+                distances = self.database.layoutDistances(self.startCell, layouts)
+                kept = (distances >= self.minLength) & (distances != UNKNOWN)
+                if self.maxLength is not None:
+                    kept &= distances <= self.maxLength
+                self.layoutsSolved += len(layouts)
+                for layout in layouts[kept]:
+                    self.board.reset(colorCases=self.colorCases(layout))
+                    solver = DatabaseSolver(self.board, database=self.database)
+                    yield layout, solver.solve()
+                continue
+            for layout in layouts:
+                self.board.reset(colorCases=self.colorCases(layout))
+                solver = self.solverClass(
+                    self.board, maxLength=self.maxLength, table=self.table
+                )
+                solution = solver.solve()
+                self.layoutsSolved += 1
+                if solution is not None and len(solution) >= self.minLength:
+                    yield layout, solution
+
+    def generate(self, count, batchSize=256):
+        """
+        Return [count] puzzles whose optimal solution length is in the target
+        range (see puzzles)
+
+        :count: number of puzzles
+        :batchSize: number of layouts sampled at once
+        :return: list of (layout, solution)
+        """
+        return list(itertools.islice(self.puzzles(batchSize), count))
+
+
+if __name__ == "__main__":
+    import time
+
+    generator = PuzzleGenerator(seed=0)
+    startTime = time.perf_counter()
+    layouts = generator.sampleLayouts(100000)
+    elapsed = time.perf_counter() - startTime
+    print(round(len(layouts) / elapsed), "layouts/s")
+
+    generator = PuzzleGenerator(minLength=20, maxLength=24, seed=0)
+    startTime = time.perf_counter()
+    puzzles = generator.generate(100)
+    elapsed = time.perf_counter() - startTime
+    print(round(len(puzzles) / elapsed, 1), "puzzles/s with 20 to 24 moves")
@@ -1,5 +1,174 @@
-import numpy as np
 import abc
+import functools
+import gc
+import os
+
+import numpy as np
+
+# Directions of the moves, the integer code of a direction is its index
+DIRECTIONS = ["left", "right", "up", "down"]
+LEFT, RIGHT, UP, DOWN = range(4)
+DIRECTION_CODES = {direction: code for code, direction in enumerate(DIRECTIONS)}
+
+# Code of the direction undoing each direction
+OPPOSITE_DIRECTIONS = [RIGHT, LEFT, DOWN, UP]
+
+
+# Directory of the geometry of the large grids kept between runs (see
+# tetraGeometry), TETAHEDRON_CACHE="" disables the cache on disk
+GEOMETRY_CACHE_DIRECTORY = os.environ.get(
+    "TETAHEDRON_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "tetahedronAI")
+)
+GEOMETRY_CACHE_MIN_LINES = 64  # smaller grids are computed faster than read
+# Version of the tables of computeTetraGeometry in the name of the cached
+# files, to be increased whenever they change (the old files are ignored)
+GEOMETRY_FORMAT = 2
+GEOMETRY_KEYS = (
+    "cellIds",
+    "cellPositions",
+    "neighbors",
+    "cellComponents",
+    "stripCoordinates",
+)
+geometries = {}  # geometry of the grids built by this process by number of lines
+
+
+def tetraGeometry(n):
+    """
+    Return the tables of the geometry of a TetraGrid with [n] lines (see
+    TetraGrid.__init__), read-only arrays shared by the grids of the process
+    and kept on disk for the large grids
+
+    :n: the number of lines of the grid (must be even)
+    :return: dict of numpy arrays
+    """
+    if n in geometries:
+        return geometries[n]
+    path = None
+    if GEOMETRY_CACHE_DIRECTORY and n >= GEOMETRY_CACHE_MIN_LINES:
+        path = os.path.join(
+            GEOMETRY_CACHE_DIRECTORY, "tetraGrid-%d-v%d.npz" % (n, GEOMETRY_FORMAT)
+        )
+    geometry = None
+    if path is not None and os.path.exists(path):
+        try:
+            with np.load(path) as archive:
+                geometry = {name: archive[name] for name in GEOMETRY_KEYS}
+        except (OSError, ValueError, KeyError):
+            geometry = None  # computed again and rewritten
+    if geometry is None:
+        geometry = computeTetraGeometry(n)
+        if path is not None:
+            # Written under a temporary name so that a concurrent run never
+            # reads a partial file
+            temporaryPath = "%s.%d.tmp.npz" % (path[: -len(".npz")], os.getpid())
+            try:
+                os.makedirs(GEOMETRY_CACHE_DIRECTORY, exist_ok=True)
+                np.savez(temporaryPath, **geometry)
+                os.replace(temporaryPath, path)
+            except OSError:
+                # Not writable (or full), the geometry is only kept in memory
+                try:
+                    os.remove(temporaryPath)
+                except OSError:
+                    pass
+    for array in geometry.values():
+        array.setflags(write=False)
+    geometries[n] = geometry
+    return geometry
+
+
+def withoutCollection(build):
+    """
+    Call [build] with the garbage collector paused, it would otherwise scan
+    the objects again and again while a table of millions of lists is built
+
+    :build: function without argument
+    :return: the result of build
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return build()
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def computeTetraGeometry(n):
+    """
+    Compute the tables of the geometry of a TetraGrid with [n] lines with
+    numpy (see TetraGrid.__init__)
+
+    :n: the number of lines of the grid (must be even)
+    :return: dict of numpy arrays
+    """
+    width = 2 * n - 1
+    lines = np.arange(n)[:, None]
+    columns = np.arange(width)[None, :]
+
+    # Cut the corners for the hexagonal shape of the grid, the starting point
+    # of a line is its distance to the nearest "center" line (the full lines
+    # at position n//2 and position n//2+1)
+    startingPoints = np.minimum(abs(lines - n // 2), abs(lines - n // 2 + 1))
+    valid = (columns >= startingPoints) & (columns <= width - 1 - startingPoints)
+    indices = np.nonzero(valid)
+    casesNumber = len(indices[0])
+
+    # Each valid case gets an id (its index in validIndices)
+    cellIds = np.full((n, width), -1, dtype=np.int32)
+    cellIds[indices] = np.arange(casesNumber, dtype=np.int32)
+    cellPositions = np.stack(indices, axis=1).astype(np.int32)
+
+    # neighbors[cellId, directionCode] is the id of the destination case
+    # or -1 if the move is blocked
+    rows, cols = indices[0] + 1, indices[1] + 1
+    paddedIds = np.full((n + 2, width + 2), -1, dtype=np.int32)
+    paddedIds[1:-1, 1:-1] = cellIds
+    casesUp = (indices[0] + indices[1] + n // 2) % 2 == 1  # see isCaseUp
+    neighbors = np.stack(
+        [
+            paddedIds[rows, cols - 1],
+            paddedIds[rows, cols + 1],
+            np.where(casesUp, -1, paddedIds[rows - 1, cols]),
+            np.where(casesUp, paddedIds[rows + 1, cols], -1),
+        ],
+        axis=1,
+    )
+
+    # Connected component of each case (see ccIndex)
+    i, j = indices
+    j = j + (n // 2) % 2
+    cellComponents = np.where(
+        j % 2 == 0,
+        np.where((i // 2) % 2 == (j // 2) % 2, 1, 2),
+        np.where(((i - 1) // 2) % 2 == (j // 2) % 2, 3, 4),
+    ).astype(np.int8)
+
+    # Index of the horizontal strip and of the two diagonal strips of
+    # triangles containing each case, a move crosses exactly one line so
+    # on this convex board the minimal number of moves between two cases
+    # is the sum of the differences of their strip indices
+    lines, columns = indices
+    upShift = 1 + casesUp.astype(np.int64)
+    parity = (columns - lines)[casesUp][0] % 2
+    stripCoordinates = np.stack(
+        [
+            lines,
+            (3 * (columns - lines - parity) - upShift) // 6,
+            (3 * (columns + lines - parity) + upShift) // 6,
+        ],
+        axis=1,
+    ).astype(np.int32)
+
+    # Keys of GEOMETRY_KEYS (increase GEOMETRY_FORMAT when changing them)
+    return {
+        "cellIds": cellIds,
+        "cellPositions": cellPositions,
+        "neighbors": neighbors,
+        "cellComponents": cellComponents,
+        "stripCoordinates": stripCoordinates,
+    }
 
 
 class AbstractGrid(abc.ABC):
@@ -29,7 +198,7 @@ class AbstractGrid(abc.ABC):
         return 0
 
     @abc.abstractmethod
-    def selectRandomCasesWithSolution(self, wantedValue=0):
+    def selectRandomCasesWithSolution(self, wantedValue=0, rng=None):
         """
         Select cases with the wanted value in order to place the colors that the
         player will try to move in order to win
@@ -45,6 +214,7 @@ class AbstractGrid(abc.ABC):
 
         :number: number of random cases to select
         :wantedValue: integer corresponding to the wanted value in the grid for the selection
+        :rng: numpy random Generator (the global numpy random state is used if None)
         :return: list of (int,int) corresponding to the selection of cases
         """
         pass
@@ -60,6 +230,16 @@ class AbstractGrid(abc.ABC):
         """
         self.grid[i, j] = value
 
+    def getValue(self, i, j):
+        """
+        Return the value of case [i,j]
+
+        :i: line coordinate in the grid
+        :j: column coordinate in the grid
+        :return: an integer
+        """
+        return int(self.grid[i, j])
+
     @abc.abstractmethod
     def isCaseUp(self, i, j):
         """
@@ -105,7 +285,6 @@ class TetraGrid(AbstractGrid):
     Moreover the corners have a value of -1 in order to form a hexagon globally
     """
 
-    grid = None
     width = None
     height = None
 
@@ -118,24 +297,105 @@ class TetraGrid(AbstractGrid):
         assert n % 2 == 0, "[n] must be even"
         self.width = 2 * n - 1
         self.height = n
-        self.grid = np.zeros((self.height, self.width))
-        startingPoint = (n - 2) // 2
-
-        # Cut the corners for the hexagonal shape of the grid
-        for i in range(self.height):
-            # Compute the starting point of the line as the distance
-            # between the line and the nearest "center" line
-            # by middle line we mean line that are supposed to be full
-            # those are at position n//2 and position n//2+1
-            startingPoint = min(abs(i - n // 2), abs(i - n // 2 + 1))
-            endingPoint = self.width - 1 - startingPoint  # the symetrical value
-            for j in range(self.width):
-                if j < startingPoint or j > endingPoint:
-                    self.grid[i, j] = -1
-        indices = np.where(self.grid != -1)  # all the indices different from -1
-        self.validIndices = list(
-            zip(indices[0], indices[1])
-        )  # format indices into a list of tuples int,int
+        geometry = tetraGeometry(n)
+        self.cellIds = geometry["cellIds"]
+        self.cellPositions = geometry["cellPositions"]
+        self.neighbors = geometry["neighbors"]
+        self.cellComponents = geometry["cellComponents"]
+        self.stripCoordinates = geometry["stripCoordinates"]
+
+        # Value of each valid case indexed by its id (the piece of the player
+        # is not stored in the grid, see Board.playerPosition)
+        self.cells = np.zeros(len(self.cellPositions), dtype=np.int8)
+
+        # Buckets of the case ids of each component (componentCells[k - 1]
+        # for the component k)
+        self.componentCells = [
+            np.flatnonzero(self.cellComponents == k) for k in range(1, 5)
+        ]
+
+        # Distance maps computed on demand (see distanceFrom)
+        self.distances = {}
+
+    @functools.cached_property
+    def validIndices(self):
+        """
+        (int,int) coordinates of the valid cases indexed by their id
+        """
+        return withoutCollection(lambda: list(zip(*self.cellPositions.T.tolist())))
+
+    # Python copies of the tables, faster than numpy for single reads (built
+    # on first use as they take longer than the arrays on large boards)
+    @functools.cached_property
+    def cellIdsTable(self):
+        """
+        cellIds as nested lists
+        """
+        return withoutCollection(self.cellIds.tolist)
+
+    @functools.cached_property
+    def neighborsTable(self):
+        """
+        neighbors as nested lists
+        """
+        return withoutCollection(self.neighbors.tolist)
+
+    @functools.cached_property
+    def cellPositionsTable(self):
+        """
+        Same list as validIndices
+        """
+        return self.validIndices
+
+    @functools.cached_property
+    def faceComponentsTable(self):
+        """
+        For each case id, the component touched by each face of the piece
+        standing on the case (dictionaries {face: component index})
+        """
+        table = []
+        for i, j in self.validIndices:
+            otherLine = i + 1 if self.isCaseUp(i, j) else i - 1
+            table.append(
+                {
+                    "board": self.ccIndex(i, j),
+                    "left": self.ccIndex(i, j - 1),
+                    "right": self.ccIndex(i, j + 1),
+                    "other": self.ccIndex(otherLine, j),
+                }
+            )
+        return table
+
+    @property
+    def grid(self):
+        """
+        The matrix corresponding to the grid values (a copy of the values of
+        cells with -1 outside the board, for display and debugging)
+        """
+        matrix = np.full((self.height, self.width), -1, dtype=np.int8)
+        matrix[tuple(self.cellPositions.T)] = self.cells
+        return matrix
+
+    def getValue(self, i, j):
+        """
+        Return the value of case [i,j]
+
+        :i: line coordinate in the grid
+        :j: column coordinate in the grid
+        :return: an integer
+        """
+        return int(self.cells[self.cellIdsTable[i][j]])
+
+    def changeValue(self, i, j, value):
+        """
+        Change the value of case [i,j] to [value]
+
+        :i: line coordinate in the grid
+        :j: column coordinate in the grid
+        :value: new value of the case
+        :return: nothing
+        """
+        self.cells[self.cellIdsTable[i][j]] = value
 
     #  NOT SUITABLE IF WE ALWAYS WANT A SOLUTION
     #  def selectRandomCases(self, number=4, wantedValue=0):
@@ -156,7 +416,7 @@ class TetraGrid(AbstractGrid):
     #
     #      return randomSelection
 
-    def selectRandomCasesWithSolution(self, wantedValue=0):
+    def selectRandomCasesWithSolution(self, wantedValue=0, rng=None, excluded=()):
         """
         Select cases with the wanted value in order to place the colors that the
         player will try to move in order to win
@@ -172,29 +432,56 @@ class TetraGrid(AbstractGrid):
 
         :number: number of random cases to select
         :wantedValue: integer corresponding to the wanted value in the grid for the selection
+        :rng: numpy random Generator (the global numpy random state is used if None)
+        :excluded: ids of the cases that must not be selected (e.g. the case of
+        the player's piece)
         :return: list of (int,int) corresponding to the selection of cases
         """
         # if self.mode=="tetra":
-        ccNumber = 4
-        # Indices of cells with the desired value
-        indices = np.argwhere(self.grid == wantedValue)
-
-        # Shuffle indices for randomness
-        np.random.shuffle(indices)
+        rng = np.random if rng is None else rng
+        randomIndex = rng.integers if hasattr(rng, "integers") else rng.randint
 
-        # Filter only K indices corresponding to K different cc on the coloring
+        # Take one case in the bucket of each cc (in a random order for the
+        # colors), a case is drawn again if it does not have the wanted value
         result = []
-        seenValues = []
-        i = 0
-        while len(result) != ccNumber:
-            val = self.ccIndex(indices[i][0], indices[i][1])
-            if val not in seenValues:
-                result.append(indices[i])
-                seenValues.append(val)
-            i += 1
+        for k in rng.permutation(len(self.componentCells)):
+            cells = self.componentCells[k]
+            for _ in range(8):
+                caseId = cells[randomIndex(len(cells))]
+                if self.cells[caseId] == wantedValue and caseId not in excluded:
+                    break
+            else:
+                # Most of the cases are taken, select among the free ones
+                free = cells[self.cells[cells] == wantedValue]
+                free = free[~np.isin(free, list(excluded))]
+                caseId = free[randomIndex(len(free))]
+            result.append(tuple(self.cellPositions[caseId].tolist()))
 
         return result
 
+    def distanceFrom(self, cellId):
+        """
+        Return the minimal number of moves between case [cellId] and every
+        case of the board (computed once with a BFS then cached)
+
+        :cellId: id of the case
+        :return: list of distances indexed by case id
+        """
+        if cellId not in self.distances:
+            distances = [-1] * len(self.validIndices)
+            distances[cellId] = 0
+            frontier = [cellId]
+            while frontier:
+                newFrontier = []
+                for current in frontier:
+                    for neighbor in self.neighborsTable[current]:
+                        if neighbor >= 0 and distances[neighbor] < 0:
+                            distances[neighbor] = distances[current] + 1
+                            newFrontier.append(neighbor)
+                frontier = newFrontier
+            self.distances[cellId] = distances
+        return self.distances[cellId]
+
     def ccIndex(self, i, j):
         """
         Return the connected component index of the corresponding cell
@@ -205,6 +492,10 @@ class TetraGrid(AbstractGrid):
         :j: column coordinate in the grid
         :return: the cc index
         """
+        # The cases facing up are shifted by one column when n//2 is odd
+        # (see isCaseUp) so the pattern of the components is shifted too
+        if (self.height // 2) % 2:
+            j += 1
         if not j % 2:
             if (i // 2) % 2 == (j // 2) % 2:
                 return 1
@@ -227,6 +518,19 @@ class TetraGrid(AbstractGrid):
         n = self.height
         return ((i + j) % 2 and not (n // 2) % 2) or (not (i + j) % 2 and (n // 2) % 2)
 
+    def directionCode(self, direction):
+        """
+        Return the integer code of [direction]
+
+        :direction: direction string (either left, right, up or down) or
+        integer code (index in DIRECTIONS)
+        :return: an integer
+        """
+        code = DIRECTION_CODES.get(direction, direction)
+        if code not in (LEFT, RIGHT, UP, DOWN):
+            raise ValueError("Direction not valid")
+        return code
+
     def isValidMove(self, i, j, direction="left", outOfBoardValue=-1):
         """
         Return if the player at [i,j] can move toward [direction]
@@ -234,35 +538,17 @@ class TetraGrid(AbstractGrid):
         :i: origin line coordinate
         :j: origin column coordinate
         :direction: string corresponding to the direction chosen (either left, right, up or down)
+        or its integer code
         :outOfBoardValue: integer corresponding to the values of cases that are not on the board
+        (the neighbors table is built with -1 as out of board value)
         :return: boolean
         """
+        code = self.directionCode(direction)
         # First verify if the origin coordinates are valid
         if i < 0 or i >= self.height or j < 0 or j >= self.width:
             return False
-
-        # Then for each direction check if the destination case is on the board
-        if direction == "left":
-            return (j - 1) >= 0 and self.grid[i, j - 1] != outOfBoardValue
-        elif direction == "right":
-            return (j + 1) < self.width and self.grid[i, j + 1] != outOfBoardValue
-        # Special treatment for up and down direction because it depends on the orientation of origin case
-        elif direction == "up":
-            # Can't go up if the origin case is a triangle facing up
-            return (
-                (i - 1) >= 0
-                and (not self.isCaseUp(i, j))
-                and self.grid[i - 1, j] != outOfBoardValue
-            )
-        elif direction == "down":
-            # Can't go down if the origin case is a triangle facing down
-            return (
-                (i + 1) < self.height
-                and self.isCaseUp(i, j)
-                and self.grid[i + 1, j] != outOfBoardValue
-            )
-        else:
-            raise ValueError("Direction not valid")
+        cellId = self.cellIdsTable[i][j]
+        return cellId >= 0 and self.neighborsTable[cellId][code] >= 0
 
     def getDestinationPosition(self, i, j, direction="left"):
         """
@@ -272,17 +558,22 @@ class TetraGrid(AbstractGrid):
         :i: origin line coordinate
         :j: origin column coordinate
         :direction: string corresponding to the direction chosen
-        (either left, right, up or down)
+        (either left, right, up or down) or its integer code
         :return: int,int corresponding to the coordinates of the destination
         """
-        if direction == "left":
-            destPosY, destPosX = (i, j - 1)
-        elif direction == "right":
-            destPosY, destPosX = (i, j + 1)
-        elif direction == "up":
-            destPosY, destPosX = (i - 1, j)
-        elif direction == "down":
-            destPosY, destPosX = (i + 1, j)
-        else:
-            raise ValueError("Direction not valid")
-        return destPosY, destPosX
+        cellId = self.cellIdsTable[i][j]
+        destination = self.neighborsTable[cellId][self.directionCode(direction)]
+        if destination < 0:
+            raise ValueError("Move not valid")
+        return self.cellPositionsTable[destination]
+
+    def destinationCells(self, cellIds, directionCodes):
+        """
+        Return the destination case ids of a batch of moves (-1 for the
+        blocked moves)
+
+        :cellIds: array of origin case ids
+        :directionCodes: array of direction codes (same shape as [cellIds])
+        :return: array of destination case ids
+        """
+        return self.neighbors[cellIds, directionCodes]
@@ -0,0 +1,227 @@
+import threading
+import time
+
+from grid import DIRECTIONS
+from solver import AdaptiveAStarSolver
+from transposition import TranspositionTable
+
+
+class HintEngine:
+    """
+    Python Class giving hints (the first move of a shortest solution) for the
+    states of a Board, the searches run in a background thread so the game
+    loop never waits for them
+
+    The solutions found are kept in a TranspositionTable: as long as the
+    player follows the plan the next hint is read from the table at once.
+    When the player deviates, the new state is searched by an
+    AdaptiveAStarSolver sharing the bounds learned by the previous searches,
+    which expands far fewer states than a search from scratch. Only the last
+    requested state is searched, the requests made while a search runs
+    replace each other.
+
+    It reports the latency of each hint (between the request and the hint
+    being available) in latencies.
+    """
+
+    def __init__(self, table=None, onReady=None):
+        """
+        Creation of the engine (the thread is started by the first search)
+
+        :table: TranspositionTable of the boards (created with the first
+        board if None)
+        :onReady: function without argument called from the thread of the
+        engine when a hint searched in the background is available
+        """
+        self.table = table
+        self.onReady = onReady
+        self.learned = {}  # bounds shared by the solvers (see AdaptiveAStarSolver)
+        self.solver = None
+
+        # The table is shared with the thread of the engine
+        self.tableLock = threading.Lock()
+        self.condition = threading.Condition()
+        self.pending = None  # (solver, state, request time) waiting for the thread
+        self.thread = None
+        self.running = True
+
+        self.requestedState = None
+        self.hint = None  # (state, direction string or None if won)
+        self.latencies = []  # (seconds, True if read from the table)
+
+    def prepare(self, board):
+        """
+        Create the solver for [board] (done again only when the colors change
+        of components, e.g. new game)
+
+        :board: a Board
+        :return: nothing
+        """
+        if self.table is None:
+            self.table = TranspositionTable(board.grid)
+        encoder = self.solver.encoder if self.solver is not None else None
+        if encoder is None or encoder.colorComponents(board) != {
+            color: component for component, color in encoder.colorOfComponent.items()
+        }:
+            self.solver = AdaptiveAStarSolver(
+                board, table=self.table, learned=self.learned
+            )
+
+    def request(self, board):
+        """
+        Ask for the hint of the current state of [board], it is given at once
+        if the state is in the table, otherwise it is searched in the
+        background (see currentHint and onReady)
+
+        :board: a Board (read only in the calling thread)
+        :return: the direction string of the hint or None if it is not
+        available yet (or if the game is won or has no solution)
+        """
+        startTime = time.perf_counter()
+        self.prepare(board)
+        solver = self.solver
+        encoder = solver.encoder
+        state = encoder.encode(board)
+        self.requestedState = state
+        if not encoder.solvable or encoder.isWin(state):
+            self.hint = (state, None)
+            return None
+        with self.tableLock:
+            entry = self.table.bestMove(encoder, state)
+        if entry is not None:
+            self.hint = (state, DIRECTIONS[entry[1]])
+            self.latencies.append((time.perf_counter() - startTime, True))
+            return self.hint[1]
+
+        with self.condition:
+            self.pending = (solver, state, startTime)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.work, daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        return None
+
+    def currentHint(self):
+        """
+        Return the hint of the last requested state
+
+        :return: direction string or None if it is not available
+        """
+        hint = self.hint
+        if hint is None or hint[0] != self.requestedState:
+            return None
+        return hint[1]
+
+    def work(self):
+        """
+        Loop of the thread of the engine searching the pending requests
+
+        :return: nothing
+        """
+        while True:
+            with self.condition:
+                while self.pending is None and self.running:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                solver, state, startTime = self.pending
+                self.pending = None
+
+            solution = solver.search(state)
+            if solution is None:
+                continue
+            path = [DIRECTIONS.index(direction) for direction in solution]
+            with self.tableLock:
+                self.table.storeSolution(solver.encoder, state, path)
+
+            # The hint is only useful if the player has not moved meanwhile
+            if state == self.requestedState:
+                self.hint = (state, solution[0])
+                self.latencies.append((time.perf_counter() - startTime, False))
+                # Called under the lock so that it is never called once close
+                # has returned (e.g. pygame.event.post after pygame.quit)
+                with self.condition:
+                    if self.running and self.onReady is not None:
+                        self.onReady()
+
+    def close(self, wait=True):
+        """
+        Stop the thread of the engine (the search in progress is finished but
+        onReady is not called anymore once close has returned)
+
+        :wait: wait for the end of the thread
+        :return: nothing
+        """
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if wait and self.thread is not None:
+            self.thread.join()
+        self.thread = None
+
+    def report(self):
+        """
+        Return a summary of the latencies of the hints
+
+        :return: string
+        """
+        cached = [latency for latency, fromTable in self.latencies if fromTable]
+        searched = [latency for latency, fromTable in self.latencies if not fromTable]
+        lines = []
+        for name, values in (("from the table", cached), ("searched", searched)):
+            if values:
+                lines.append(
+                    "%d hints %s: mean %.2f ms, max %.2f ms"
+                    % (
+                        len(values),
+                        name,
+                        1000 * sum(values) / len(values),
+                        1000 * max(values),
+                    )
+                )
+        return "\n".join(lines) if lines else "no hint"
+
+
+if __name__ == "__main__":
+    import numpy as np
+
+    from board import Board
+    from solver import AStarSolver
+
+    # Default case color first (only the number of colors matters here)
+    colors = ["white", "black", "red", "green", "blue"]
+    board = Board(colors, 8)
+    board.verbose = False
+    board.reset(np.random.default_rng(0))
+    ready = threading.Event()
+    engine = HintEngine(onReady=ready.set)
+    rng = np.random.default_rng(0)
+    adaptiveNodes = scratchNodes = 0
+    moves = 0
+    while not board.checkWin() and moves < 200:
+        ready.clear()
+        hint = engine.request(board)
+        if hint is None:
+            ready.wait()
+            hint = engine.currentHint()
+            adaptiveNodes += engine.solver.nodesExpanded
+            engine.solver.nodesExpanded = 0
+            # Same search without the learned bounds nor the table
+            scratch = AStarSolver(board)
+            assert len(scratch.solve()) == len(
+                engine.table.solution(
+                    engine.solver.encoder, engine.solver.encoder.encode(board)
+                )
+            )
+            scratchNodes += scratch.nodesExpanded
+        # The player deviates from the plan one move out of four
+        if rng.random() < 0.25:
+            hint = rng.choice(list(board.legalMoves()))
+        board.move(hint)
+        moves += 1
+    engine.close()
+    print("won" if board.checkWin() else "not won", "after", moves, "moves")
+    print(engine.report())
+    print(
+        adaptiveNodes, "nodes expanded by the replanning,", scratchNodes, "from scratch"
+    )
@@ -0,0 +1,227 @@
+"""
+Opt-in instrumentation of the hot paths of the game
+
+When it is enabled the registered methods are replaced by wrappers counting
+their calls and their cumulative time, and the frames recorded by the game
+loop are kept in a histogram. When it is disabled the original methods are
+put back, so nothing is left on the call path.
+
+It is enabled by enable() or by the environment variable
+TETAHEDRON_INSTRUMENT ("1" for the counters, "profile" to also run cProfile)
+read by enableFromEnvironment(). The report is written at exit in the file
+given by TETAHEDRON_INSTRUMENT_REPORT (printed if not set).
+"""
+
+import atexit
+import cProfile
+import functools
+import io
+import os
+import pstats
+import time
+
+from board import Board
+from coloredPiece import ColoredTetahedron
+from grid import TetraGrid
+
+# Upper bounds (in seconds) of the bins of the frame time histogram
+FRAME_BINS = [0.001, 0.002, 0.004, 0.008, 0.016, 0.033, 0.066, 0.133, float("inf")]
+
+# Methods wrapped by enable(), see register
+targets = [
+    (Board, "move"),
+    (Board, "isValidMove"),
+    (TetraGrid, "isValidMove"),
+    (ColoredTetahedron, "move"),
+]
+
+enabled = False
+counters = {}  # "Class.method": [calls, cumulative time]
+frameCounts = [0] * len(FRAME_BINS)
+originals = {}  # (class, method name): original function
+profiler = None
+
+
+def register(cls, *names):
+    """
+    Add methods to the ones instrumented (wrapped at once if the
+    instrumentation is enabled)
+
+    :cls: the class of the methods
+    :names: names of the methods
+    :return: nothing
+    """
+    for name in names:
+        if (cls, name) not in targets:
+            targets.append((cls, name))
+            if enabled:
+                wrap(cls, name)
+
+
+def wrap(cls, name):
+    """
+    Replace the method [name] of [cls] by a wrapper updating its counter
+
+    :cls: a class
+    :name: name of the method
+    :return: nothing
+    """
+    function = cls.__dict__[name]
+    originals[cls, name] = function
+    counter = counters.setdefault(cls.__name__ + "." + name, [0, 0.0])
+    clock = time.perf_counter
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        startTime = clock()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            counter[0] += 1
+            counter[1] += clock() - startTime
+
+    setattr(cls, name, wrapper)
+
+
+def enable(profile=False):
+    """
+    Wrap the registered methods and start recording the frames
+
+    :profile: also run cProfile until disable is called
+    :return: nothing
+    """
+    global enabled, profiler
+    if enabled:
+        return
+    enabled = True
+    for cls, name in targets:
+        wrap(cls, name)
+    if profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+
+def disable():
+    """
+    Put back the original methods (the counters are kept, see reset)
+
+    :return: nothing
+    """
+    global enabled
+    if not enabled:
+        return
+    enabled = False
+    for (cls, name), function in originals.items():
+        setattr(cls, name, function)
+    originals.clear()
+    if profiler is not None:
+        profiler.disable()
+
+
+def reset():
+    """
+    Set the counters and the frame histogram back to zero
+
+    :return: nothing
+    """
+    global profiler
+    for counter in counters.values():
+        counter[0], counter[1] = 0, 0.0
+    frameCounts[:] = [0] * len(FRAME_BINS)
+    if profiler is not None:
+        wasProfiling = enabled
+        profiler.disable()
+        profiler = cProfile.Profile()
+        if wasProfiling:
+            profiler.enable()
+
+
+def recordFrame(duration):
+    """
+    Add the duration of an iteration of the game loop to the histogram (the
+    game loop calls it on every iteration when the instrumentation is
+    enabled, without the time spent waiting for an event)
+
+    :duration: duration in seconds
+    :return: nothing
+    """
+    for index, bound in enumerate(FRAME_BINS):
+        if duration <= bound:
+            frameCounts[index] += 1
+            return
+
+
+def report(profileLines=20):
+    """
+    Return the text report of the counters, the frame histogram and the
+    [profileLines] functions with the largest cumulative time in cProfile
+
+    :profileLines: number of lines of the cProfile statistics (if profiling)
+    :return: string
+    """
+    lines = ["%-32s %10s %12s %12s" % ("method", "calls", "total (s)", "mean (us)")]
+    for name, (calls, total) in sorted(counters.items(), key=lambda c: -c[1][1]):
+        mean = 1e6 * total / calls if calls else 0.0
+        lines.append("%-32s %10d %12.4f %12.2f" % (name, calls, total, mean))
+    frames = sum(frameCounts)
+    lines.append("")
+    lines.append("frames: %d" % frames)
+    lower = 0.0
+    for bound, count in zip(FRAME_BINS, frameCounts):
+        label = "%g-%g ms" % (1000 * lower, 1000 * bound)
+        bar = "#" * round(40 * count / frames) if frames else ""
+        lines.append("%-16s %8d %s" % (label, count, bar))
+        lower = bound
+    if profiler is not None:
+        stream = io.StringIO()
+        stats = pstats.Stats(profiler, stream=stream)
+        stats.sort_stats("cumulative").print_stats(profileLines)
+        lines.append("")
+        lines.append(stream.getvalue())
+    return "\n".join(lines)
+
+
+def dumpStats(path):
+    """
+    Write the cProfile statistics in a file readable by pstats (e.g.
+    python -m pstats [path])
+
+    :path: path of the file
+    :return: nothing
+    """
+    if profiler is None:
+        raise ValueError("cProfile was not enabled (see enable)")
+    profiler.dump_stats(path)
+
+
+def enableFromEnvironment():
+    """
+    Enable the instrumentation if TETAHEDRON_INSTRUMENT is set and write the
+    report at exit
+
+    :return: True if the instrumentation was enabled
+    """
+    mode = os.environ.get("TETAHEDRON_INSTRUMENT", "")
+    if mode in ("", "0"):
+        return False
+    enable(profile=mode == "profile")
+    atexit.register(writeReport, os.environ.get("TETAHEDRON_INSTRUMENT_REPORT"))
+    return True
+
+
+def writeReport(path=None):
+    """
+    Write the report in [path] (printed if None), the cProfile statistics
+    are also dumped in [path].prof when profiling
+
+    :path: path of the report
+    :return: nothing
+    """
+    text = report()
+    if path is None:
+        print(text)
+    else:
+        with open(path, "w") as file:
+            file.write(text)
+        if profiler is not None:
+            dumpStats(path + ".prof")
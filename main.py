@@ -1,20 +1,46 @@
-import pygame
+import time
+
+import numpy as np
+import instrumentation
 from board import Board
 
+pygame = None  # imported by the first Game (see importPygame)
+
+
+def importPygame():
+    """
+    Import pygame on first use, so that importing main (e.g. for the
+    benchmarks or the agents) does not load it
+
+    :return: the pygame module
+    """
+    global pygame
+    if pygame is None:
+        import pygame as module
+
+        pygame = module
+    return pygame
+
 
 class Game:
     """
     Class representing the Tetrahedron/Octahedron/... Game
     It has methods to display everything with pygame
+
+    The window shows the part of the board seen by a camera following the
+    piece (the whole board when it fits), the cases and the faces of the piece
+    are copied from a sprite atlas rendered once per zoom level
     """
 
     LINE_NB = 8  # Number of lines on the board (must be even)
-    shapeWidth = 90  # size of the shapes
-    shapeHeight = 90  # size of the shapes
-    borderSize = 3
+    ZOOM_SIZES = (90, 60, 40, 24, 12)  # size of the shapes for each zoom level
+    MAX_SCREEN_SIZE = (1280, 800)  # the window never gets larger
     BG_COLOR = (36, 36, 36)  # Background color
+    HINT_COLOR = "yellow"  # Color of the mark on the case of the hint
+    HINT_EVENT = None  # Posted when a background hint is ready (set by __init__)
+    FACES = ("left", "right", "other")  # faces of the piece in their drawing order
 
-    def __init__(self, colors, mode="tetra"):
+    def __init__(self, colors, mode="tetra", lineNumber=None):
         """
         Initialization of the class
 
@@ -22,10 +48,25 @@ class Game:
         being the default color)
         :mode: "tetra" (or "octa" but not implemented yet) corresponding to the
         shape of the piece the player wants to play with
+        :lineNumber: number of lines of the board (LINE_NB if None)
         """
         self.COLORS = colors
-        pygame.init()
+        if lineNumber is not None:
+            self.LINE_NB = lineNumber
+        self.agent = None  # agent playing instead of the player (see playAgentMove)
+        self.hints = None  # HintEngine while the hints are shown (see toggleHints)
+        self.recorder = None  # TrajectoryWriter of the games (see startRecording)
+        self.replayReader = None  # TrajectoryReader replayed (see startReplay)
+        importPygame()
+        self.HINT_EVENT = pygame.USEREVENT
+        # Only the display and its events are used (no audio, fonts etc.)
+        pygame.display.init()
         pygame.display.set_caption("Tetrahedron Game")
+        # Only the events handled by verifyEvents wake up the game loop
+        pygame.event.set_blocked(None)
+        pygame.event.set_allowed(
+            [pygame.QUIT, pygame.KEYDOWN, pygame.VIDEOEXPOSE, self.HINT_EVENT]
+        )
         self.updateMode(mode=mode)
 
     def updateMode(self, mode="tetra"):
@@ -37,30 +78,210 @@ class Game:
         :return: nothing
         """
         self.board = Board(self.COLORS, self.LINE_NB, mode=mode)
+        grid = self.board.grid
+        # Orientation of each case indexed by its id (see TetraGrid.isCaseUp)
+        self.casesUp = (grid.cellPositions.sum(axis=1) + grid.height // 2) % 2 == 1
         # if mode=="tetra" or True: #TODO implement mode octa
-        self.screenWidth = self.shapeWidth + (self.shapeWidth / 2 + self.borderSize) * (
-            self.board.grid.grid.shape[1] - 1
-        )
-        self.screenHeight = (
-            self.shapeHeight + self.borderSize
-        ) * self.board.grid.grid.shape[0] - self.borderSize
+        # The window fits the whole board at the closest zoom if it can
+        self.setZoom(0)
+        boardWidth, boardHeight = self.boardSize()
+        self.screenWidth = min(boardWidth, self.MAX_SCREEN_SIZE[0])
+        self.screenHeight = min(boardHeight, self.MAX_SCREEN_SIZE[1])
         self.screen = pygame.display.set_mode((self.screenWidth, self.screenHeight))
         self.running = True  # Execute the program until the user closes the window
+        self.idleTime = 0.0  # seconds waited for an event by the last verifyEvents
+        self.won = False
+        self.buildAtlas()
 
-    def drawShape(self, i, j):
+    def restart(self):
         """
-        Draw the shape (triangle if the mode is tetra etc) with
-        the selected coordinates
+        Start a new game in the same window
+
+        :return: nothing
+        """
+        if self.replayReader is not None:
+            self.showReplayFrame(self.replayIndex, 0)
+            return
+        if self.recorder is not None:
+            # The seed of each recorded game is kept with it
+            self.board.reset(seed=int(np.random.default_rng().integers(2**63)))
+        else:
+            self.board.reset()
+        self.won = False
+        self.drawnCells = None  # the window must be redrawn entirely
+        pygame.display.set_caption("Tetrahedron Game")
+        if self.hints is not None:
+            self.requestHint()
+
+    def startRecording(self, directory):
+        """
+        Record the games played from now on (by the player or the agent) in
+        [directory] (see TrajectoryWriter), a new game is started
+
+        :directory: directory of the recording
+        :return: nothing
+        """
+        from recording import TrajectoryWriter
+
+        self.recorder = TrajectoryWriter(directory, n=self.LINE_NB)
+        self.recorder.attach(self.board)
+        self.restart()
+
+    def startReplay(self, reader, index=0, movesPerSecond=4.0):
+        """
+        Play back the games of a recording instead of playing (space to pause,
+        left and right arrows to step, up and down arrows to change the speed,
+        N and P for the next and previous games and R to start the game again)
+
+        :reader: TrajectoryReader of a recording of boards of LINE_NB lines
+        :index: index of the first game replayed
+        :movesPerSecond: speed of the replay
+        :return: nothing
+        """
+        self.replayReader = reader
+        self.replaySpeed = movesPerSecond
+        self.replayPaused = False
+        self.replayIndex = None
+        self.showReplayFrame(index, 0)
+
+    def showReplayFrame(self, index, frame):
+        """
+        Put the board in the state of the game [index] of the replay after
+        [frame] moves (see TrajectoryReader.frame)
+
+        :index: index of the game (kept in the recording)
+        :frame: number of moves (kept in the game)
+        :return: nothing
+        """
+        reader = self.replayReader
+        index = min(max(index, 0), len(reader) - 1)
+        if index != self.replayIndex:
+            self.replayDirections = reader.directions(index)
+        self.replayIndex = index
+        self.replayFrame = min(max(frame, 0), len(self.replayDirections))
+        reader.frame(index, self.replayFrame, board=self.board)
+        self.nextReplayMove = time.perf_counter() + 1 / self.replaySpeed
+        self.updateReplayCaption()
+
+    def updateReplayCaption(self):
+        """
+        Show the game, the move and the speed of the replay in the title of
+        the window
+
+        :return: nothing
+        """
+        self.won = self.board.checkWin()
+        pygame.display.set_caption(
+            "Tetrahedron Game - replay of game %d/%d, move %d/%d, %g moves/s%s"
+            % (
+                self.replayIndex + 1,
+                len(self.replayReader),
+                self.replayFrame,
+                len(self.replayDirections),
+                self.replaySpeed,
+                " (paused)" if self.replayPaused else "",
+            )
+        )
+
+    def replayDelay(self):
+        """
+        Return the time before the next move of the replay
+
+        :return: seconds (0 if the move is due) or None if there is no move
+        to play (no replay, paused or end of the game)
+        """
+        if (
+            self.replayReader is None
+            or self.replayPaused
+            or self.replayFrame >= len(self.replayDirections)
+        ):
+            return None
+        return max(0.0, self.nextReplayMove - time.perf_counter())
+
+    def playReplayMove(self):
+        """
+        Play the next move of the game replayed
+
+        :return: nothing
+        """
+        self.board.move(direction=self.replayDirections[self.replayFrame])
+        self.replayFrame += 1
+        self.nextReplayMove = max(
+            self.nextReplayMove + 1 / self.replaySpeed, time.perf_counter()
+        )
+        self.updateReplayCaption()
+
+    def controlReplay(self, key):
+        """
+        Apply a key pressed during a replay (see startReplay)
+
+        :key: pygame key code
+        :return: True if the board must be rendered again
+        """
+        if key == pygame.K_SPACE:
+            self.replayPaused = not self.replayPaused
+            self.nextReplayMove = time.perf_counter()
+            self.updateReplayCaption()
+        elif key in (pygame.K_UP, pygame.K_DOWN):
+            self.replaySpeed *= 2 if key == pygame.K_UP else 0.5
+            self.nextReplayMove = time.perf_counter() + 1 / self.replaySpeed
+            self.updateReplayCaption()
+        elif key in (pygame.K_LEFT, pygame.K_RIGHT):
+            self.replayPaused = True
+            step = 1 if key == pygame.K_RIGHT else -1
+            self.showReplayFrame(self.replayIndex, self.replayFrame + step)
+            return True
+        elif key in (pygame.K_n, pygame.K_p):
+            step = 1 if key == pygame.K_n else -1
+            self.showReplayFrame(self.replayIndex + step, 0)
+            return True
+        return False
+
+    def setZoom(self, level):
+        """
+        Change the size of the shapes (see ZOOM_SIZES), the camera is centered
+        again on the piece by the next render
+
+        :level: index in ZOOM_SIZES (0 is the closest zoom)
+        :return: nothing
+        """
+        self.zoomLevel = min(max(level, 0), len(self.ZOOM_SIZES) - 1)
+        self.shapeWidth = self.shapeHeight = self.ZOOM_SIZES[self.zoomLevel]
+        self.borderSize = max(1, self.shapeWidth // 30)
+        self.camera = None  # position of the window on the board in pixels
+        if hasattr(self, "screen"):
+            self.buildAtlas()
+
+    def boardSize(self):
+        """
+        Return the size in pixels of the whole board at the current zoom
+
+        :return: (int,int) width, height
+        """
+        grid = self.board.grid
+        width = self.shapeWidth + (self.shapeWidth // 2 + self.borderSize) * (
+            grid.width - 1
+        )
+        height = (self.shapeHeight + self.borderSize) * grid.height - self.borderSize
+        return width, height
+
+    def shapeGeometry(self, i, j, up=None):
+        """
+        Return the points of the shape (triangle if the mode is tetra etc) of
+        the selected coordinates and the rectangle containing it, on the board
+        (without the camera)
 
         :i: line coordinate in the grid
         :j: column coordinate in the grid
-        :return: nothing
+        :up: orientation of the case (computed if None)
+        :return: list of points, pygame.Rect
         """
-        color = self.COLORS[int(self.board.grid.grid[i, j])]
         # if self.mode=="tetra" or True: #TODO implement mode octa
         centerX = 0.5 * self.shapeWidth + j / 2 * self.shapeWidth + j * self.borderSize
         centerY = 0.5 * self.shapeHeight + i * self.shapeHeight + i * self.borderSize
-        if self.board.grid.isCaseUp(i, j):
+        if up is None:
+            up = self.board.grid.isCaseUp(i, j)
+        if up:
             points = [
                 (centerX, centerY - 0.5 * self.shapeHeight),
                 (centerX + 0.5 * self.shapeHeight, centerY + 0.5 * self.shapeHeight),
@@ -72,18 +293,26 @@ class Game:
                 (centerX + 0.5 * self.shapeHeight, centerY - 0.5 * self.shapeHeight),
                 (centerX - 0.5 * self.shapeHeight, centerY - 0.5 * self.shapeHeight),
             ]
-        pygame.draw.polygon(self.screen, color, points)
+        # The rectangle also contains the outline drawn around the piece
+        rect = pygame.Rect(
+            centerX - 0.5 * self.shapeWidth - 1,
+            centerY - 0.5 * self.shapeHeight - 1,
+            self.shapeWidth + 3,
+            self.shapeHeight + 3,
+        )
+        return points, rect
 
-    def drawPiece(self, i, j):
+    def pieceGeometry(self, i, j, up=None):
         """
-        Draw the player's piece (tetrahedron if the mode is tetra etc) with the
-        selected coordinates)
+        Return the faces of the player's piece (tetrahedron if the mode is
+        tetra etc) at the selected coordinates and the lines between them, on
+        the board (without the camera)
 
         :i: line coordinate in the grid
         :j: column coordinate in the grid
-        :return: nothing
+        :up: orientation of the case (computed if None)
+        :return: list of the points of each face of FACES, list of lines
         """
-        color = self.COLORS[int(self.board.grid.grid[i, j])]
         # if self.mode=="tetra" or True: #TODO implement mode octa
         centerX = 0.5 * self.shapeWidth + j / 2 * self.shapeWidth + j * self.borderSize
         centerY = 0.5 * self.shapeHeight + i * self.shapeHeight + i * self.borderSize
@@ -94,68 +323,416 @@ class Game:
         upperRight = centerX + 0.5 * self.shapeHeight, centerY - 0.5 * self.shapeHeight
         lowerMiddle = centerX, centerY + 0.5 * self.shapeHeight
         upperMiddle = centerX, centerY - 0.5 * self.shapeHeight
-        if self.board.grid.isCaseUp(i, j):
-            leftFace = [upperMiddle, center, lowerLeft]
-            rightFace = [upperMiddle, center, lowerRight]
-            otherFace = [lowerLeft, center, lowerRight]
+        if up is None:
+            up = self.board.grid.isCaseUp(i, j)
+        if up:
+            faces = [
+                [upperMiddle, center, lowerLeft],
+                [upperMiddle, center, lowerRight],
+                [lowerLeft, center, lowerRight],
+            ]
+            lines = [[lowerLeft, center], [lowerRight, center], [upperMiddle, center]]
         else:
-            leftFace = [upperLeft, center, lowerMiddle]
-            rightFace = [upperRight, center, lowerMiddle]
-            otherFace = [upperLeft, center, upperRight]
-        leftColor = self.COLORS[int(self.board.playerPiece.faces["left"])]
-        rightColor = self.COLORS[int(self.board.playerPiece.faces["right"])]
-        otherColor = self.COLORS[int(self.board.playerPiece.faces["other"])]
-        pygame.draw.polygon(self.screen, leftColor, leftFace)
-        pygame.draw.polygon(self.screen, rightColor, rightFace)
-        pygame.draw.polygon(self.screen, otherColor, otherFace)
-        if self.board.grid.isCaseUp(i, j):
-            pygame.draw.polygon(self.screen, "black", [lowerLeft, center], width=3)
-            pygame.draw.polygon(self.screen, "black", [lowerRight, center], width=3)
-            pygame.draw.polygon(self.screen, "black", [upperMiddle, center], width=3)
+            faces = [
+                [upperLeft, center, lowerMiddle],
+                [upperRight, center, lowerMiddle],
+                [upperLeft, center, upperRight],
+            ]
+            lines = [[upperLeft, center], [upperRight, center], [lowerMiddle, center]]
+        return faces, lines
+
+    def buildAtlas(self):
+        """
+        Render once at the current zoom, on one off-screen surface, the cases
+        of each color facing up and down, the faces of the piece in each color
+        and its outline, the next call to render redraws everything
+
+        The sprites are drawn with the geometry of the case (0, 0) or (0, 1)
+        and copied with an integer offset, so they give the same pixels as the
+        shapes drawn in place
+
+        :return: nothing
+        """
+        self.spriteSize = self.shapeWidth + 3
+        columns = 2 * len(self.COLORS)
+        self.atlas = pygame.Surface(
+            (columns * self.spriteSize, (len(self.FACES) + 2) * self.spriteSize),
+            pygame.SRCALPHA,
+        )
+        self.sprites = {}  # key: area of the sprite in the atlas
+        for i, j in ((0, 0), (0, 1)):
+            up = bool(self.board.grid.isCaseUp(i, j))
+            points, rect = self.shapeGeometry(i, j, up)
+            # Shapes of the case (i, j) moved to the origin of a sprite
+            offset = (-rect.x, -rect.y)
+            faces, lines = self.pieceGeometry(i, j, up)
+            for value, color in enumerate(self.COLORS):
+                area = self.spriteArea(0, 2 * value + up)
+                self.sprites["case", up, value] = area
+                self.drawOn(area, offset, color, points)
+                for face, facePoints in enumerate(faces):
+                    area = self.spriteArea(1 + face, 2 * value + up)
+                    self.sprites["face", up, face, value] = area
+                    self.drawOn(area, offset, color, facePoints)
+            area = self.spriteArea(1 + len(faces), int(up))
+            self.sprites["outline", up] = area
+            for line in lines:
+                self.drawOn(area, offset, "black", line, width=3)
+        self.drawnCells = None  # values of the visible cases at the last render
+        self.drawnPiece = None  # position and faces displayed by the last render
+        self.drawnHint = None  # case of the hint displayed by the last render
+
+    def spriteArea(self, row, column):
+        """
+        Return the area of a sprite in the atlas
+
+        :row: line of the sprite in the atlas
+        :column: column of the sprite in the atlas
+        :return: pygame.Rect
+        """
+        size = self.spriteSize
+        return pygame.Rect(column * size, row * size, size, size)
+
+    def drawOn(self, area, offset, color, points, width=0):
+        """
+        Draw a polygon in a sprite of the atlas
+
+        :area: pygame.Rect of the sprite in the atlas
+        :offset: (x, y) added to the points to move them in the sprite
+        :color: pygame color
+        :points: list of points of the polygon
+        :width: width of the lines (0 to fill the polygon)
+        :return: nothing
+        """
+        self.atlas.set_clip(area)
+        pygame.draw.polygon(
+            self.atlas,
+            color,
+            [(x + offset[0] + area.x, y + offset[1] + area.y) for x, y in points],
+            width=width,
+        )
+        self.atlas.set_clip(None)
+
+    def followPiece(self):
+        """
+        Move the camera so that the piece stays in the middle half of the
+        window (the camera centers the board if it fits in the window)
+
+        :return: True if the camera moved
+        """
+        boardSize = self.boardSize()
+        screenSize = (self.screenWidth, self.screenHeight)
+        i, j = self.board.playerPosition
+        piece = (
+            j * (self.shapeWidth // 2 + self.borderSize) + self.shapeWidth // 2,
+            i * (self.shapeHeight + self.borderSize) + self.shapeHeight // 2,
+        )
+        camera = []
+        for axis in (0, 1):
+            size, screen = boardSize[axis], screenSize[axis]
+            if size <= screen:
+                camera.append((size - screen) // 2)
+                continue
+            position = None if self.camera is None else self.camera[axis]
+            if position is None or not (
+                screen // 4 <= piece[axis] - position <= screen - screen // 4
+            ):
+                position = min(max(piece[axis] - screen // 2, 0), size - screen)
+            camera.append(position)
+        camera = tuple(camera)
+        moved = camera != self.camera
+        self.camera = camera
+        return moved
+
+    def visibleCells(self):
+        """
+        Return the ids of the cases of the board seen by the camera (with the
+        ones partially visible)
+
+        :return: array of case ids
+        """
+        stepX = self.shapeWidth // 2 + self.borderSize
+        stepY = self.shapeHeight + self.borderSize
+        cameraX, cameraY = self.camera
+        ids = self.board.grid.cellIds[
+            max(0, (cameraY - self.spriteSize) // stepY) : max(
+                0, (cameraY + self.screenHeight) // stepY + 2
+            ),
+            max(0, (cameraX - self.spriteSize) // stepX) : max(
+                0, (cameraX + self.screenWidth) // stepX + 2
+            ),
+        ]
+        return ids[ids >= 0]
+
+    def caseSprites(self, caseIds, values):
+        """
+        Return the blit sequence of cases (the ones of the default color
+        first, as the colored cases are drawn on top of them)
+
+        :caseIds: array of case ids
+        :values: array of the values of the cases to draw
+        :return: list of (atlas, position, area)
+        """
+        positions = self.board.grid.cellPositions[caseIds]
+        stepX = self.shapeWidth // 2 + self.borderSize
+        stepY = self.shapeHeight + self.borderSize
+        xs = (positions[:, 1] * stepX - 1 - self.camera[0]).tolist()
+        ys = (positions[:, 0] * stepY - 1 - self.camera[1]).tolist()
+        ups = self.casesUp[caseIds].tolist()
+        values = values.tolist()
+        default = self.board.defaultCaseValue
+        order = sorted(range(len(values)), key=lambda k: values[k] != default)
+        return [
+            (self.atlas, (xs[k], ys[k]), self.sprites["case", ups[k], values[k]])
+            for k in order
+        ]
+
+    def drawShape(self, i, j):
+        """
+        Draw the shape (triangle if the mode is tetra etc) with
+        the selected coordinates
+
+        :i: line coordinate in the grid
+        :j: column coordinate in the grid
+        :return: nothing
+        """
+        caseId = self.board.grid.cellIdsTable[i][j]
+        value = np.array([self.board.grid.cells[caseId]])
+        self.screen.blits(self.caseSprites([caseId], value), doreturn=False)
+
+    def drawPiece(self, i, j):
+        """
+        Draw the player's piece (tetrahedron if the mode is tetra etc) with the
+        selected coordinates)
+
+        :i: line coordinate in the grid
+        :j: column coordinate in the grid
+        :return: nothing
+        """
+        up = bool(self.casesUp[self.board.grid.cellIdsTable[i][j]])
+        position = (
+            j * (self.shapeWidth // 2 + self.borderSize) - 1 - self.camera[0],
+            i * (self.shapeHeight + self.borderSize) - 1 - self.camera[1],
+        )
+        faces = self.board.playerPiece.faces
+        sprites = [
+            (self.atlas, position, self.sprites["face", up, face, int(faces[name])])
+            for face, name in enumerate(self.FACES)
+        ]
+        sprites.append((self.atlas, position, self.sprites["outline", up]))
+        self.screen.blits(sprites, doreturn=False)
+
+    def drawHint(self, i, j):
+        """
+        Mark the case of the selected coordinates as the destination of the
+        hint
+
+        :i: line coordinate in the grid
+        :j: column coordinate in the grid
+        :return: nothing
+        """
+        points, _ = self.shapeGeometry(i, j)
+        center = (
+            sum(x for x, _ in points) / len(points) - self.camera[0],
+            sum(y for _, y in points) / len(points) - self.camera[1],
+        )
+        pygame.draw.circle(self.screen, self.HINT_COLOR, center, self.shapeHeight / 8)
+
+    def hintCase(self):
+        """
+        Return the case where the hint leads the piece
+
+        :return: (int,int) or None if there is no hint to display
+        """
+        if self.hints is None or self.won:
+            return None
+        direction = self.hints.currentHint()
+        if direction is None:
+            return None
+        return self.board.grid.getDestinationPosition(
+            *self.board.playerPosition, direction=direction
+        )
+
+    def toggleHints(self):
+        """
+        Show or hide the hints (the next move of a shortest solution)
+
+        :return: nothing
+        """
+        if self.hints is None:
+            from hints import HintEngine
+
+            self.hints = HintEngine(
+                onReady=lambda: pygame.event.post(pygame.event.Event(self.HINT_EVENT))
+            )
+            self.requestHint()
         else:
-            pygame.draw.polygon(self.screen, "black", [upperLeft, center], width=3)
-            pygame.draw.polygon(self.screen, "black", [upperRight, center], width=3)
-            pygame.draw.polygon(self.screen, "black", [lowerMiddle, center], width=3)
+            # The search in progress is not waited for
+            self.hints.close(wait=False)
+            print(self.hints.report())
+            self.hints = None
+
+    def requestHint(self):
+        """
+        Ask the hint engine for the hint of the current state, the window is
+        updated when it is available (see HINT_EVENT)
+
+        :return: nothing
+        """
+        self.hints.request(self.board)
 
     def render(self):
         """
-        Display the board with the player's piece at current state
+        Display the part of the board seen by the camera with the player's
+        piece at current state
+        Only the visible cases that changed since the last render (and the
+        previous and current cases of the piece) are drawn again and updated
+        on the display, everything is redrawn when the camera moves
+        The case under the piece is hidden by the piece so it is drawn with
+        the default color
         """
-        self.screen.fill(self.BG_COLOR)
-        playerX, playerY = self.board.playerPosition
-        for i, j in self.board.grid.validIndices:
-            self.drawShape(i, j)
-        self.drawPiece(playerX, playerY)
-        pygame.display.update()
+        grid = self.board.grid
+        cells = grid.cells
+        piece = (
+            self.board.playerPosition,
+            tuple(self.board.playerPiece.faces.values()),
+        )
+        pieceId = grid.cellIdsTable[piece[0][0]][piece[0][1]]
+        hint = self.hintCase()
+        default = self.board.defaultCaseValue
+        if self.followPiece() or self.drawnCells is None:
+            self.visibleIds = self.visibleCells()
+            values = cells[self.visibleIds]
+            values[self.visibleIds == pieceId] = default
+            self.screen.fill(self.BG_COLOR)
+            self.screen.blits(self.caseSprites(self.visibleIds, values), doreturn=False)
+            self.drawPiece(*piece[0])
+            if hint is not None:
+                self.drawHint(*hint)
+            pygame.display.update()
+            self.drawnCells = cells[self.visibleIds]
+        else:
+            visibleCells = cells[self.visibleIds]
+            dirtyCases = {
+                grid.cellPositionsTable[caseId]
+                for caseId in self.visibleIds[visibleCells != self.drawnCells]
+            }
+            if piece != self.drawnPiece:
+                dirtyCases.update((piece[0], self.drawnPiece[0]))
+            if hint != self.drawnHint:
+                dirtyCases.update(case for case in (hint, self.drawnHint) if case)
+            if not dirtyCases:
+                return
+            # Number of cases on each side whose rectangle overlaps the one of a
+            # case (the neighbors on the same line at the closest zoom)
+            reachX = (self.spriteSize - 1) // (self.shapeWidth // 2 + self.borderSize)
+            reachY = (self.spriteSize - 1) // (self.shapeHeight + self.borderSize)
+            dirtyRects = []
+            for i, j in dirtyCases:
+                _, rect = self.shapeGeometry(i, j, up=True)  # same rect facing down
+                rect.move_ip(-self.camera[0], -self.camera[1])
+                dirtyRects.append(rect)
+                self.screen.set_clip(rect)
+                self.screen.fill(self.BG_COLOR, rect)
+                # Redraw the parts of the neighbors covered by the rectangle
+                neighbors = grid.cellIds[
+                    max(0, i - reachY) : i + reachY + 1,
+                    max(0, j - reachX) : j + reachX + 1,
+                ].ravel()
+                neighbors = neighbors[neighbors >= 0]
+                values = cells[neighbors]
+                values[neighbors == pieceId] = default
+                self.screen.blits(self.caseSprites(neighbors, values), doreturn=False)
+                for case, draw in ((piece[0], self.drawPiece), (hint, self.drawHint)):
+                    if (
+                        case is not None
+                        and abs(case[0] - i) <= reachY
+                        and abs(case[1] - j) <= reachX
+                    ):
+                        draw(*case)
+            self.screen.set_clip(None)
+            pygame.display.update(dirtyRects)
+            self.drawnCells = visibleCells
+        self.drawnPiece = piece
+        self.drawnHint = hint
 
-    def verifyEvents(self):
+    def verifyEvents(self, wait=False, timeout=None):
         """
         Looks for Pygame events such as key inputs in order to update the board
+        (arrows to move, R to restart, H to show or hide the hints, + and - to
+        zoom and Escape to quit, see controlReplay during a replay)
+
+        :wait: block until an event arrives if there is none in the queue
+        :timeout: longest wait in seconds (no limit if None)
+        :return: True if the board must be rendered again
         """
-        for event in pygame.event.get():
+        events = pygame.event.get()
+        self.idleTime = 0.0
+        if wait and not events:
+            idleStart = time.perf_counter()
+            if timeout is None:
+                events = [pygame.event.wait()]
+            else:
+                # (a timeout of 0 ms would wait without limit)
+                events = [pygame.event.wait(max(1, int(1000 * timeout)))]
+            self.idleTime = time.perf_counter() - idleStart
+        changed = False
+        for event in events:
             if event.type == pygame.QUIT:
                 self.running = False
+            elif event.type == pygame.VIDEOEXPOSE:
+                self.drawnCells = None  # the window must be redrawn entirely
+                changed = True
+            elif event.type == self.HINT_EVENT:
+                changed = self.hints is not None
             elif event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_LEFT and game.board.isValidMove(
-                    direction="left"
-                ):
-                    self.board.move(direction="left")
-                elif event.key == pygame.K_RIGHT and game.board.isValidMove(
-                    direction="right"
-                ):
-                    self.board.move(direction="right")
-                elif event.key == pygame.K_UP and game.board.isValidMove(
-                    direction="up"
-                ):
-                    self.board.move(direction="up")
-                elif event.key == pygame.K_DOWN and game.board.isValidMove(
-                    direction="down"
-                ):
-                    self.board.move(direction="down")
+                if event.key == pygame.K_ESCAPE:
+                    self.running = False
+                elif event.key == pygame.K_r:
+                    self.restart()
+                    changed = True
+                elif event.key == pygame.K_h:
+                    self.toggleHints()
+                    changed = True
+                elif event.key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+                    self.setZoom(self.zoomLevel - 1)
+                    changed = True
+                elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                    self.setZoom(self.zoomLevel + 1)
+                    changed = True
+                elif self.replayReader is not None:
+                    changed = self.controlReplay(event.key) or changed
+                elif not self.won:
+                    direction = {
+                        pygame.K_LEFT: "left",
+                        pygame.K_RIGHT: "right",
+                        pygame.K_UP: "up",
+                        pygame.K_DOWN: "down",
+                    }.get(event.key)
+                    if direction and self.board.isValidMove(direction=direction):
+                        self.board.move(direction=direction)
+                        if self.hints is not None:
+                            self.requestHint()
+                        changed = True
+        return changed
+
+    def playAgentMove(self):
+        """
+        Let the agent choose and play the next move (an agent has a method
+        chooseMove(board) returning a direction string, see MCTSAgent)
+
+        :return: nothing
+        """
+        direction = self.agent.chooseMove(self.board)
+        if direction is not None:
+            self.board.move(direction=direction)
+            if self.hints is not None:
+                self.requestHint()
 
     def displayMessage(self, msg):
         """
-        Display the message to the player
+        Display the message to the player (in the title of the window and in
+        the terminal)
 
         :msg: string representing the message
         :return: nothing
@@ -163,49 +740,90 @@ class Game:
         #  font_style = pygame.font.SysFont(None,100)
         #  renderedMsg = font_style.render(msg,True,"red")
         #  self.screen.blit(renderedMsg,[self.screenWidth/2,self.screenHeight/2])
+        pygame.display.set_caption("Tetrahedron Game - " + msg)
         print(msg)
 
-    def wantsToContinue(self):
-        """
-        Ask the player weither or not he wants to continue playing
 
-        :return: boolean corresponding to the response
-        """
-        prompt = "Do you want to play again ? (y/n) "
-        while True:
-            try:
-                return {"y": True, "n": False}[input(prompt).lower()]
-            except KeyError:
-                print("Invalid input please enter True or False!")
+# Methods counted when the instrumentation is enabled
+instrumentation.register(Game, "render", "verifyEvents")
 
 
 if __name__ == "__main__":
+    import sys
+
+    # Counters and profiling if TETAHEDRON_INSTRUMENT is set
+    instrumentation.enableFromEnvironment()
+
     # !!! Default case color value first
     colors = ["white", "black", "red", "green", "blue"]
-    wantsToContinue = True
-    while wantsToContinue:
-        # Create Game
-        game = Game(colors, mode="tetra")
 
-        # Game loop
-        while game.running:
-            # Verify Pygame events
-            game.verifyEvents()
+    # python main.py [lines] [mcts | policy] [record DIRECTORY | replay DIRECTORY [game]]
+    arguments = sys.argv[1:]
+    recordDirectory = replayDirectory = None
+    if "record" in arguments:
+        recordDirectory = arguments.pop(arguments.index("record") + 1)
+    if "replay" in arguments:
+        replayDirectory = arguments.pop(arguments.index("replay") + 1)
+    numbers = [int(arg) for arg in arguments if arg.isdigit()]
+
+    # Create Game (python main.py 64 for a board of 64 lines)
+    if replayDirectory is not None:
+        from recording import TrajectoryReader
+
+        reader = TrajectoryReader(replayDirectory)
+        game = Game(colors, mode="tetra", lineNumber=reader.header["lines"])
+        game.startReplay(reader, index=numbers[0] if numbers else 0)
+    else:
+        game = Game(colors, mode="tetra", lineNumber=numbers[0] if numbers else None)
+    if "mcts" in arguments:
+        # The MCTS agent plays (python main.py mcts)
+        from mcts import MCTSAgent
 
+        game.agent = MCTSAgent(timeBudget=0.5)
+    elif "policy" in arguments:
+        # The network trained by policy.py plays (python main.py policy)
+        from policy import PolicyAgent, PolicyNetwork, policyPath
+
+        game.agent = PolicyAgent(PolicyNetwork.load(policyPath(game.LINE_NB)))
+    if recordDirectory is not None:
+        game.startRecording(recordDirectory)
+    game.render()
+
+    # Game loop, it sleeps until an event arrives (unless the agent is
+    # playing or a move of the replay is due) and renders only the changes
+    while game.running:
+        frameStart = time.perf_counter()
+        agentTurn = game.agent is not None and not game.won
+        # Verify Pygame events
+        replayDelay = game.replayDelay()
+        changed = game.verifyEvents(
+            wait=not agentTurn and replayDelay != 0, timeout=replayDelay
+        )
+        if agentTurn:
+            game.playAgentMove()
+            changed = True
+        elif game.replayDelay() == 0:
+            game.playReplayMove()
+            changed = True
+        if changed:
             # Display the board
             game.render()
 
             # Check if the player has won
-            if game.board.checkWin():
-                game.displayMessage("You Won!")
-                pygame.time.delay(200)
-                game.running = False
-
-            # Wait
-            pygame.time.delay(200)
-
-        # Quit Pygame
-        pygame.quit()
+            if not game.won and game.board.checkWin():
+                game.won = True
+                game.displayMessage("You Won! Press R to play again or Escape to quit")
+        if instrumentation.enabled:
+            # Whole iteration (events, move of the agent or of the replay,
+            # rendering) without the time spent waiting for an event
+            instrumentation.recordFrame(
+                time.perf_counter() - frameStart - game.idleTime
+            )
 
-        # Ask the user to play again
-        wantsToContinue = game.wantsToContinue()
+    # Quit Pygame
+    if game.hints is not None:
+        game.hints.close()
+        print(game.hints.report())
+    if game.recorder is not None:
+        game.recorder.close()
+    pygame.quit()
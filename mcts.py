@@ -0,0 +1,315 @@
+import math
+import time
+
+import numpy as np
+
+from grid import DIRECTIONS
+from solver import StateEncoder
+
+
+class MCTSNode:
+    """
+    Python Class representing a state of the search tree of MCTSAgent
+    """
+
+    __slots__ = ("state", "children", "untried", "visits", "value")
+
+    def __init__(self, state, moves):
+        """
+        Creation of a leaf
+
+        :state: packed state (see StateEncoder)
+        :moves: direction codes of the valid moves from [state]
+        """
+        self.state = state
+        self.children = {}  # direction code: MCTSNode
+        self.untried = moves
+        self.visits = 0
+        self.value = 0.0  # sum of the rewards of the rollouts
+
+    def size(self):
+        """
+        Return the number of nodes of the subtree
+
+        :return: an integer
+        """
+        size = 0
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            size += 1
+            stack.extend(node.children.values())
+        return size
+
+
+class MCTSAgent:
+    """
+    Python Class playing a Board with a Monte Carlo Tree Search (UCT) run for
+    a time budget and/or a node budget before each move
+
+    The tree holds the packed states of StateEncoder (no copy of the board).
+    Each new leaf is evaluated by [rolloutBatch] random games of at most
+    [rolloutDepth] moves played together with numpy: a won rollout is worth
+    [discount] ** length, an unfinished one is worth [discount] ** (length +
+    estimate), the estimate being the weight of the minimum spanning tree
+    joining the piece and the colored cases (see AStarSolver.heuristic) plus
+    a cost per color to pick up. The subtree of the move played is kept for the next
+    decision.
+
+    After each decision it reports rollouts, rolloutsPerSecond, treeSize and
+    wallTime.
+    """
+
+    def __init__(
+        self,
+        timeBudget=1.0,
+        nodeBudget=None,
+        rolloutBatch=16,
+        rolloutDepth=4,
+        exploration=0.1,
+        discount=0.98,
+        seed=None,
+    ):
+        """
+        Creation of the agent
+
+        :timeBudget: maximal number of seconds per move (no limit if None)
+        :nodeBudget: maximal number of nodes of the tree (no limit if None)
+        :rolloutBatch: number of rollouts evaluating each leaf
+        :rolloutDepth: maximal number of moves of a rollout
+        :exploration: exploration constant of UCT
+        :discount: factor applied to the reward of a win for each move
+        :seed: seed of the numpy random Generator of the rollouts
+        """
+        assert timeBudget is not None or nodeBudget is not None
+        self.timeBudget = timeBudget
+        self.nodeBudget = nodeBudget
+        self.rolloutBatch = rolloutBatch
+        self.rolloutDepth = rolloutDepth
+        self.exploration = exploration
+        self.discount = discount
+        self.rng = np.random.default_rng(seed)
+
+        self.encoder = None
+        self.root = None
+        self.rollouts = 0
+        self.rolloutsPerSecond = 0.0
+        self.treeSize = 0
+        self.wallTime = 0.0
+
+    def prepare(self, board):
+        """
+        Create the encoder and the numpy tables of the rollouts for [board]
+        (done again only when the colors change of components, e.g. new game)
+
+        :board: a Board
+        :return: nothing
+        """
+        self.encoder = encoder = StateEncoder(board)
+        grid = board.grid
+        self.neighbors = grid.neighbors
+        self.components = grid.cellComponents.astype(np.int64) - 1
+        self.validCounts = (grid.neighbors >= 0).sum(axis=1)
+        # validMoves[caseId, k] is the k-th valid direction code of the case
+        self.validMoves = np.argsort(grid.neighbors < 0, axis=1, kind="stable")
+        self.shifts = [encoder.shifts[k] for k in range(1, 5)]
+
+        # Strip coordinates giving the number of moves between two cases
+        self.strips = grid.stripCoordinates.astype(np.int64)
+        self.root = None
+
+    def validMovesOf(self, state):
+        """
+        Return the direction codes of the valid moves from [state]
+
+        :state: a packed state
+        :return: list of direction codes
+        """
+        playerId = state & self.encoder.mask
+        return self.validMoves[playerId, : self.validCounts[playerId]].tolist()
+
+    def rollout(self, state):
+        """
+        Play [rolloutBatch] random games from [state] together
+
+        :state: a packed state
+        :return: the mean reward of the games
+        """
+        encoder = self.encoder
+        count = self.rolloutBatch
+        rows = np.arange(count)
+        pieceCode = encoder.pieceCode
+        players = np.full(count, state & encoder.mask, dtype=np.int64)
+        fields = np.tile(
+            [(state >> shift) & encoder.mask for shift in self.shifts], (count, 1)
+        )
+        rewards = np.zeros(count)
+        running = np.ones(count, dtype=bool)
+        for step in range(1, self.rolloutDepth + 1):
+            # A random valid move for each game
+            choices = (self.rng.random(count) * self.validCounts[players]).astype(
+                np.int64
+            )
+            destinations = self.neighbors[players, self.validMoves[players, choices]]
+            # The landing face exchanges its color with the destination case
+            components = self.components[destinations]
+            field = fields[rows, components]
+            fields[rows, components] = np.where(
+                running & (field == destinations),
+                pieceCode,
+                np.where(running & (field == pieceCode), destinations, field),
+            )
+            players = np.where(running, destinations, players)
+            won = running & (fields == pieceCode).all(axis=1)
+            rewards[won] = self.discount**step
+            running &= ~won
+            if not running.any():
+                return rewards.mean()
+
+        # Unfinished games: the moves left are estimated by the weight of the
+        # minimum spanning tree joining the piece and the colored cases, plus
+        # 2 moves per color to pick up (the right face has to land on it)
+        points = np.concatenate([players[:, None], fields], axis=1)
+        present = np.concatenate(
+            [np.ones((count, 1), dtype=bool), fields != pieceCode], axis=1
+        )
+        points = np.where(present, points, 0)
+        coordinates = self.strips[points]
+        distances = np.abs(coordinates[:, :, None] - coordinates[:, None]).sum(axis=3)
+        inTree = ~present
+        inTree[:, 0] = True
+        costs = np.where(inTree, np.inf, distances[:, 0])
+        weights = np.zeros(count)
+        for _ in range(4):
+            best = costs.argmin(axis=1)
+            cost = costs[rows, best]
+            added = np.isfinite(cost)
+            weights += np.where(added, cost, 0)
+            inTree[rows, best] |= added
+            costs = np.where(inTree, np.inf, np.minimum(costs, distances[rows, best]))
+        weights += 2 * present[:, 1:].sum(axis=1)
+        rewards[running] = self.discount ** (self.rolloutDepth + weights[running])
+        return rewards.mean()
+
+    def select(self, node):
+        """
+        Return the child of [node] maximizing the UCT score
+
+        :node: an MCTSNode with all its children expanded
+        :return: an MCTSNode
+        """
+        logVisits = math.log(node.visits)
+        exploration = self.exploration
+        best, bestScore = None, -1.0
+        for child in node.children.values():
+            score = child.value / child.visits + exploration * math.sqrt(
+                logVisits / child.visits
+            )
+            if score > bestScore:
+                best, bestScore = child, score
+        return best
+
+    def iterate(self):
+        """
+        Run one iteration of the search: selection, expansion, rollouts and
+        backpropagation
+
+        :return: True if a new node was added to the tree
+        """
+        encoder = self.encoder
+        node = self.root
+        path = [node]
+        while not node.untried and node.children and not encoder.isWin(node.state):
+            node = self.select(node)
+            path.append(node)
+
+        expanded = False
+        if encoder.isWin(node.state):
+            reward = 1.0
+        else:
+            if node.untried:
+                move = node.untried.pop()
+                state = encoder.nextState(node.state, move)
+                child = MCTSNode(state, self.validMovesOf(state))
+                node.children[move] = child
+                node = child
+                path.append(node)
+                expanded = True
+            if encoder.isWin(node.state):
+                reward = 1.0
+            else:
+                reward = self.rollout(node.state)
+                self.rollouts += self.rolloutBatch
+
+        for visited in reversed(path):
+            visited.visits += 1
+            visited.value += reward
+            reward *= self.discount
+        return expanded
+
+    def chooseMove(self, board):
+        """
+        Search from the current state of [board] within the budgets and
+        return the move visited the most
+
+        :board: a Board (not modified)
+        :return: a direction string or None if the game is won
+        """
+        startTime = time.perf_counter()
+        if self.encoder is None or self.encoder.colorComponents(board) != {
+            color: component
+            for component, color in self.encoder.colorOfComponent.items()
+        }:
+            self.prepare(board)
+        encoder = self.encoder
+        state = encoder.encode(board)
+        if encoder.isWin(state):
+            return None
+
+        # Reuse the subtree of the previous move if it is the current state
+        if self.root is None or self.root.state != state:
+            self.root = MCTSNode(state, self.validMovesOf(state))
+            self.treeSize = 1
+        else:
+            self.treeSize = self.root.size()
+
+        self.rollouts = 0
+        deadline = None if self.timeBudget is None else startTime + self.timeBudget
+        while True:
+            if self.iterate():
+                self.treeSize += 1
+            if self.nodeBudget is not None and self.treeSize >= self.nodeBudget:
+                break
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+
+        move = max(self.root.children, key=lambda d: self.root.children[d].visits)
+        self.root = self.root.children[move]
+        self.wallTime = time.perf_counter() - startTime
+        self.rolloutsPerSecond = self.rollouts / self.wallTime
+        return DIRECTIONS[move]
+
+
+if __name__ == "__main__":
+    from board import Board
+
+    # Default case color first (only the number of colors matters here)
+    colors = ["white", "black", "red", "green", "blue"]
+    board = Board(colors, 12)
+    board.verbose = False
+    board.reset(np.random.default_rng(0))
+    agent = MCTSAgent(timeBudget=0.1, seed=0)
+    moves = 0
+    while not board.checkWin() and moves < 200:
+        board.move(agent.chooseMove(board))
+        moves += 1
+        if moves % 25 == 0:
+            print(
+                moves,
+                "moves,",
+                round(agent.rolloutsPerSecond),
+                "rollouts/s, tree of",
+                agent.treeSize,
+                "nodes",
+            )
+    print("won" if board.checkWin() else "not won", "after", moves, "moves")
@@ -0,0 +1,604 @@
+import time
+
+import numpy as np
+
+from batchEnvironment import BatchEnvironment
+from coloredPiece import FACE_BITS, FACE_MASK, FACES
+from grid import DIRECTIONS, TetraGrid
+
+COLOR_VALUES = 5  # default color and the 4 colors of the cases
+VALUE_SCALE = 32.0  # the value head is trained on distance / VALUE_SCALE
+OUTPUTS = len(DIRECTIONS) + 1  # logits of the moves and distance to win
+
+
+def policyPath(n):
+    """
+    Return the default path of the weights of the network of the boards of
+    [n] lines
+
+    :n: number of lines of the boards
+    :return: string
+    """
+    return "policy-%d.npz" % n
+
+
+def inputSize(casesNumber):
+    """
+    Return the number of inputs of the network for a board of [casesNumber]
+    cases (see PolicyNetwork.encode)
+
+    :casesNumber: number of cases of the grid
+    :return: int
+    """
+    return (COLOR_VALUES - 1) * casesNumber + casesNumber + len(FACES) * COLOR_VALUES
+
+
+class PolicyNetwork:
+    """
+    Python Class of a multilayer perceptron written with numpy giving, for a
+    batch of states, the logits of the 4 moves (policy) and the number of
+    moves left to win (value)
+
+    The states are given as stacked arrays like BatchEnvironment (colors of
+    the cases, case of the piece and packed faces). The inputs are one-hot:
+    one plane of cases per color, one plane for the case of the piece and the
+    color of each face. Two hidden ReLU layers are followed by one layer
+    giving the logits and the value.
+
+    The inputs, the activations and the decisions are written in buffers
+    kept between the calls (grown when a larger batch comes), so the
+    inference of a batch is a few matmuls without new arrays. The arrays
+    returned are views of these buffers, valid until the next call.
+    """
+
+    def __init__(self, weights):
+        """
+        Creation of the network
+
+        :weights: dictionary of the float32 arrays W1, b1, W2, b2, W3, b3 and
+        of the number of lines of the boards (see random and load)
+        """
+        self.weights = {
+            name: np.ascontiguousarray(value, dtype=np.float32)
+            for name, value in weights.items()
+            if name != "lines"
+        }
+        self.lines = int(weights["lines"])
+        self.grid = TetraGrid(self.lines)
+        self.casesNumber = len(self.grid.cellPositions)
+        assert self.weights["W1"].shape[0] == inputSize(self.casesNumber)
+        self.capacity = 0
+
+    @classmethod
+    def random(cls, n, hidden=128, seed=None):
+        """
+        Return a network with random weights (He initialization)
+
+        :n: number of lines of the boards
+        :hidden: size of the hidden layers
+        :seed: seed of the numpy random Generator
+        :return: a PolicyNetwork
+        """
+        rng = np.random.default_rng(seed)
+        sizes = [inputSize(len(TetraGrid(n).cellPositions)), hidden, hidden, OUTPUTS]
+        weights = {"lines": n}
+        for layer, (inputs, outputs) in enumerate(zip(sizes, sizes[1:]), 1):
+            weights["W%d" % layer] = rng.normal(
+                0, np.sqrt(2 / inputs), (inputs, outputs)
+            )
+            weights["b%d" % layer] = np.zeros(outputs)
+        return cls(weights)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Return the network saved in [path]
+
+        :path: path of a .npz file written by save
+        :return: a PolicyNetwork
+        """
+        with np.load(path) as archive:
+            return cls({name: archive[name] for name in archive.files})
+
+    def save(self, path):
+        """
+        Write the weights in [path]
+
+        :path: path of the .npz file
+        :return: nothing
+        """
+        np.savez(path, lines=self.lines, **self.weights)
+
+    def reserve(self, size):
+        """
+        Allocate the buffers for batches of up to [size] states (nothing is
+        done if they are large enough)
+
+        :size: number of states
+        :return: nothing
+        """
+        if size <= self.capacity:
+            return
+        size = max(size, 2 * self.capacity)
+        hidden = self.weights["W1"].shape[1]
+        self.inputs = np.zeros((size, self.weights["W1"].shape[0]), dtype=np.float32)
+        self.hidden1 = np.zeros((size, hidden), dtype=np.float32)
+        self.hidden2 = np.zeros((size, hidden), dtype=np.float32)
+        self.outputs = np.zeros((size, OUTPUTS), dtype=np.float32)
+        self.cellMask = np.zeros((size, self.casesNumber), dtype=bool)
+        self.rows = np.arange(size)
+        self.columns = np.zeros(size, dtype=np.int64)
+        self.faceColors = np.zeros(size, dtype=np.uint16)
+        self.destinations = np.zeros((size, len(DIRECTIONS)), dtype=np.int32)
+        self.blocked = np.zeros((size, len(DIRECTIONS)), dtype=bool)
+        self.maskedLogits = np.zeros((size, len(DIRECTIONS)), dtype=np.float32)
+        self.choices = np.zeros(size, dtype=np.int64)
+        self.capacity = size
+
+    def encode(self, cells, playerCells, faces):
+        """
+        Write the inputs of a batch of states in the input buffer
+
+        :cells: (size, number of cases) colors of the cases
+        :playerCells: (size,) case id of the piece
+        :faces: (size,) packed faces of the piece
+        :return: (size, inputs) float32 view of the buffer
+        """
+        size = len(playerCells)
+        self.reserve(size)
+        inputs = self.inputs[:size]
+        inputs.fill(0)
+        casesNumber = self.casesNumber
+        mask = self.cellMask[:size]
+        for color in range(1, COLOR_VALUES):
+            np.equal(cells, color, out=mask)
+            np.copyto(inputs[:, (color - 1) * casesNumber : color * casesNumber], mask)
+        rows = self.rows[:size]
+        columns = self.columns[:size]
+        np.add(playerCells, (COLOR_VALUES - 1) * casesNumber, out=columns)
+        inputs[rows, columns] = 1
+        faceColors = self.faceColors[:size]
+        for face in range(len(FACES)):
+            np.right_shift(faces, FACE_BITS * face, out=faceColors)
+            np.bitwise_and(faceColors, FACE_MASK, out=faceColors)
+            np.add(faceColors, COLOR_VALUES * (casesNumber + face), out=columns)
+            inputs[rows, columns] = 1
+        return inputs
+
+    def forward(self, cells, playerCells, faces):
+        """
+        Evaluate a batch of states
+
+        :cells: (size, number of cases) colors of the cases
+        :playerCells: (size,) case id of the piece
+        :faces: (size,) packed faces of the piece
+        :return: (size, 4) float32 logits of the direction codes and (size,)
+        float32 estimated number of moves to win (views of the buffers)
+        """
+        weights = self.weights
+        inputs = self.encode(cells, playerCells, faces)
+        size = len(inputs)
+        layer = inputs
+        for index, buffer in ((1, self.hidden1), (2, self.hidden2), (3, self.outputs)):
+            output = buffer[:size]
+            np.matmul(layer, weights["W%d" % index], out=output)
+            output += weights["b%d" % index]
+            if index < 3:
+                np.maximum(output, 0, out=output)
+            layer = output
+        return layer[:, : len(DIRECTIONS)], layer[:, len(DIRECTIONS)]
+
+    def chooseMoves(self, cells, playerCells, faces):
+        """
+        Return the valid move of highest logit of each state of a batch
+
+        :cells: (size, number of cases) colors of the cases
+        :playerCells: (size,) case id of the piece
+        :faces: (size,) packed faces of the piece
+        :return: (size,) direction codes (view of a buffer)
+        """
+        logits, _ = self.forward(cells, playerCells, faces)
+        size = len(logits)
+        destinations = self.destinations[:size]
+        np.take(self.grid.neighbors, playerCells, axis=0, out=destinations)
+        blocked = self.blocked[:size]
+        np.less(destinations, 0, out=blocked)
+        masked = self.maskedLogits[:size]
+        np.copyto(masked, logits)
+        masked[blocked] = -np.inf
+        choices = self.choices[:size]
+        np.argmax(masked, axis=1, out=choices)
+        return choices
+
+
+class PolicyAgent:
+    """
+    Python Class playing Boards with a PolicyNetwork
+
+    With [depth] 0 the valid move of highest logit is played. Otherwise a
+    beam search keeps, at each of [depth] levels, the [beamWidth] states of
+    lowest score (number of moves + estimated distance to win + [priorWeight]
+    * -log of the probabilities of the moves given by the policy) and plays
+    the first move toward the best one (or toward a win found by it). The
+    states of all the boards decided together are expanded and evaluated in
+    the same batches.
+    """
+
+    def __init__(self, network, depth=0, beamWidth=4, priorWeight=1.0):
+        """
+        Creation of the agent
+
+        :network: a PolicyNetwork
+        :depth: number of levels of the beam search (0 to follow the policy)
+        :beamWidth: number of states kept at each level for each board
+        :priorWeight: weight of the cost of the moves given by the policy
+        """
+        self.network = network
+        self.depth = depth
+        self.beamWidth = beamWidth
+        self.priorWeight = priorWeight
+        self.environment = None  # expands the states of the search (see expand)
+        self.decisions = 0
+        self.decisionsPerSecond = 0.0
+
+    def expand(self, cells, playerCells, faces):
+        """
+        Return the states after each move from a batch of states (the row
+        4 * k + a is the move of code a from the state k)
+
+        :cells: (size, number of cases) colors of the cases
+        :playerCells: (size,) case id of the piece
+        :faces: (size,) packed faces of the piece
+        :return: cells, playerCells, faces, valid moves and won states of the
+        4 * size children (views of the arrays of a BatchEnvironment)
+        """
+        children = len(DIRECTIONS) * len(playerCells)
+        environment = self.environment
+        if environment is None or environment.size < children:
+            size = (
+                children if environment is None else max(children, 2 * environment.size)
+            )
+            environment = BatchEnvironment(self.network.lines, size)
+            self.environment = environment
+            self.actions = np.resize(np.arange(len(DIRECTIONS)), size)
+        # The rows after the children are left as they are
+        environment.cells[:children] = np.repeat(cells, len(DIRECTIONS), axis=0)
+        environment.playerCells[:children] = np.repeat(playerCells, len(DIRECTIONS))
+        environment.faces[:children] = np.repeat(faces, len(DIRECTIONS))
+        valid, _, won = environment.step(self.actions)
+        return (
+            environment.cells[:children],
+            environment.playerCells[:children],
+            environment.faces[:children],
+            valid[:children],
+            won[:children],
+        )
+
+    def chooseMoves(self, cells, playerCells, faces):
+        """
+        Decide the move of each state of a batch (none of them won)
+
+        :cells: (size, number of cases) colors of the cases
+        :playerCells: (size,) case id of the piece
+        :faces: (size,) packed faces of the piece
+        :return: (size,) array of direction codes
+        """
+        startTime = time.perf_counter()
+        size = len(playerCells)
+        if self.depth == 0:
+            decisions = self.network.chooseMoves(cells, playerCells, faces).copy()
+        else:
+            decisions = self.search(cells, playerCells, faces)
+        self.decisions = size
+        self.decisionsPerSecond = size / (time.perf_counter() - startTime)
+        return decisions
+
+    def search(self, cells, playerCells, faces):
+        """
+        Beam search of the move of each state of a batch (see PolicyAgent)
+
+        :cells: (size, number of cases) colors of the cases
+        :playerCells: (size,) case id of the piece
+        :faces: (size,) packed faces of the piece
+        :return: (size,) array of direction codes
+        """
+        size = len(playerCells)
+        decisions = np.full(size, -1, dtype=np.int64)
+        # Board, first move and cost of the moves (by the policy) of each
+        # state of the beams
+        boards = np.arange(size)
+        firstMoves = np.zeros(size, dtype=np.int64)
+        costs = np.zeros(size, dtype=np.float32)
+        logits, _ = self.network.forward(cells, playerCells, faces)
+        for level in range(1, self.depth + 1):
+            logits = logits - logits.max(axis=1, keepdims=True)
+            logits -= np.log(np.exp(logits).sum(axis=1, keepdims=True))
+            costs = (costs[:, np.newaxis] - self.priorWeight * logits).ravel()
+            cells, playerCells, faces, valid, won = self.expand(
+                cells, playerCells, faces
+            )
+            parents = np.repeat(np.arange(len(boards)), len(DIRECTIONS))
+            boards = boards[parents]
+            if level == 1:
+                firstMoves = np.resize(np.arange(len(DIRECTIONS)), len(parents))
+            else:
+                firstMoves = firstMoves[parents]
+            # A board stops at its first win (the last write of a board wins,
+            # hence the reversed order)
+            wins = np.flatnonzero(valid & won & (decisions[boards] < 0))[::-1]
+            decisions[boards[wins]] = firstMoves[wins]
+            keep = np.flatnonzero(valid & (decisions[boards] < 0))
+            if len(keep) == 0:
+                break
+            cells, playerCells, faces = cells[keep], playerCells[keep], faces[keep]
+            logits, values = self.network.forward(cells, playerCells, faces)
+            scores = level + values + costs[keep]
+
+            # The beamWidth states of lowest score of each board are kept
+            order = np.lexsort((scores, boards[keep]))
+            keep = keep[order]
+            ranks = np.arange(len(keep)) - np.searchsorted(boards[keep], boards[keep])
+            best = ranks < self.beamWidth
+            order = order[best]
+            boards, firstMoves = boards[keep[best]], firstMoves[keep[best]]
+            costs = costs[keep[best]]
+            cells, playerCells, faces = cells[order], playerCells[order], faces[order]
+            logits = logits[order]
+
+        # Otherwise the first move toward the state of lowest score (the
+        # states are sorted by board then score)
+        undecided = decisions < 0
+        firsts = np.searchsorted(boards, np.arange(size))
+        reached = undecided & (firsts < len(boards))
+        reached[reached] = boards[firsts[reached]] == np.flatnonzero(reached)
+        decisions[reached] = firstMoves[firsts[reached]]
+        # A board without any valid move keeps the move 0 (never the case on
+        # a TetraGrid)
+        decisions[decisions < 0] = 0
+        return decisions
+
+    def chooseMove(self, board):
+        """
+        Decide the move of [board] (for the game, see Game.playAgentMove)
+
+        :board: a Board (not modified)
+        :return: a direction string or None if the game is won
+        """
+        if board.checkWin():
+            return None
+        decisions = self.chooseMoves(
+            board.grid.cells[np.newaxis],
+            np.array([self.network.grid.cellIds[board.playerPosition]], dtype=np.int32),
+            np.array([board.playerPiece.packedFaces], dtype=np.uint16),
+        )
+        return DIRECTIONS[int(decisions[0])]
+
+
+def train(
+    network,
+    reader,
+    epochs=4,
+    batchSize=256,
+    learningRate=1e-3,
+    valueWeight=1.0,
+    seed=None,
+):
+    """
+    Train [network] with Adam on the records of a dataset: cross-entropy of
+    the optimal move for the policy and squared error of the distance to win
+    (divided by VALUE_SCALE) for the value
+
+    :network: a PolicyNetwork (modified)
+    :reader: a DatasetReader of boards with the same number of lines
+    :epochs: number of passes over the dataset
+    :batchSize: number of records of each gradient step
+    :learningRate: learning rate of Adam
+    :valueWeight: weight of the value loss
+    :seed: seed of the shuffling of the records
+    :return: list of (loss, accuracy of the moves, mean absolute error of the
+    distances) of each epoch
+    """
+    assert reader.manifest["lines"] == network.lines
+    rng = np.random.default_rng(seed)
+    weights = network.weights
+    beta1, beta2, epsilon = 0.9, 0.999, 1e-8
+    moments = {name: np.zeros_like(value) for name, value in weights.items()}
+    squares = {name: np.zeros_like(value) for name, value in weights.items()}
+    # The value head is trained on the distances divided by VALUE_SCALE
+    weights["W3"][:, -1] /= VALUE_SCALE
+    weights["b3"][-1] /= VALUE_SCALE
+    steps = 0
+    history = []
+    try:
+        for _ in range(epochs):
+            totalLoss = correct = absoluteError = seen = 0
+            # The records are shuffled by chunks of 64 batches
+            for chunk in reader.batches(64 * batchSize):
+                chunk = chunk[rng.permutation(len(chunk))]
+                for start in range(0, len(chunk), batchSize):
+                    batch = chunk[start : start + batchSize]
+                    size = len(batch)
+                    moves = batch["move"].astype(np.int64)
+                    targets = batch["distance"] / VALUE_SCALE
+                    logits, values = network.forward(
+                        batch["cells"], batch["playerCell"], batch["faces"]
+                    )
+                    inputs = network.inputs[:size]
+                    hidden1, hidden2 = network.hidden1[:size], network.hidden2[:size]
+
+                    # Losses and gradient of the outputs
+                    shifted = logits - logits.max(axis=1, keepdims=True)
+                    probabilities = np.exp(shifted)
+                    probabilities /= probabilities.sum(axis=1, keepdims=True)
+                    rows = np.arange(size)
+                    errors = values - targets
+                    totalLoss += np.sum(
+                        -np.log(probabilities[rows, moves] + 1e-12)
+                        + valueWeight * errors**2
+                    )
+                    correct += np.sum(np.argmax(logits, axis=1) == moves)
+                    absoluteError += np.sum(np.abs(errors)) * VALUE_SCALE
+                    seen += size
+                    outputGradient = np.empty((size, OUTPUTS), dtype=np.float32)
+                    outputGradient[:, :-1] = probabilities
+                    outputGradient[rows, moves] -= 1
+                    outputGradient[:, -1] = 2 * valueWeight * errors
+                    outputGradient /= size
+
+                    # Backpropagation through the ReLU layers
+                    gradients = {
+                        "W3": hidden2.T @ outputGradient,
+                        "b3": outputGradient.sum(axis=0),
+                    }
+                    gradient = (outputGradient @ weights["W3"].T) * (hidden2 > 0)
+                    gradients["W2"] = hidden1.T @ gradient
+                    gradients["b2"] = gradient.sum(axis=0)
+                    gradient = (gradient @ weights["W2"].T) * (hidden1 > 0)
+                    gradients["W1"] = inputs.T @ gradient
+                    gradients["b1"] = gradient.sum(axis=0)
+
+                    steps += 1
+                    stepSize = (
+                        learningRate * np.sqrt(1 - beta2**steps) / (1 - beta1**steps)
+                    )
+                    for name, gradient in gradients.items():
+                        moments[name] *= beta1
+                        moments[name] += (1 - beta1) * gradient
+                        squares[name] *= beta2
+                        squares[name] += (1 - beta2) * gradient**2
+                        weights[name] -= (
+                            stepSize
+                            * moments[name]
+                            / (np.sqrt(squares[name]) + epsilon)
+                        )
+            history.append((totalLoss / seen, correct / seen, absoluteError / seen))
+    finally:
+        # Scaled back even if the training is interrupted (e.g. Ctrl+C)
+        weights["W3"][:, -1] *= VALUE_SCALE
+        weights["b3"][-1] *= VALUE_SCALE
+    return history
+
+
+def evaluate(agent, games=1000, maxMoves=200, seed=None):
+    """
+    Play [games] random boards in lockstep with [agent] (the decisions of all
+    the boards not won are taken in one batch at each move)
+
+    :agent: a PolicyAgent
+    :games: number of boards
+    :maxMoves: number of moves before a game is lost
+    :seed: seed of the boards
+    :return: proportion of won games, mean number of moves of the won games
+    and number of decisions per second
+    """
+    environment = BatchEnvironment(agent.network.lines, games, seed)
+    lengths = np.full(games, -1)
+    actions = np.zeros(games, dtype=np.int64)
+    decisions = 0
+    startTime = time.perf_counter()
+    for move in range(1, maxMoves + 1):
+        playing = np.flatnonzero(lengths < 0)
+        if len(playing) == 0:
+            break
+        # The won boards keep their last action, they are not counted anymore
+        actions[playing] = agent.chooseMoves(
+            environment.cells[playing],
+            environment.playerCells[playing],
+            environment.faces[playing],
+        )
+        decisions += len(playing)
+        _, _, won = environment.step(actions)
+        lengths[playing[won[playing]]] = move
+    elapsed = time.perf_counter() - startTime
+    wins = lengths >= 0
+    meanLength = float(lengths[wins].mean()) if wins.any() else float("nan")
+    return float(wins.mean()), meanLength, decisions / elapsed
+
+
+def benchmark(network, batchSizes=(1, 4, 16, 64, 256, 1024, 4096), seconds=0.5):
+    """
+    Measure the decisions per second of the policy (PolicyNetwork.chooseMoves)
+    for batches of random boards
+
+    :network: a PolicyNetwork
+    :batchSizes: sizes of the batches measured
+    :seconds: minimal duration of each measure
+    :return: dictionary {batch size: decisions per second}
+    """
+    results = {}
+    for batchSize in batchSizes:
+        environment = BatchEnvironment(network.lines, batchSize, seed=0)
+        arrays = environment.cells, environment.playerCells, environment.faces
+        network.chooseMoves(*arrays)  # the buffers are allocated here
+        calls = 0
+        startTime = time.perf_counter()
+        while time.perf_counter() - startTime < seconds:
+            network.chooseMoves(*arrays)
+            calls += 1
+        results[batchSize] = calls * batchSize / (time.perf_counter() - startTime)
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from dataset import DatasetReader
+
+    parser = argparse.ArgumentParser(
+        description="Train, evaluate or benchmark the policy/value network"
+    )
+    parser.add_argument("command", choices=["train", "evaluate", "benchmark"])
+    parser.add_argument("lines", type=int)
+    parser.add_argument("--path", default=None)
+    parser.add_argument("--dataset", default=None)
+    parser.add_argument("--epochs", type=int, default=4)
+    parser.add_argument("--hidden", type=int, default=128)
+    parser.add_argument("--learning-rate", type=float, default=1e-3)
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--depth", type=int, default=0)
+    parser.add_argument("--beam", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    path = arguments.path or policyPath(arguments.lines)
+    if arguments.command == "train":
+        try:
+            network = PolicyNetwork.load(path)
+        except FileNotFoundError:
+            network = PolicyNetwork.random(
+                arguments.lines, arguments.hidden, arguments.seed
+            )
+        reader = DatasetReader(arguments.dataset)
+        startTime = time.perf_counter()
+        history = train(
+            network,
+            reader,
+            epochs=arguments.epochs,
+            learningRate=arguments.learning_rate,
+            seed=arguments.seed,
+        )
+        for epoch, (loss, accuracy, error) in enumerate(history, 1):
+            print(
+                "epoch %d: loss %.3f, move accuracy %.3f, distance error %.2f"
+                % (epoch, loss, accuracy, error)
+            )
+        print(round(time.perf_counter() - startTime, 1), "s")
+        network.save(path)
+    elif arguments.command == "evaluate":
+        agent = PolicyAgent(PolicyNetwork.load(path), arguments.depth, arguments.beam)
+        winRate, meanLength, speed = evaluate(
+            agent, arguments.games, seed=arguments.seed
+        )
+        print(
+            "won %.1f%% of %d games in %.1f moves on average, %d decisions/s"
+            % (100 * winRate, arguments.games, meanLength, speed)
+        )
+    else:
+        try:
+            network = PolicyNetwork.load(path)
+        except FileNotFoundError:
+            network = PolicyNetwork.random(
+                arguments.lines, arguments.hidden, arguments.seed
+            )
+        for batchSize, speed in benchmark(network).items():
+            print("batch %4d: %9d decisions/s" % (batchSize, speed))
@@ -0,0 +1,491 @@
+import json
+import os
+
+import numpy as np
+
+from board import Board
+from grid import DIRECTIONS, TetraGrid
+
+HEADER_NAME = "header.json"
+GAMES_NAME = "games.bin"
+MOVES_NAME = "moves.bin"
+CHECKPOINTS_NAME = "checkpoints.bin"
+
+# Default case color first (only the number of colors matters without display)
+COLORS = ["white", "black", "red", "green", "blue"]
+COLORS_NUMBER = len(COLORS) - 1
+
+# Bits of a packed move: direction code, color of the destination case before
+# the move and color left on it by the piece (see packMove)
+DIRECTION_BITS = 2
+COLOR_BITS = 3
+COLOR_MASK = (1 << COLOR_BITS) - 1
+
+
+def frameDtype():
+    """
+    Return the numpy dtype of a frame (the state of a game)
+
+    The colors are conserved (each one is either on one case or on a face of
+    the piece), so a state is the case of the piece, its packed faces and the
+    case of each color:
+    - playerCell: case id of the piece
+    - faces: packed faces of the piece (see ColoredTetahedron.packedFaces)
+    - colorCells: case id of each color after the default one (-1 if the
+      color is on a face of the piece)
+
+    :return: numpy structured dtype
+    """
+    return np.dtype(
+        [
+            ("playerCell", np.int32),
+            ("faces", np.uint16),
+            ("colorCells", np.int32, (COLORS_NUMBER,)),
+        ]
+    )
+
+
+def gameDtype():
+    """
+    Return the numpy dtype of the records of the games (one per trajectory)
+
+    - seed: seed of the placement of the color cases (-1 if unknown)
+    - start: frame of the beginning of the game
+    - moveStart: index of the first move of the game in the moves
+    - length: number of moves
+    - checkpointStart: index of the first checkpoint of the game in the
+      checkpoints (the frame after checkpointInterval moves, then after 2
+      checkpointInterval moves etc.)
+    - won: True if the last move won the game
+
+    :return: numpy structured dtype
+    """
+    return np.dtype(
+        [
+            ("seed", np.int64),
+            ("start", frameDtype()),
+            ("moveStart", np.int64),
+            ("length", np.int32),
+            ("checkpointStart", np.int64),
+            ("won", np.bool_),
+        ]
+    )
+
+
+def packMove(direction, destinationColor, leftColor):
+    """
+    Pack a move in one byte
+
+    :direction: direction code
+    :destinationColor: color of the destination case before the move
+    :leftColor: color of the destination case after the move (the previous
+    color of the face of the piece now touching it)
+    :return: int
+    """
+    return (
+        direction
+        | destinationColor << DIRECTION_BITS
+        | leftColor << (DIRECTION_BITS + COLOR_BITS)
+    )
+
+
+def unpackMoves(moves):
+    """
+    Unpack moves packed by packMove (vectorized)
+
+    :moves: uint8 array
+    :return: arrays of the direction codes, of the colors of the destinations
+    before the moves and of the colors left on them
+    """
+    moves = np.asarray(moves)
+    return (
+        moves & ((1 << DIRECTION_BITS) - 1),
+        (moves >> DIRECTION_BITS) & COLOR_MASK,
+        (moves >> (DIRECTION_BITS + COLOR_BITS)) & COLOR_MASK,
+    )
+
+
+def captureFrame(board, frame):
+    """
+    Write the state of [board] in [frame]
+
+    :board: a Board
+    :frame: record of frameDtype
+    :return: nothing
+    """
+    cells = board.grid.cells
+    i, j = board.playerPosition
+    frame["playerCell"] = board.grid.cellIdsTable[i][j]
+    frame["faces"] = board.playerPiece.packedFaces
+    colorCells = np.full(COLORS_NUMBER, -1, dtype=np.int32)
+    for caseId in np.flatnonzero(cells != board.defaultCaseValue):
+        color = int(cells[caseId])
+        if colorCells[color - 1] >= 0:
+            raise ValueError("the color %d is on several cases" % color)
+        colorCells[color - 1] = caseId
+    frame["colorCells"] = colorCells
+
+
+def restoreFrame(board, frame):
+    """
+    Put [board] in the state of [frame]
+
+    :board: a Board
+    :frame: record of frameDtype
+    :return: nothing
+    """
+    grid = board.grid
+    grid.cells[:] = board.defaultCaseValue
+    for color, caseId in enumerate(frame["colorCells"].tolist(), 1):
+        if caseId >= 0:
+            grid.cells[caseId] = color
+    board.playerPosition = grid.cellPositionsTable[int(frame["playerCell"])]
+    board.playerPiece.setPackedFaces(frame["faces"])
+    board.history.clear()
+
+
+class TrajectoryWriter:
+    """
+    Python Class recording the games played on Boards in a directory: one
+    record per game (seed and initial state), one byte per move (see
+    packMove) and a checkpoint (the full state) every checkpointInterval
+    moves, so that any frame can be rebuilt without replaying the whole game
+    (see TrajectoryReader.frame)
+
+    A Board attached to the writer reports its moves (Board.move, Board.pop)
+    and its new games (Board.reset). A game is written to the files when it is
+    finished (next game or close), the games without moves are not recorded.
+    The files are only appended to, so a directory can be extended by later
+    runs.
+    """
+
+    def __init__(self, directory, n=8, checkpointInterval=256):
+        """
+        Open the recording of [directory] (created if it does not exist)
+
+        :directory: directory of the header and of the files
+        :n: number of lines of the boards (must be even)
+        :checkpointInterval: number of moves between the checkpoints
+        """
+        self.directory = directory
+        settings = {
+            "lines": n,
+            "casesNumber": len(TetraGrid(n).cellPositions),
+            "checkpointInterval": checkpointInterval,
+        }
+        headerPath = os.path.join(directory, HEADER_NAME)
+        if os.path.exists(headerPath):
+            with open(headerPath) as file:
+                header = json.load(file)
+            for key, value in settings.items():
+                if header[key] != value:
+                    raise ValueError("%s is %r in %s" % (key, header[key], headerPath))
+        else:
+            os.makedirs(directory, exist_ok=True)
+            with open(headerPath, "w") as file:
+                json.dump(settings, file, indent=2)
+        self.checkpointInterval = checkpointInterval
+
+        # Files opened for appending, the offsets of the next game are their
+        # number of records (an interrupted game may leave moves without
+        # record, they are never read)
+        self.files = {}
+        self.counts = {}
+        for name, size in (
+            (GAMES_NAME, gameDtype().itemsize),
+            (MOVES_NAME, 1),
+            (CHECKPOINTS_NAME, frameDtype().itemsize),
+        ):
+            path = os.path.join(directory, name)
+            self.files[name] = open(path, "ab")
+            self.counts[name] = os.path.getsize(path) // size
+            self.files[name].truncate(self.counts[name] * size)
+
+        self.board = None
+        self.game = np.zeros((), dtype=gameDtype())  # game being recorded
+        self.moves = bytearray()
+        self.checkpoints = []
+
+    def attach(self, board):
+        """
+        Record the games played on [board] from its current state
+
+        :board: a Board (its recorder is set to this writer)
+        :return: nothing
+        """
+        board.recorder = self
+        self.begin(board)
+
+    def detach(self):
+        """
+        Stop recording the games of the attached board (the current game is
+        written)
+
+        :return: nothing
+        """
+        self.end()
+        if self.board is not None:
+            self.board.recorder = None
+            self.board = None
+
+    def begin(self, board, seed=None):
+        """
+        Start recording a game from the current state of [board] (the previous
+        game is written)
+
+        :board: a Board
+        :seed: seed of the placement of the color cases (None if unknown)
+        :return: nothing
+        """
+        self.end()
+        self.board = board
+        self.game["seed"] = -1 if seed is None else seed
+        captureFrame(board, self.game["start"])
+
+    def recordMove(self, direction, destinationColor, leftColor):
+        """
+        Record a move of the attached board (called by Board.move)
+
+        :direction: direction code
+        :destinationColor: color of the destination case before the move
+        :leftColor: color of the destination case after the move
+        :return: nothing
+        """
+        self.moves.append(packMove(direction, destinationColor, leftColor))
+        if len(self.moves) % self.checkpointInterval == 0:
+            frame = np.zeros((), dtype=frameDtype())
+            captureFrame(self.board, frame)
+            self.checkpoints.append(frame)
+
+    def undoMove(self):
+        """
+        Forget the last move of the attached board (called by Board.pop once
+        the board is back to its previous state)
+
+        :return: nothing
+        """
+        if not self.moves:
+            # Undone past the start of the game (attached during a game): the
+            # game is recorded again from the state reached
+            self.begin(self.board)
+            return
+        if len(self.moves) % self.checkpointInterval == 0 and self.checkpoints:
+            self.checkpoints.pop()
+        del self.moves[-1:]
+
+    def end(self):
+        """
+        Write the game being recorded (if it has moves)
+
+        :return: nothing
+        """
+        if self.board is None or not self.moves:
+            return
+        game = self.game
+        game["moveStart"] = self.counts[MOVES_NAME]
+        game["length"] = len(self.moves)
+        game["checkpointStart"] = self.counts[CHECKPOINTS_NAME]
+        game["won"] = self.board.checkWin()
+        # The game record is written last, it points to complete data
+        self.files[MOVES_NAME].write(self.moves)
+        self.files[CHECKPOINTS_NAME].write(
+            np.array(self.checkpoints, dtype=frameDtype()).tobytes()
+        )
+        self.files[GAMES_NAME].write(game.tobytes())
+        self.counts[MOVES_NAME] += len(self.moves)
+        self.counts[CHECKPOINTS_NAME] += len(self.checkpoints)
+        self.counts[GAMES_NAME] += 1
+        for file in self.files.values():
+            file.flush()
+        self.moves = bytearray()
+        self.checkpoints = []
+
+    def close(self):
+        """
+        Write the current game and close the files
+
+        :return: nothing
+        """
+        self.detach()
+        for file in self.files.values():
+            file.close()
+
+
+class TrajectoryReader:
+    """
+    Python Class reading the games recorded by TrajectoryWriter, the files are
+    memory-mapped so only the games used are loaded
+    """
+
+    def __init__(self, directory):
+        """
+        Open the recording of [directory]
+
+        :directory: directory of the header and of the files
+        """
+        self.directory = directory
+        with open(os.path.join(directory, HEADER_NAME)) as file:
+            self.header = json.load(file)
+        self.checkpointInterval = self.header["checkpointInterval"]
+        self.games = self.mapFile(GAMES_NAME, gameDtype())
+        self.moves = self.mapFile(MOVES_NAME, np.dtype(np.uint8))
+        self.checkpoints = self.mapFile(CHECKPOINTS_NAME, frameDtype())
+        self.board = None  # board of the frames (see frame)
+
+    def mapFile(self, name, dtype):
+        """
+        Memory-map the complete records of a file of the recording
+
+        :name: name of the file
+        :dtype: numpy dtype of the records
+        :return: read-only np.memmap (or empty array)
+        """
+        path = os.path.join(self.directory, name)
+        count = os.path.getsize(path) // dtype.itemsize
+        if count == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+    def __len__(self):
+        return len(self.games)
+
+    def gameMoves(self, index):
+        """
+        Return the packed moves of the game [index]
+
+        :index: index of the game
+        :return: uint8 array (see unpackMoves)
+        """
+        game = self.games[index]
+        start = int(game["moveStart"])
+        return self.moves[start : start + int(game["length"])]
+
+    def directions(self, index):
+        """
+        Return the directions of the moves of the game [index]
+
+        :index: index of the game
+        :return: list of direction strings
+        """
+        codes, _, _ = unpackMoves(self.gameMoves(index))
+        return [DIRECTIONS[code] for code in codes.tolist()]
+
+    def frame(self, index, frame, board=None):
+        """
+        Put a board in the state of the game [index] after [frame] moves, from
+        the nearest checkpoint before it
+
+        :index: index of the game
+        :frame: number of moves played (0 for the beginning, at most the
+        length of the game)
+        :board: Board of the lines of the recording updated in place (a board
+        of the reader is used if None)
+        :return: the Board
+        """
+        game = self.games[index]
+        if not 0 <= frame <= game["length"]:
+            raise IndexError("frame %d of a game of %d moves" % (frame, game["length"]))
+        if board is None:
+            if self.board is None:
+                self.board = Board(COLORS, self.header["lines"])
+                self.board.verbose = False
+            board = self.board
+        checkpoint = frame // self.checkpointInterval
+        if checkpoint == 0:
+            restoreFrame(board, game["start"])
+        else:
+            restoreFrame(
+                board, self.checkpoints[int(game["checkpointStart"]) + checkpoint - 1]
+            )
+        start = int(game["moveStart"])
+        codes, _, _ = unpackMoves(
+            self.moves[start + checkpoint * self.checkpointInterval : start + frame]
+        )
+        recorder, board.recorder = board.recorder, None
+        for code in codes.tolist():
+            board.move(DIRECTIONS[code])
+        board.recorder = recorder
+        return board
+
+    def batches(self, batchSize=65536):
+        """
+        Iterate over the games by batches with their moves
+
+        :batchSize: number of games of the batches
+        :return: iterator of (array of game records, uint8 array of their
+        packed moves, offsets of the moves of each game in this array)
+        """
+        for start in range(0, len(self.games), batchSize):
+            games = np.array(self.games[start : start + batchSize])
+            # The moves of consecutive games are contiguous
+            first = int(games["moveStart"][0])
+            last = int(games["moveStart"][-1] + games["length"][-1])
+            yield games, np.array(self.moves[first:last]), games["moveStart"] - first
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(
+        description="Record random games or summarize a recording"
+    )
+    parser.add_argument("command", choices=["record", "summary"])
+    parser.add_argument("directory")
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--moves", type=int, default=200)
+    parser.add_argument("--lines", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    if arguments.command == "record":
+        # Random walks, each frame rebuilt from the checkpoints must be the
+        # state met while recording
+        board = Board(COLORS, arguments.lines)
+        board.verbose = False
+        writer = TrajectoryWriter(arguments.directory, n=arguments.lines)
+        firstGame = writer.counts[GAMES_NAME]
+        writer.attach(board)
+        rng = np.random.default_rng(arguments.seed)
+        expected = {}
+        startTime = time.perf_counter()
+        for game in range(arguments.games):
+            board.reset(seed=arguments.seed * arguments.games + game)
+            for move in range(rng.integers(1, arguments.moves + 1)):
+                if board.checkWin():
+                    break
+                if game < 10 and rng.random() < 0.05:
+                    expected[game, move] = board.grid.cells.tobytes()
+                board.move(rng.choice(list(board.legalMoves())))
+        writer.close()
+        elapsed = time.perf_counter() - startTime
+        reader = TrajectoryReader(arguments.directory)
+        for (game, move), cells in expected.items():
+            assert reader.frame(firstGame + game, move).grid.cells.tobytes() == cells
+        print(arguments.games, "games recorded in", round(elapsed, 1), "s")
+    else:
+        reader = TrajectoryReader(arguments.directory)
+        startTime = time.perf_counter()
+        moves = won = pickups = 0
+        directions = np.zeros(len(DIRECTIONS), dtype=np.int64)
+        for games, packedMoves, _ in reader.batches():
+            codes, destinationColors, leftColors = unpackMoves(packedMoves)
+            moves += len(packedMoves)
+            won += int(games["won"].sum())
+            pickups += int(
+                np.count_nonzero((destinationColors > 0) & (leftColors == 0))
+            )
+            directions += np.bincount(codes, minlength=len(DIRECTIONS))
+        elapsed = time.perf_counter() - startTime
+        print(
+            len(reader),
+            "games,",
+            moves,
+            "moves,",
+            won,
+            "won,",
+            pickups,
+            "colors picked up, moves per direction:",
+            directions,
+            "(read in %.2f s)" % elapsed,
+        )
@@ -0,0 +1,538 @@
+import asyncio
+import concurrent.futures
+import os
+import time
+
+import numpy as np
+
+from board import Board
+from database import DatabaseSolver, openDatabase
+from grid import DIRECTIONS, DIRECTION_CODES
+from solver import AdaptiveAStarSolver
+from transposition import TranspositionTable
+
+# Default case color first (only the number of colors matters without display)
+COLORS = ["white", "black", "red", "green", "blue"]
+
+# Letters of the directions in the protocol
+LETTERS = "lrud"
+
+# Per number of lines, the board, the TranspositionTable and the
+# DistanceDatabase (or the bounds of AdaptiveAStarSolver if there is no
+# database) of the worker processes (see solveBatch)
+workerStates = {}
+
+
+def solveBatch(n, items):
+    """
+    Return a shortest solution for each state of [items] (run by the worker
+    processes of GameServer). The DistanceDatabase at the default path is
+    used if its build is complete, AdaptiveAStarSolver otherwise.
+
+    :n: number of lines of the boards
+    :items: list of (cells bytes, case id of the piece, packed faces)
+    :return: list of lists of direction codes (None if there is no solution)
+    """
+    if n not in workerStates:
+        board = Board(COLORS, n)
+        board.verbose = False
+        database = openDatabase(n)
+        workerStates[n] = board, TranspositionTable(board.grid), database, {}
+    board, table, database, learned = workerStates[n]
+    solutions = {}
+    for item in items:
+        if item not in solutions:
+            cells, playerCell, faces = item
+            board.grid.cells[:] = np.frombuffer(cells, dtype=np.int8)
+            board.playerPosition = board.grid.cellPositionsTable[playerCell]
+            board.playerPiece.setPackedFaces(faces)
+            if database is not None:
+                solver = DatabaseSolver(board, table=table, database=database)
+            else:
+                solver = AdaptiveAStarSolver(board, table=table, learned=learned)
+            solution = solver.solve()
+            solutions[item] = (
+                None if solution is None else [DIRECTION_CODES[d] for d in solution]
+            )
+    return [solutions[item] for item in items]
+
+
+class Session:
+    """
+    Python Class holding the Board of a client of GameServer and the rest of
+    the last solution sent to it
+    """
+
+    def __init__(self, n, seed=None):
+        """
+        Creation of a new game
+
+        :n: number of lines of the board
+        :seed: seed of the color cases (random if None)
+        """
+        self.board = Board(COLORS, n)
+        self.board.verbose = False
+        self.board.reset(np.random.default_rng(seed))
+        self.plan = None  # direction codes left of the last solution
+
+    def key(self):
+        """
+        Return the state of the board as sent to the worker processes
+
+        :return: (cells bytes, case id of the piece, packed faces)
+        """
+        board = self.board
+        return (
+            board.grid.cells.tobytes(),
+            int(board.grid.cellIds[board.playerPosition]),
+            board.playerPiece.packedFaces,
+        )
+
+    def describe(self):
+        """
+        Return the state of the board in the protocol format: number of
+        lines, colors of the cases (one digit per case id), case id of the
+        piece and packed faces
+
+        :return: string
+        """
+        cells, playerCell, faces = self.key()
+        digits = "".join(str(color) for color in cells)
+        return "%d %s %d %d" % (self.board.grid.height, digits, playerCell, faces)
+
+
+class GameServer:
+    """
+    Python Class serving many games from one process with asyncio on a
+    localhost TCP socket or a Unix socket
+
+    Each connection holds one session and sends one command per line:
+    - NEW <lines> [seed]: start a new game, answers "STATE <state>"
+    - STATE: answers "STATE <state>" (see Session.describe)
+    - MOVE <l|r|u|d>: answers "OK <case id of the piece> <packed faces>
+      <1 if won else 0>" or "ERR invalid move"
+    - HINT: answers "HINT <l|r|u|d>" ("HINT -" if the game is won)
+    - SOLVE: answers "SOLUTION <letters of the moves>"
+    - QUIT: close the connection
+
+    The HINT and SOLVE requests of all the sessions are gathered in batches
+    solved by a pool of worker processes; a session following the last
+    solution it received gets its hints without any search. Backpressure:
+    each connection is served one command at a time and waits for its answer
+    to be sent, a client not reading its answers for [writeTimeout] seconds
+    is disconnected, at most [maxPending] searches wait for the pool (the
+    sessions asking for more wait) and the connections beyond
+    [maxSessions] are refused.
+    """
+
+    def __init__(
+        self,
+        workers=None,
+        batchSize=64,
+        batchDelay=0.002,
+        maxPending=1024,
+        maxSessions=10000,
+        maxLines=12,
+        writeTimeout=10.0,
+    ):
+        """
+        Creation of the server (see start)
+
+        :workers: number of worker processes (number of CPUs if None)
+        :batchSize: maximal number of searches sent at once to a worker
+        :batchDelay: seconds waited for other searches before sending a batch
+        :maxPending: maximal number of searches waiting for the pool
+        :maxSessions: maximal number of connections
+        :maxLines: maximal number of lines of the boards
+        :writeTimeout: seconds before disconnecting a client not reading
+        """
+        self.workers = os.cpu_count() if workers is None else workers
+        self.batchSize = batchSize
+        self.batchDelay = batchDelay
+        self.maxPending = maxPending
+        self.maxSessions = maxSessions
+        self.maxLines = maxLines
+        self.writeTimeout = writeTimeout
+        # Connections waiting to be accepted (bursts of new clients)
+        self.backlog = 1024
+
+        self.pool = None
+        self.server = None
+        self.requests = None  # queue of (n, state key, future)
+        self.pending = None  # semaphore of the searches waiting for the pool
+        self.batcher = None
+        self.clients = {}  # writer of each open connection: task serving it
+        self.sessions = 0
+        self.sessionsStarted = 0
+        self.batches = 0
+        self.searches = 0
+
+    async def start(self, host="127.0.0.1", port=7777, path=None):
+        """
+        Start the worker pool and listen on [host]:[port] (or on the Unix
+        socket [path] if given)
+
+        :host: address of the TCP socket
+        :port: port of the TCP socket
+        :path: path of the Unix socket (used instead of TCP if not None)
+        :return: nothing
+        """
+        self.pool = concurrent.futures.ProcessPoolExecutor(self.workers)
+        self.requests = asyncio.Queue()
+        self.pending = asyncio.Semaphore(self.maxPending)
+        self.batcher = asyncio.create_task(self.batchSearches())
+        if path is None:
+            self.server = await asyncio.start_server(
+                self.handleClient, host, port, backlog=self.backlog
+            )
+        else:
+            self.server = await asyncio.start_unix_server(
+                self.handleClient, path, backlog=self.backlog
+            )
+
+    async def close(self):
+        """
+        Stop listening, disconnect the clients, cancel the batches and shut
+        down the pool
+
+        :return: nothing
+        """
+        self.server.close()
+        for writer in self.clients:
+            writer.close()
+        await asyncio.gather(*self.clients.values(), return_exceptions=True)
+        await self.server.wait_closed()
+        self.batcher.cancel()
+        self.pool.shutdown(cancel_futures=True)
+
+    async def solve(self, session):
+        """
+        Return a shortest solution from the state of [session] searched by
+        the worker pool
+
+        :session: a Session
+        :return: list of direction codes or None if there is no solution
+        """
+        async with self.pending:
+            future = asyncio.get_running_loop().create_future()
+            self.requests.put_nowait((session.board.grid.height, session.key(), future))
+            return await future
+
+    async def batchSearches(self):
+        """
+        Gather the searches of the sessions in batches sent to the pool
+
+        :return: nothing
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            requests = [await self.requests.get()]
+            deadline = loop.time() + self.batchDelay
+            while len(requests) < self.batchSize * self.workers:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    requests.append(
+                        await asyncio.wait_for(self.requests.get(), timeout)
+                    )
+                except asyncio.TimeoutError:
+                    break
+
+            groups = {}
+            for n, key, future in requests:
+                groups.setdefault(n, []).append((key, future))
+            for n, group in groups.items():
+                # Spread the searches over all the workers
+                size = min(self.batchSize, -(-len(group) // self.workers))
+                for start in range(0, len(group), size):
+                    batch = group[start : start + size]
+                    try:
+                        task = loop.run_in_executor(
+                            self.pool, solveBatch, n, [key for key, _ in batch]
+                        )
+                    except concurrent.futures.process.BrokenProcessPool as error:
+                        # A worker died, the next batches go to a new pool
+                        self.pool.shutdown(wait=False, cancel_futures=True)
+                        self.pool = concurrent.futures.ProcessPoolExecutor(self.workers)
+                        for _, future in batch:
+                            if not future.done():
+                                future.set_exception(error)
+                        continue
+                    task.add_done_callback(
+                        lambda task, batch=batch: self.deliver(task, batch)
+                    )
+                    self.batches += 1
+                    self.searches += len(batch)
+
+    def deliver(self, task, batch):
+        """
+        Give the solutions of a batch to the sessions waiting for them
+
+        :task: finished future of solveBatch
+        :batch: list of (state key, future of the session)
+        :return: nothing
+        """
+        for index, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            if task.cancelled():
+                future.cancel()
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result()[index])
+
+    async def execute(self, session, command):
+        """
+        Run a command of the protocol
+
+        :session: the Session of the connection (None before NEW)
+        :command: list of the words of the command line
+        :return: (answer line, session)
+        """
+        name = command[0].upper() if command else ""
+        if name == "NEW":
+            n = int(command[1]) if len(command) > 1 else 8
+            if n % 2 or not 4 <= n <= self.maxLines:
+                return (
+                    "ERR lines must be even between 4 and %d" % self.maxLines,
+                    session,
+                )
+            seed = int(command[2]) if len(command) > 2 else None
+            session = Session(n, seed)
+            self.sessionsStarted += 1
+            return "STATE " + session.describe(), session
+        if session is None:
+            return "ERR no game, send NEW first", session
+        board = session.board
+
+        if name == "STATE":
+            return "STATE " + session.describe(), session
+        if name == "MOVE":
+            if len(command) != 2 or command[1] not in LETTERS:
+                return "ERR usage: MOVE l|r|u|d", session
+            code = LETTERS.index(command[1])
+            if not board.isValidMove(direction=code):
+                return "ERR invalid move", session
+            board.move(DIRECTIONS[code])
+            if session.plan and session.plan[0] == code:
+                session.plan.pop(0)
+            else:
+                session.plan = None
+            return (
+                "OK %d %d %d"
+                % (
+                    board.grid.cellIds[board.playerPosition],
+                    board.playerPiece.packedFaces,
+                    board.checkWin(),
+                )
+            ), session
+        if name in ("HINT", "SOLVE"):
+            if session.plan is None:
+                try:
+                    session.plan = await self.solve(session)
+                except Exception as error:
+                    # Raised by the worker (or its pool is broken)
+                    return "ERR search failed: %s" % type(error).__name__, session
+            plan = session.plan or []
+            if name == "HINT":
+                return "HINT " + (LETTERS[plan[0]] if plan else "-"), session
+            return "SOLUTION " + "".join(LETTERS[code] for code in plan), session
+        return "ERR unknown command", session
+
+    async def handleClient(self, reader, writer):
+        """
+        Serve a connection until the client quits or is disconnected
+
+        :reader: asyncio StreamReader of the connection
+        :writer: asyncio StreamWriter of the connection
+        :return: nothing
+        """
+        if self.sessions >= self.maxSessions:
+            writer.write(b"ERR busy\n")
+            writer.close()
+            return
+        self.sessions += 1
+        self.clients[writer] = asyncio.current_task()
+        session = None
+        try:
+            while True:
+                line = await reader.readline()
+                command = line.decode("ascii", "replace").split()
+                if not line or command[:1] in (["QUIT"], ["quit"]):
+                    break
+                try:
+                    answer, session = await self.execute(session, command)
+                except ValueError:
+                    answer = "ERR invalid argument"
+                writer.write(answer.encode("ascii") + b"\n")
+                await asyncio.wait_for(writer.drain(), self.writeTimeout)
+        except (ConnectionError, asyncio.TimeoutError, ValueError):
+            # Lost connection, client not reading or line too long
+            pass
+        finally:
+            self.sessions -= 1
+            del self.clients[writer]
+            writer.close()
+
+
+async def runLoad(
+    host="127.0.0.1",
+    port=7777,
+    path=None,
+    sessions=1000,
+    concurrency=200,
+    moves=50,
+    hintRate=0.2,
+    n=8,
+    seed=0,
+):
+    """
+    Play [sessions] games with [concurrency] clients connected at the same
+    time, each game being [moves] moves (following the hint with
+    probability [hintRate], random otherwise)
+
+    :host: address of the TCP socket of the server
+    :port: port of the TCP socket of the server
+    :path: path of the Unix socket of the server (used instead of TCP)
+    :sessions: number of games
+    :concurrency: number of simultaneous connections
+    :moves: maximal number of moves per game
+    :hintRate: probability of asking for a hint before a move
+    :n: number of lines of the boards
+    :seed: seed of the games and of the moves
+    :return: dictionary of the statistics
+    """
+    from grid import TetraGrid
+
+    neighbors = TetraGrid(n).neighbors.tolist()
+    rng = np.random.default_rng(seed)
+    moveLatencies = []
+    hintLatencies = []
+    failedHints = []
+    games = iter(range(sessions))
+    clock = time.perf_counter
+
+    async def client():
+        if path is None:
+            reader, writer = await asyncio.open_connection(host, port)
+        else:
+            reader, writer = await asyncio.open_unix_connection(path)
+
+        async def ask(line):
+            writer.write(line.encode("ascii") + b"\n")
+            await writer.drain()
+            return (await reader.readline()).decode("ascii").split()
+
+        for game in games:
+            answer = await ask("NEW %d %d" % (n, seed + game))
+            playerCell = int(answer[3])
+            for _ in range(moves):
+                letter = None
+                if rng.random() < hintRate:
+                    startTime = clock()
+                    answer = await ask("HINT")
+                    hintLatencies.append(clock() - startTime)
+                    if answer[0] == "ERR":
+                        failedHints.append(game)
+                    else:
+                        letter = answer[1]
+                if letter is None:
+                    valid = [d for d in range(4) if neighbors[playerCell][d] >= 0]
+                    letter = LETTERS[valid[rng.integers(len(valid))]]
+                startTime = clock()
+                answer = await ask("MOVE " + letter)
+                moveLatencies.append(clock() - startTime)
+                playerCell = int(answer[1])
+                if answer[3] == "1":
+                    break
+        writer.write(b"QUIT\n")
+        await writer.drain()
+        writer.close()
+
+    startTime = clock()
+    await asyncio.gather(*(client() for _ in range(min(concurrency, sessions))))
+    elapsed = clock() - startTime
+
+    def percentiles(latencies):
+        if not latencies:
+            return 0.0, 0.0
+        return tuple((1000 * np.percentile(latencies, [50, 99])).tolist())
+
+    moveP50, moveP99 = percentiles(moveLatencies)
+    hintP50, hintP99 = percentiles(hintLatencies)
+    return {
+        "sessionsPerSecond": sessions / elapsed,
+        "movesPerSecond": len(moveLatencies) / elapsed,
+        "moveP50": moveP50,
+        "moveP99": moveP99,
+        "hintP50": hintP50,
+        "hintP99": hintP99,
+        "failedHints": len(failedHints),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Serve games on a socket or load a server with bot clients"
+    )
+    parser.add_argument("command", choices=["serve", "load"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7777)
+    parser.add_argument("--unix", default=None, help="path of a Unix socket")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--moves", type=int, default=50)
+    parser.add_argument("--hint-rate", type=float, default=0.2)
+    parser.add_argument("--lines", type=int, default=8)
+    arguments = parser.parse_args()
+
+    if arguments.command == "serve":
+
+        async def serve():
+            server = GameServer(workers=arguments.workers)
+            await server.start(arguments.host, arguments.port, arguments.unix)
+            print("listening on", arguments.unix or (arguments.host, arguments.port))
+            try:
+                await server.server.serve_forever()
+            finally:
+                await server.close()
+
+        try:
+            asyncio.run(serve())
+        except KeyboardInterrupt:
+            pass
+    else:
+        statistics = asyncio.run(
+            runLoad(
+                arguments.host,
+                arguments.port,
+                arguments.unix,
+                sessions=arguments.sessions,
+                concurrency=arguments.concurrency,
+                moves=arguments.moves,
+                hintRate=arguments.hint_rate,
+                n=arguments.lines,
+            )
+        )
+        print(
+            "%.0f sessions/s, %.0f moves/s"
+            % (
+                statistics["sessionsPerSecond"],
+                statistics["movesPerSecond"],
+            )
+        )
+        print(
+            "move latency p50 %.2f ms, p99 %.2f ms"
+            % (statistics["moveP50"], statistics["moveP99"])
+        )
+        print(
+            "hint latency p50 %.2f ms, p99 %.2f ms"
+            % (statistics["hintP50"], statistics["hintP99"])
+        )
+        if statistics["failedHints"]:
+            print(statistics["failedHints"], "hints failed")
@@ -0,0 +1,534 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from grid import DIRECTIONS
+from solver import AbstractSolver
+
+# Multiplier of the hash spreading the states over the shards
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+
+# Sides of the bidirectional search
+FORWARD, BACKWARD = 0, 1
+
+# Number of states of the visited set copied at once when it is on disk
+MERGE_CHUNK = 1 << 22
+
+
+def shardsOf(states, shards):
+    """
+    Return the shard of each state (Fibonacci hashing of the packed states)
+
+    :states: uint64 array of packed states
+    :shards: number of shards
+    :return: int64 array
+    """
+    hashes = (states * np.uint64(HASH_MULTIPLIER)) >> np.uint64(40)
+    return (hashes % np.uint64(shards)).astype(np.int64)
+
+
+def shardOf(state, shards):
+    """
+    Return the shard of a single state (see shardsOf)
+
+    :state: packed state
+    :shards: number of shards
+    :return: an integer
+    """
+    return (((state * HASH_MULTIPLIER) & 0xFFFFFFFFFFFFFFFF) >> 40) % shards
+
+
+def successorsOf(states, tables):
+    """
+    Return the states reachable in one move from [states] (the moves of
+    StateEncoder.successors applied to whole arrays)
+
+    :states: uint64 array of packed states
+    :tables: dictionary of the tables of the encoder (see
+    ShardedBFSSolver.tables)
+    :return: uint64 array (with duplicates)
+    """
+    mask, pieceCode = tables["mask"], tables["pieceCode"]
+    players = (states & mask).astype(np.int64)
+    successors = []
+    for d in range(4):
+        destinations = tables["neighbors"][players, d]
+        valid = destinations >= 0
+        origins = states[valid]
+        destinations = destinations[valid]
+        # The landing face exchanges its color with the destination case
+        shifts = tables["caseShifts"][destinations]
+        destinations = destinations.astype(np.uint64)
+        fields = (origins >> shifts) & mask
+        exchange = (fields == destinations) | (fields == pieceCode)
+        origins = np.where(
+            exchange, origins ^ ((destinations ^ pieceCode) << shifts), origins
+        )
+        successors.append(origins - (origins & mask) + destinations)
+    return np.concatenate(successors)
+
+
+def predecessorsOf(states, tables):
+    """
+    Return the states from which [states] are reachable in one move (see
+    StateEncoder.predecessors)
+
+    :states: uint64 array of packed states
+    :tables: dictionary of the tables of the encoder
+    :return: uint64 array (with duplicates)
+    """
+    mask, pieceCode = tables["mask"], tables["pieceCode"]
+    players = (states & mask).astype(np.int64)
+    # The exchange of colors is its own inverse
+    shifts = tables["caseShifts"][players]
+    fields = (states >> shifts) & mask
+    unsigned = players.astype(np.uint64)
+    exchange = (fields == unsigned) | (fields == pieceCode)
+    states = np.where(exchange, states ^ ((unsigned ^ pieceCode) << shifts), states)
+    states = states - unsigned
+    predecessors = []
+    for d in range(4):
+        origins = tables["neighbors"][players, d]
+        valid = origins >= 0
+        predecessors.append(states[valid] + origins[valid].astype(np.uint64))
+    return np.concatenate(predecessors)
+
+
+def sortedContains(values, states):
+    """
+    Return which states are in a sorted array
+
+    :values: sorted uint64 array (or memory-mapped array)
+    :states: uint64 array
+    :return: boolean array
+    """
+    if len(values) == 0:
+        return np.zeros(len(states), dtype=bool)
+    positions = np.searchsorted(values, states)
+    positions[positions == len(values)] = 0
+    return values[positions] == states
+
+
+class ShardWorker:
+    """
+    Python Class of the process owning the states of one shard of a
+    ShardedBFSSolver search. For each side of the search it keeps the levels
+    and the union of the levels (visited states) as sorted uint64 arrays, in
+    memory or saved on disk and memory-mapped if a spill directory is given.
+    """
+
+    def __init__(self, shard, shards, tables, spillDirectory=None):
+        """
+        Creation of the shard
+
+        :shard: index of the shard
+        :shards: number of shards
+        :tables: tables of the encoder (see ShardedBFSSolver.tables)
+        :spillDirectory: directory of the saved levels (None to keep them in
+        memory)
+        """
+        self.shard = shard
+        self.shards = shards
+        self.tables = tables
+        self.spillDirectory = spillDirectory
+        self.levels = ([], [])  # sorted arrays of the states of each level
+        self.visited = [np.zeros(0, dtype=np.uint64) for _ in range(2)]
+        self.outbox = None  # shared memory of the states sent by the last expand
+
+    def path(self, side, name):
+        """
+        Return the path of a file of the shard in the spill directory
+
+        :side: FORWARD or BACKWARD
+        :name: name of the file
+        :return: string
+        """
+        return os.path.join(
+            self.spillDirectory, "shard-%d-side-%d-%s" % (self.shard, side, name)
+        )
+
+    def addLevel(self, side, states):
+        """
+        Append a level to a side and add its states to the visited states
+
+        :side: FORWARD or BACKWARD
+        :states: sorted uint64 array of states not visited yet
+        :return: nothing
+        """
+        visited = self.visited[side]
+        positions = np.searchsorted(visited, states)
+        if self.spillDirectory is None:
+            self.levels[side].append(states)
+            self.visited[side] = np.insert(visited, positions, states)
+            return
+
+        path = self.path(side, "level-%d.npy" % len(self.levels[side]))
+        np.save(path, states)
+        self.levels[side].append(np.load(path, mmap_mode="r"))
+        # Merge the new states into the visited states chunk by chunk
+        path = self.path(side, "visited-%d.bin" % len(self.levels[side]))
+        size = len(visited) + len(states)
+        merged = np.memmap(path, dtype=np.uint64, mode="w+", shape=(max(1, size),))
+        first = 0
+        for start in range(0, len(visited) + 1, MERGE_CHUNK):
+            stop = min(start + MERGE_CHUNK, len(visited))
+            if stop == len(visited):
+                last = len(states)
+            else:
+                last = int(np.searchsorted(positions, stop, side="right"))
+            chunk = np.insert(
+                np.asarray(visited[start:stop]),
+                positions[first:last] - start,
+                states[first:last],
+            )
+            merged[start + first : start + first + len(chunk)] = chunk
+            first = last
+            if stop == len(visited):
+                break
+        merged.flush()
+        oldPath = getattr(visited, "filename", None)
+        self.visited[side] = merged[:size]
+        if oldPath is not None:
+            del visited
+            os.remove(oldPath)
+
+    def expand(self, side):
+        """
+        Send the neighbors of the last level of [side] to their shards
+        through a new shared memory block
+
+        :side: FORWARD (successors) or BACKWARD (predecessors)
+        :return: (name of the block, number of states for each shard)
+        """
+        self.releaseOutbox()
+        frontier = np.asarray(self.levels[side][-1])
+        if side == FORWARD:
+            states = np.unique(successorsOf(frontier, self.tables))
+        else:
+            states = np.unique(predecessorsOf(frontier, self.tables))
+        owners = shardsOf(states, self.shards)
+        order = np.argsort(owners, kind="stable")
+        counts = np.bincount(owners, minlength=self.shards).tolist()
+        self.outbox = shared_memory.SharedMemory(
+            create=True, size=max(1, 8 * len(states))
+        )
+        buffer = np.ndarray(len(states), dtype=np.uint64, buffer=self.outbox.buf)
+        buffer[:] = states[order]
+        del buffer
+        return self.outbox.name, counts
+
+    def merge(self, side, blocks):
+        """
+        Build the next level of [side] from the states received from every
+        shard (without the visited states) and look for a state already
+        visited by the other side
+
+        :side: FORWARD or BACKWARD
+        :blocks: list of (name of the block, offset, count) of the states
+        sent to this shard
+        :return: (number of new states, a state visited by both sides or None)
+        """
+        received = []
+        for name, offset, count in blocks:
+            if count:
+                block = shared_memory.SharedMemory(name=name)
+                view = np.ndarray(
+                    count, dtype=np.uint64, buffer=block.buf, offset=8 * offset
+                )
+                received.append(view.copy())
+                del view
+                block.close()
+        if received:
+            states = np.unique(np.concatenate(received))
+        else:
+            states = np.zeros(0, dtype=np.uint64)
+        states = states[~sortedContains(self.visited[side], states)]
+        self.addLevel(side, states)
+
+        met = states[sortedContains(self.visited[1 - side], states)]
+        return len(states), int(met[0]) if len(met) else None
+
+    def levelOf(self, side, state):
+        """
+        Return the level of [side] containing [state]
+
+        :side: FORWARD or BACKWARD
+        :state: packed state
+        :return: index of the level or None
+        """
+        states = np.array([state], dtype=np.uint64)
+        for index, level in enumerate(self.levels[side]):
+            if sortedContains(level, states)[0]:
+                return index
+        return None
+
+    def releaseOutbox(self):
+        """
+        Free the shared memory block of the last expand (all the shards have
+        read it when the next command arrives)
+
+        :return: nothing
+        """
+        if self.outbox is not None:
+            self.outbox.close()
+            self.outbox.unlink()
+            self.outbox = None
+
+    def run(self, connection):
+        """
+        Answer the commands of the solver until "stop"
+
+        :connection: end of the Pipe of the worker
+        :return: nothing
+        """
+        try:
+            while True:
+                command, *arguments = connection.recv()
+                if command == "start":
+                    for side, states in enumerate(arguments):
+                        states = np.array(states, dtype=np.uint64)
+                        mine = shardsOf(states, self.shards) == self.shard
+                        self.addLevel(side, np.unique(states[mine]))
+                    connection.send(None)
+                elif command == "expand":
+                    connection.send(self.expand(*arguments))
+                elif command == "merge":
+                    connection.send(self.merge(*arguments))
+                elif command == "contains":
+                    side, level, state = arguments
+                    states = np.array([state], dtype=np.uint64)
+                    contained = sortedContains(self.levels[side][level], states)[0]
+                    connection.send(bool(contained))
+                elif command == "levelOf":
+                    connection.send(self.levelOf(*arguments))
+                elif command == "stop":
+                    break
+        finally:
+            self.releaseOutbox()
+            connection.close()
+
+
+def runShardWorker(shard, shards, tables, spillDirectory, connection):
+    """
+    Entry point of the worker processes (see ShardWorker.run)
+    """
+    ShardWorker(shard, shards, tables, spillDirectory).run(connection)
+
+
+class ShardedBFSSolver(AbstractSolver):
+    """
+    Python Class finding a shortest winning sequence of moves for a Board
+    with the bidirectional breadth-first search of BFSSolver split over
+    worker processes. The states are partitioned by a hash of the packed
+    state and each worker keeps the levels and the visited states of its
+    shard as sorted uint64 arrays (8 bytes per state and per array instead
+    of a Python dictionary entry), a state and its duplicates always going to
+    the same shard. Between two levels each worker writes the neighbors of
+    its frontier grouped by shard in a shared memory block and every worker
+    reads its part of the blocks, so only control messages go through the
+    pipes. With [spillDirectory] the levels and the visited states are kept
+    on disk and memory-mapped, the duplicates being removed once per level
+    (delayed duplicate detection).
+
+    The moves are the ones of StateEncoder (the states must fit in 64 bits).
+    """
+
+    def __init__(
+        self, board, maxLength=None, table=None, workers=None, spillDirectory=None
+    ):
+        """
+        Creation of the solver
+
+        :board: the Board to solve (it is not modified by the solver)
+        :maxLength: the solutions longer than [maxLength] moves are not
+        searched (no limit if None)
+        :table: optional TranspositionTable (see AbstractSolver)
+        :workers: number of worker processes (number of CPUs if None)
+        :spillDirectory: directory where the levels are saved (kept in memory
+        if None)
+        """
+        super().__init__(board, maxLength=maxLength, table=table)
+        self.workers = os.cpu_count() if workers is None else workers
+        self.spillDirectory = spillDirectory
+        self.connections = []
+        encoder = self.encoder
+        assert 5 * encoder.bits <= 64, "the states do not fit in 64 bits"
+
+        # Tables of the encoder sent to the workers
+        self.tables = {
+            "mask": np.uint64(encoder.mask),
+            "pieceCode": np.uint64(encoder.pieceCode),
+            "neighbors": np.array(encoder.neighbors, dtype=np.int64).reshape(-1, 4),
+            "caseShifts": np.array(encoder.caseShifts, dtype=np.uint64),
+        }
+
+    def search(self, start):
+        """
+        Return a shortest list of moves from [start] to a winning state
+
+        :start: packed state which is not a winning state
+        :return: list of direction strings or None if there is no solution
+        (of at most maxLength moves)
+        """
+        spillDirectory = None
+        if self.spillDirectory is not None:
+            os.makedirs(self.spillDirectory, exist_ok=True)
+            spillDirectory = tempfile.mkdtemp(dir=self.spillDirectory)
+        # The workers share the tracker of the shared memory blocks, which
+        # are registered by their owner and by the shards reading them
+        resource_tracker.ensure_running()
+        processes = []
+        for shard in range(self.workers):
+            connection, workerConnection = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=runShardWorker,
+                args=(
+                    shard,
+                    self.workers,
+                    self.tables,
+                    spillDirectory,
+                    workerConnection,
+                ),
+                daemon=True,
+            )
+            process.start()
+            self.connections.append(connection)
+            processes.append(process)
+
+        try:
+            self.broadcast(("start", [start], self.encoder.goalStates()))
+            frontiers = [1, self.encoder.casesNumber]
+            length = 0  # length of the paths found by the next level
+            while all(frontiers):
+                length += 1
+                if self.maxLength is not None and length > self.maxLength:
+                    return None
+                if frontiers[FORWARD] <= frontiers[BACKWARD]:
+                    side = FORWARD
+                else:
+                    side = BACKWARD
+                self.nodesExpanded += frontiers[side]
+                outboxes = self.broadcast(("expand", side))
+                offsets = [np.cumsum([0] + counts).tolist() for _, counts in outboxes]
+                results = self.broadcast(
+                    *[
+                        (
+                            "merge",
+                            side,
+                            [
+                                (name, offsets[source][shard], counts[shard])
+                                for source, (name, counts) in enumerate(outboxes)
+                            ],
+                        )
+                        for shard in range(self.workers)
+                    ]
+                )
+                frontiers[side] = sum(count for count, _ in results)
+                for _, state in results:
+                    if state is not None:
+                        return self.buildPath(state)
+            return None
+        finally:
+            for connection in self.connections:
+                connection.send(("stop",))
+            for process in processes:
+                process.join()
+            self.connections = []
+            if spillDirectory is not None:
+                shutil.rmtree(spillDirectory)
+
+    def broadcast(self, *messages):
+        """
+        Send a message to every worker (the same one if a single message is
+        given) and return their answers
+
+        :messages: one message per worker or a single message
+        :return: list of the answers
+        """
+        if len(messages) == 1:
+            messages = messages * self.workers
+        for connection, message in zip(self.connections, messages):
+            connection.send(message)
+        return [connection.recv() for connection in self.connections]
+
+    def ask(self, state, *message):
+        """
+        Send a message about [state] to its shard and return the answer
+
+        :state: packed state
+        :message: command and arguments
+        :return: the answer
+        """
+        connection = self.connections[shardOf(state, self.workers)]
+        connection.send(message)
+        return connection.recv()
+
+    def buildPath(self, state):
+        """
+        Return the moves of the path through [state] found by both sides
+
+        :state: packed state visited by both sides
+        :return: list of direction strings
+        """
+        encoder = self.encoder
+
+        # From [state] back to the start through the forward levels
+        path = []
+        current = state
+        for level in range(self.ask(state, "levelOf", FORWARD, state) - 1, -1, -1):
+            for d, previousState in encoder.predecessors(current):
+                if self.ask(previousState, "contains", FORWARD, level, previousState):
+                    path.append(DIRECTIONS[d])
+                    current = previousState
+                    break
+        path.reverse()
+
+        # From [state] to a winning state through the backward levels
+        current = state
+        for level in range(self.ask(state, "levelOf", BACKWARD, state) - 1, -1, -1):
+            for d, nextState in encoder.successors(current):
+                if self.ask(nextState, "contains", BACKWARD, level, nextState):
+                    path.append(DIRECTIONS[d])
+                    current = nextState
+                    break
+        return path
+
+
+if __name__ == "__main__":
+    from board import Board
+    from solver import BFSSolver
+
+    # Default case color first (only the number of colors matters here)
+    colors = ["white", "black", "red", "green", "blue"]
+    board = Board(colors, 12)
+    board.verbose = False
+    board.reset(np.random.default_rng(3))
+    solver = BFSSolver(board)
+    expected = len(solver.solve())
+    print("BFSSolver", expected, "moves in", round(solver.wallTime, 2), "s")
+    spill = tempfile.mkdtemp()
+    for workers, spillDirectory in ((1, None), (2, None), (4, None), (2, spill)):
+        solver = ShardedBFSSolver(board, workers=workers, spillDirectory=spillDirectory)
+        solution = solver.solve()
+        assert len(solution) == expected
+        replay = Board(colors, 12)
+        replay.verbose = False
+        replay.grid.cells[:] = board.grid.cells
+        for direction in solution:
+            replay.move(direction)
+        assert replay.checkWin()
+        print(
+            workers,
+            "workers" + (" (levels on disk)" if spillDirectory else ""),
+            len(solution),
+            "moves,",
+            solver.nodesExpanded,
+            "nodes expanded in",
+            round(solver.wallTime, 2),
+            "s",
+        )
+    shutil.rmtree(spill)
@@ -0,0 +1,604 @@
+import abc  # Module for abstract classes in OOP
+import heapq
+import time
+
+from grid import DIRECTIONS, OPPOSITE_DIRECTIONS
+
+
+class StateEncoder:
+    """
+    Python Class packing the state of a Board into a single hashable integer
+
+    Each face of the tetahedron always lands on cases of the same connected
+    component (see TetraGrid.ccIndex), therefore each color lives in one
+    component and is either on a case of this component or on the face of the
+    piece that touches this component. With [b] bits per case id the state
+    is packed as:
+    - bits [0, b): case id of the player's piece
+    - bits [k*b, (k+1)*b): case id of the color living in component k, or
+      [pieceCode] if this color is on the piece (for k from 1 to 4)
+    The colors of the faces of the piece and the color of the case under the
+    piece are implied by those fields (see decode).
+    """
+
+    def __init__(self, board):
+        """
+        Precompute the tables needed to encode the states of [board] and to
+        move between them
+
+        :board: the Board whose states will be encoded
+        """
+        self.board = board
+        grid = board.grid
+        self.cases = grid.validIndices
+        self.caseIds = {case: k for k, case in enumerate(self.cases)}
+        self.casesNumber = len(self.cases)
+
+        # Bit fields, [pieceCode] never collides with a case id
+        self.bits = self.casesNumber.bit_length()
+        self.mask = (1 << self.bits) - 1
+        self.pieceCode = self.casesNumber
+        self.shifts = {k: k * self.bits for k in range(1, 5)}
+
+        # neighbors[4 * caseId + directionCode] is the destination case id
+        # or -1 if the move is not valid (flat copy of TetraGrid.neighbors)
+        self.neighbors = grid.neighbors.ravel().tolist()
+
+        # Component of each case and the component touched by each face of
+        # the piece when it stands on this case
+        self.caseComponents = grid.cellComponents.tolist()
+        self.caseShifts = [self.shifts[k] for k in self.caseComponents]
+        self.faceComponents = grid.faceComponentsTable
+
+        # Color living in each component, the game has a solution only if
+        # there is exactly one color per component
+        self.colorOfComponent = {}
+        for color, component in self.colorComponents(board).items():
+            self.colorOfComponent[component] = color
+        self.solvable = len(self.colorOfComponent) == 4 and all(
+            color != board.defaultCaseValue for color in self.colorOfComponent.values()
+        )
+
+        self.goalFields = 0
+        for k in range(1, 5):
+            self.goalFields |= self.pieceCode << self.shifts[k]
+
+    def distanceFrom(self, caseId):
+        """
+        Return the minimal number of moves between case [caseId] and every
+        case of the board (see TetraGrid.distanceFrom)
+
+        :caseId: id of the case
+        :return: list of distances indexed by case id
+        """
+        return self.board.grid.distanceFrom(caseId)
+
+    def colorComponents(self, board):
+        """
+        Return the component of each color of [board] (the component of the
+        case holding it or the component touched by the face holding it)
+
+        :board: a Board
+        :return: dictionary {color: component index}
+        """
+        components = {}
+        # The case under the piece keeps its color in the grid
+        for caseId, color in enumerate(board.grid.cells.tolist()):
+            if color != board.defaultCaseValue:
+                components[color] = self.caseComponents[caseId]
+        playerId = self.caseIds[board.playerPosition]
+        for face, color in board.playerPiece.faces.items():
+            if color != board.defaultCaseValue:
+                components[color] = self.faceComponents[playerId][face]
+        return components
+
+    def encode(self, board):
+        """
+        Return the integer corresponding to the current state of [board]
+        (the colors must be in the same components as the ones of the board
+        given at the creation of the encoder)
+
+        :board: a Board
+        :return: the packed state
+        """
+        state = self.caseIds[board.playerPosition]
+        for component in self.colorComponents(board).values():
+            state |= self.pieceCode << self.shifts[component]
+        for caseId, color in enumerate(board.grid.cells.tolist()):
+            if color != board.defaultCaseValue:
+                shift = self.caseShifts[caseId]
+                state ^= (self.pieceCode ^ caseId) << shift
+        return state
+
+    def decode(self, state):
+        """
+        Return the human readable version of [state]
+
+        :state: a packed state
+        :return: the position of the piece, its faces dictionary, the color
+        of the case under the piece and the dictionary {color: (i,j)} of the
+        other colored cases
+        """
+        default = self.board.defaultCaseValue
+        playerId = state & self.mask
+        faces = {}
+        for face, component in self.faceComponents[playerId].items():
+            field = (state >> self.shifts[component]) & self.mask
+            if field == self.pieceCode:
+                faces[face] = self.colorOfComponent[component]
+            else:
+                faces[face] = default
+        under = default
+        coloredCases = {}
+        for component, color in self.colorOfComponent.items():
+            field = (state >> self.shifts[component]) & self.mask
+            if field == playerId:
+                under = color
+            elif field != self.pieceCode:
+                coloredCases[color] = self.cases[field]
+        return self.cases[playerId], faces, under, coloredCases
+
+    def isWin(self, state):
+        """
+        Return True if all the colors are on the piece in [state]
+
+        :state: a packed state
+        :return: a boolean
+        """
+        return state >> self.bits == self.goalFields >> self.bits
+
+    def goalStates(self):
+        """
+        Return the list of winning states (one per position of the piece)
+
+        :return: list of packed states
+        """
+        return [self.goalFields | caseId for caseId in range(self.casesNumber)]
+
+    def successors(self, state):
+        """
+        Yield the states reachable from [state] in one move
+
+        :state: a packed state
+        :return: generator of (direction code, packed state)
+        """
+        playerId = state & self.mask
+        for d in range(4):
+            destination = self.neighbors[4 * playerId + d]
+            if destination < 0:
+                continue
+            # The landing face exchanges its color with the destination case
+            shift = self.caseShifts[destination]
+            field = (state >> shift) & self.mask
+            if field == destination or field == self.pieceCode:
+                nextState = state ^ ((destination ^ self.pieceCode) << shift)
+            else:
+                nextState = state
+            yield d, nextState - playerId + destination
+
+    def nextState(self, state, d):
+        """
+        Return the state reached from [state] by the move [d] (see successors)
+
+        :state: a packed state
+        :d: direction code of a valid move
+        :return: the packed state
+        """
+        playerId = state & self.mask
+        destination = self.neighbors[4 * playerId + d]
+        if destination < 0:
+            raise ValueError("Move not valid")
+        shift = self.caseShifts[destination]
+        field = (state >> shift) & self.mask
+        if field == destination or field == self.pieceCode:
+            state ^= (destination ^ self.pieceCode) << shift
+        return state - playerId + destination
+
+    def predecessors(self, state):
+        """
+        Yield the states from which [state] is reachable in one move
+
+        :state: a packed state
+        :return: generator of (direction code of the move, packed state)
+        """
+        playerId = state & self.mask
+        # The exchange of colors is its own inverse
+        shift = self.caseShifts[playerId]
+        field = (state >> shift) & self.mask
+        if field == playerId or field == self.pieceCode:
+            state ^= (playerId ^ self.pieceCode) << shift
+        state -= playerId
+        for d in range(4):
+            origin = self.neighbors[4 * playerId + d]
+            if origin >= 0:
+                yield OPPOSITE_DIRECTIONS[d], state + origin
+
+
+class AbstractSolver(abc.ABC):
+    """
+    Abstract Class representing a solver finding a shortest winning sequence
+    of moves for a Board, it keeps track of the number of expanded nodes and
+    of the time spent by the last search
+    """
+
+    def __init__(self, board, maxLength=None, table=None):
+        """
+        Creation of the solver
+
+        :board: the Board to solve (it is not modified by the solver)
+        :maxLength: the solutions longer than [maxLength] moves are not
+        searched (no limit if None)
+        :table: optional TranspositionTable (for boards with the same number
+        of lines) looked up before searching and filled with the solutions
+        """
+        self.board = board
+        self.encoder = StateEncoder(board)
+        self.maxLength = maxLength
+        self.table = table
+        self.nodesExpanded = 0
+        self.wallTime = 0.0
+
+    def solve(self):
+        """
+        Return a shortest list of moves leading the board to a win
+
+        :return: list of direction strings or None if there is no solution
+        (of at most maxLength moves)
+        """
+        self.nodesExpanded = 0
+        startTime = time.perf_counter()
+        if not self.encoder.solvable:
+            solution = None
+        else:
+            start = self.encoder.encode(self.board)
+            if self.encoder.isWin(start):
+                solution = []
+            elif self.table is None:
+                solution = self.search(start)
+            else:
+                solution = self.cachedSearch(start)
+        self.wallTime = time.perf_counter() - startTime
+        return solution
+
+    def cachedSearch(self, start):
+        """
+        Return a shortest list of moves from [start] found in the table or
+        searched then stored in the table
+
+        :start: packed state which is not a winning state
+        :return: list of direction strings or None if there is no solution
+        (of at most maxLength moves)
+        """
+        path = self.table.solution(self.encoder, start)
+        if path is not None:
+            if self.maxLength is not None and len(path) > self.maxLength:
+                return None
+            return [DIRECTIONS[d] for d in path]
+        solution = self.search(start)
+        if solution is not None:
+            path = [DIRECTIONS.index(direction) for direction in solution]
+            self.table.storeSolution(self.encoder, start, path)
+        return solution
+
+    @abc.abstractmethod
+    def search(self, start):
+        """
+        Return a shortest list of moves from [start] to a winning state
+
+        :start: packed state which is not a winning state
+        :return: list of direction strings or None if there is no solution
+        (of at most maxLength moves)
+        """
+        pass
+
+
+class BFSSolver(AbstractSolver):
+    """
+    Python Class finding a shortest winning sequence of moves for a Board
+    with a breadth-first search over the states packed by StateEncoder.
+    The search is run both from the current state and from the winning
+    states and stops when the two searches meet.
+    """
+
+    def search(self, start):
+        """
+        Return a shortest list of moves from [start] to a winning state
+
+        :start: packed state which is not a winning state
+        :return: list of direction strings or None if there is no solution
+        (of at most maxLength moves)
+        """
+        encoder = self.encoder
+
+        # Each visited state is associated to the previous state (resp. the
+        # next state) and the direction of the move between them
+        forwardParents = {start: None}
+        backwardParents = dict.fromkeys(encoder.goalStates())
+        forwardFrontier = [start]
+        backwardFrontier = list(backwardParents)
+        length = 0  # length of the paths found by the next level
+        while forwardFrontier and backwardFrontier:
+            length += 1
+            if self.maxLength is not None and length > self.maxLength:
+                return None
+            newFrontier = []
+            if len(forwardFrontier) <= len(backwardFrontier):
+                self.nodesExpanded += len(forwardFrontier)
+                for state in forwardFrontier:
+                    for d, nextState in encoder.successors(state):
+                        if nextState not in forwardParents:
+                            forwardParents[nextState] = (state, d)
+                            newFrontier.append(nextState)
+                forwardFrontier = newFrontier
+                otherParents = backwardParents
+            else:
+                self.nodesExpanded += len(backwardFrontier)
+                for state in backwardFrontier:
+                    for d, previousState in encoder.predecessors(state):
+                        if previousState not in backwardParents:
+                            backwardParents[previousState] = (state, d)
+                            newFrontier.append(previousState)
+                backwardFrontier = newFrontier
+                otherParents = forwardParents
+
+            for state in newFrontier:
+                if state in otherParents:
+                    return self.buildPath(state, forwardParents, backwardParents)
+        return None
+
+    def buildPath(self, state, forwardParents, backwardParents):
+        """
+        Return the moves of the path going through [state]
+
+        :state: packed state visited by both searches
+        :forwardParents: dictionary of the search from the start
+        :backwardParents: dictionary of the search from the winning states
+        :return: list of direction strings
+        """
+        path = []
+        current = state
+        while forwardParents[current] is not None:
+            current, d = forwardParents[current]
+            path.append(DIRECTIONS[d])
+        path.reverse()
+        current = state
+        while backwardParents[current] is not None:
+            current, d = backwardParents[current]
+            path.append(DIRECTIONS[d])
+        return path
+
+
+class AStarSolver(AbstractSolver):
+    """
+    Python Class finding a shortest winning sequence of moves for a Board
+    with an A* search. Every color that is not on the piece has to be picked
+    up by landing on its case, so the weight of the minimum spanning tree
+    joining the piece and those cases (with the distance maps of
+    StateEncoder.distanceFrom) never overestimates the remaining moves.
+    """
+
+    def heuristic(self, state):
+        """
+        Return a lower bound of the number of moves from [state] to a win
+
+        :state: a packed state
+        :return: an integer
+        """
+        encoder = self.encoder
+        mask, pieceCode = encoder.mask, encoder.pieceCode
+        points = [state & mask]
+        for k in range(1, 5):
+            field = (state >> (k * encoder.bits)) & mask
+            if field != pieceCode:
+                points.append(field)
+
+        # Prim's algorithm on at most 5 points
+        distances = encoder.distanceFrom(points.pop())
+        costs = [distances[point] for point in points]
+        weight = 0
+        while points:
+            best = costs.index(min(costs))
+            weight += costs.pop(best)
+            distances = encoder.distanceFrom(points.pop(best))
+            costs = [min(c, distances[p]) for c, p in zip(costs, points)]
+        return weight
+
+    def search(self, start):
+        """
+        Return a shortest list of moves from [start] to a winning state
+
+        :start: packed state which is not a winning state
+        :return: list of direction strings or None if there is no solution
+        (of at most maxLength moves)
+        """
+        encoder = self.encoder
+        # The heuristic is admissible but not consistent, so a state can be
+        # expanded again when a shorter path to it is found
+        costs = {start: 0}
+        parents = {start: None}
+        # Ties are broken in favour of the deepest states
+        heap = [(self.heuristic(start), 0, start)]
+        while heap:
+            estimate, negativeCost, state = heapq.heappop(heap)
+            if self.maxLength is not None and estimate > self.maxLength:
+                return None
+            cost = -negativeCost
+            if cost > costs[state]:
+                continue
+            if encoder.isWin(state):
+                self.learn(costs, cost)
+                return self.buildPath(state, parents)
+            self.nodesExpanded += 1
+            for d, nextState in encoder.successors(state):
+                nextCost = cost + 1
+                if nextCost < costs.get(nextState, nextCost + 1):
+                    costs[nextState] = nextCost
+                    parents[nextState] = (state, d)
+                    estimate = nextCost + self.heuristic(nextState)
+                    heapq.heappush(heap, (estimate, -nextCost, nextState))
+        return None
+
+    def learn(self, costs, length):
+        """
+        Called at the end of a successful search (nothing to do here, see
+        AdaptiveAStarSolver)
+
+        :costs: dictionary {state: smallest number of moves found from the
+        start} of the states reached by the search
+        :length: length of the shortest solution found
+        :return: nothing
+        """
+        pass
+
+    def buildPath(self, state, parents):
+        """
+        Return the moves leading from the start to [state]
+
+        :state: packed state
+        :parents: dictionary {state: (previous state, direction code)}
+        :return: list of direction strings
+        """
+        path = []
+        while parents[state] is not None:
+            state, d = parents[state]
+            path.append(DIRECTIONS[d])
+        path.reverse()
+        return path
+
+
+class AdaptiveAStarSolver(AStarSolver):
+    """
+    Python Class finding a shortest winning sequence of moves for a Board
+    with an A* search that learns from its previous searches (Adaptive A*).
+    After a search with a shortest solution of length L, a state reached
+    with cost g is at least L - g moves away from a win, so the heuristic of
+    the next searches is raised to those bounds. The winning states never
+    change and only the start moves when the player plays, so the searches
+    from the following states expand fewer states. The bounds only depend on
+    the packed states, so [learned] can be shared by the solvers of every
+    board with the same number of lines.
+    """
+
+    def __init__(
+        self, board, maxLength=None, table=None, learned=None, maxLearned=2000000
+    ):
+        """
+        Creation of the solver
+
+        :board: the Board to solve (it is not modified by the solver)
+        :maxLength: the solutions longer than [maxLength] moves are not
+        searched (no limit if None)
+        :table: optional TranspositionTable (see AbstractSolver)
+        :learned: dictionary {state: lower bound of the distance to win}
+        filled by the searches (a new one if None)
+        :maxLearned: the bounds are forgotten when there are more than
+        [maxLearned] of them
+        """
+        super().__init__(board, maxLength=maxLength, table=table)
+        self.learned = {} if learned is None else learned
+        self.maxLearned = maxLearned
+
+    def heuristic(self, state):
+        """
+        Return a lower bound of the number of moves from [state] to a win
+
+        :state: a packed state
+        :return: an integer
+        """
+        return max(super().heuristic(state), self.learned.get(state, 0))
+
+    def learn(self, costs, length):
+        """
+        Raise the bounds of the states reached by the search
+
+        :costs: dictionary {state: smallest number of moves found from the
+        start} of the states reached by the search
+        :length: length of the shortest solution found
+        :return: nothing
+        """
+        learned = self.learned
+        if len(learned) + len(costs) > self.maxLearned:
+            learned.clear()
+        for state, cost in costs.items():
+            # cost is at least the real distance from the start
+            if length - cost > learned.get(state, 0):
+                learned[state] = length - cost
+
+
+class IDAStarSolver(AStarSolver):
+    """
+    Python Class finding a shortest winning sequence of moves for a Board
+    with an IDA* search (depth-first searches bounded by an increasing
+    threshold on cost + heuristic) using the heuristic of AStarSolver.
+    The smallest cost at which each state was reached during an iteration
+    is remembered to avoid exploring the transpositions again.
+    """
+
+    def search(self, start):
+        """
+        Return a shortest list of moves from [start] to a winning state
+
+        :start: packed state which is not a winning state
+        :return: list of direction strings or None if there is no solution
+        (of at most maxLength moves)
+        """
+        threshold = self.heuristic(start)
+        while True:
+            if self.maxLength is not None and threshold > self.maxLength:
+                return None
+            path = []
+            self.bestCosts = {start: 0}
+            nextThreshold = self.boundedSearch(start, 0, threshold, path)
+            if nextThreshold is None:
+                path.reverse()
+                return [DIRECTIONS[d] for d in path]
+            if nextThreshold == float("inf"):
+                return None
+            threshold = nextThreshold
+
+    def boundedSearch(self, state, cost, threshold, path):
+        """
+        Depth-first search from [state] without exceeding [threshold]
+
+        :state: packed state reached with [cost] moves
+        :cost: number of moves from the start
+        :threshold: maximum value of cost + heuristic to explore
+        :path: list filled with the direction indices (in reverse order) of
+        the solution if one is found
+        :return: None if a solution was found, the smallest value of
+        cost + heuristic exceeding [threshold] otherwise
+        """
+        estimate = cost + self.heuristic(state)
+        if estimate > threshold:
+            return estimate
+        if self.encoder.isWin(state):
+            return None
+        self.nodesExpanded += 1
+        nextThreshold = float("inf")
+        for d, nextState in self.encoder.successors(state):
+            if cost + 1 >= self.bestCosts.get(nextState, cost + 2):
+                continue
+            self.bestCosts[nextState] = cost + 1
+            result = self.boundedSearch(nextState, cost + 1, threshold, path)
+            if result is None:
+                path.append(d)
+                return None
+            nextThreshold = min(nextThreshold, result)
+        return nextThreshold
+
+
+if __name__ == "__main__":
+    from board import Board
+
+    board = Board(["white", "black", "red", "green", "blue"], 8)
+    for solver in (BFSSolver(board), AStarSolver(board), IDAStarSolver(board)):
+        solution = solver.solve()
+        print(
+            type(solver).__name__,
+            len(solution),
+            "moves,",
+            solver.nodesExpanded,
+            "nodes expanded in",
+            round(solver.wallTime * 1000, 1),
+            "ms",
+        )
@@ -0,0 +1,30 @@
+import numpy as np
+
+from analytics import DifficultyStatistics, analyzeChunk
+
+
+def testMergedChunks():
+    merged = analyzeChunk(4, 0, 0, 20)
+    merged += analyzeChunk(4, 0, 20, 40)
+    whole = analyzeChunk(4, 0, 0, 40)
+    assert merged.toDict() == whole.toDict()
+    assert whole.backtrackShares.sum() == whole.puzzles - whole.lengths[0]
+
+
+def testBacktrackShares():
+    statistics = DifficultyStatistics(8)
+    for backtracks in range(10):
+        statistics.add(backtracks, 20, 50, 100, backtracks, 0)
+    summary = statistics.summary()
+    assert summary["backtrackShareP50"] == 0.2
+    assert summary["backtrackShareP90"] == 0.4
+    assert np.all(statistics.backtrackShares[[0, 5, 45]] == 1)
+
+
+def testEffectiveBranchingRange():
+    """
+    The effective branching of short solutions is not clamped to 4
+    """
+    statistics = DifficultyStatistics(8)
+    statistics.add(0, 2, 6, 100, 0, 0)
+    assert statistics.summary()["effectiveBranching"] == 10
@@ -0,0 +1,50 @@
+import copy
+
+import numpy as np
+import pytest
+
+from board import Board
+from generator import COLORS
+
+
+@pytest.mark.parametrize("n", [4, 6, 8])
+def testPushPopRoundTrip(n):
+    """
+    Random sequences of push and pop give back, bit for bit, the states of
+    copies of the board taken along the way
+    """
+    rng = np.random.default_rng(n)
+    board = Board(COLORS, n)
+    board.verbose = False
+    for _ in range(100):
+        board.reset(rng)
+        copies = []
+        for _ in range(rng.integers(1, 60)):
+            if copies and rng.random() < 0.3:
+                board.pop()
+                expected = copies.pop()
+            else:
+                copies.append(copy.deepcopy(board))
+                board.push(rng.choice(list(board.legalMoves())))
+                continue
+            assert board.grid.cells.tobytes() == expected.grid.cells.tobytes()
+            assert board.playerPosition == expected.playerPosition
+            assert board.playerPiece.packedFaces == expected.playerPiece.packedFaces
+            assert board.playerPiece.coloredMask == expected.playerPiece.coloredMask
+        # Popping everything gives back the initial state
+        while board.history:
+            board.pop()
+        if copies:
+            assert board.grid.cells.tobytes() == copies[0].grid.cells.tobytes()
+            assert board.playerPosition == copies[0].playerPosition
+
+
+def testLegalMoves():
+    """
+    legalMoves gives exactly the valid directions
+    """
+    board = Board(COLORS, 8)
+    board.verbose = False
+    board.reset(np.random.default_rng(0))
+    for direction in ["left", "right", "up", "down"]:
+        assert (direction in board.legalMoves()) == board.isValidMove(direction)
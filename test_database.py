@@ -0,0 +1,56 @@
+import os
+
+import pytest
+
+from board import Board
+from database import (
+    DatabaseBuilder,
+    DistanceDatabase,
+    databasePath,
+    openDatabase,
+    verify,
+)
+from generator import COLORS
+from solver import StateEncoder
+
+
+def testIncompleteTableIsRefused(tmp_path):
+    """
+    A table whose build stopped after its first layer is not read
+    """
+    path = str(tmp_path / "distances-4.bin")
+    builder = DatabaseBuilder(4, path)
+    builder.initialize()
+    board = Board(COLORS, 4)
+    board.verbose = False
+    encoder = StateEncoder(board)
+    database = DistanceDatabase(4, path)
+    with pytest.raises(ValueError):
+        database.distance(encoder, encoder.encode(board))
+    assert openDatabase(4, path) is None
+
+    builder.build(workers=1)
+    assert openDatabase(4, path) is not None
+    verify(4, path, samples=20)
+
+
+def testDefaultPath(tmp_path, monkeypatch):
+    """
+    The default table does not depend on the working directory
+    """
+    path = databasePath(8)
+    monkeypatch.chdir(tmp_path)
+    assert os.path.isabs(path) and databasePath(8) == path
+
+
+def testTruncatedTableIsRefused(tmp_path):
+    """
+    A complete table cut after its build is not read
+    """
+    path = str(tmp_path / "distances-4.bin")
+    DatabaseBuilder(4, path).build(workers=1)
+    with open(path, "r+b") as file:
+        file.truncate(os.path.getsize(path) // 2)
+    assert openDatabase(4, path) is None
+    with pytest.raises(ValueError):
+        DistanceDatabase(4, path).table
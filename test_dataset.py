@@ -0,0 +1,70 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from database import DatabaseBuilder
+from dataset import MANIFEST_NAME, DatasetReader, DatasetWriter, recordDtype
+from grid import DIRECTIONS
+from solver import AStarSolver
+
+
+def testRecordWidths():
+    """
+    The case ids and the distances of large boards fit in the records
+    """
+    assert recordDtype(96)["playerCell"] == np.int16
+    assert recordDtype(40000)["playerCell"] == np.int32
+    assert np.iinfo(recordDtype(96)["distance"]).max >= 1000
+    assert recordDtype(96, recordFormat=1)["distance"] == np.int8
+
+
+def testWriteRead(tmp_path):
+    """
+    The records replay the games they come from
+    """
+    directory = str(tmp_path / "data")
+    DatasetWriter(directory, n=4, recordsPerShard=200).write(2, workers=1)
+    reader = DatasetReader(directory)
+    assert len(reader) == 400
+    batch = next(reader.batches(20))
+    for record in batch:
+        board = reader.makeBoard(record)
+        assert len(AStarSolver(board).solve()) == record["distance"]
+        assert board.isValidMove(DIRECTIONS[record["move"]])
+
+
+def testFirstFormat(tmp_path):
+    """
+    A dataset written before the format 2 is read with its own layout and
+    cannot be extended
+    """
+    directory = str(tmp_path / "data")
+    DatasetWriter(directory, n=4, recordsPerShard=50).write(1, workers=1)
+    path = os.path.join(directory, MANIFEST_NAME)
+    with open(path) as file:
+        manifest = json.load(file)
+    del manifest["recordFormat"]
+    with open(path, "w") as file:
+        json.dump(manifest, file)
+    reader = DatasetReader(directory)
+    assert reader.dtype == recordDtype(reader.manifest["casesNumber"], 1)
+    with pytest.raises(ValueError):
+        DatasetWriter(directory, n=4, recordsPerShard=50)
+
+
+def testDatabaseSolver(tmp_path):
+    """
+    A dataset is solved with the database given to the writer
+    """
+    path = str(tmp_path / "distances-4.bin")
+    DatabaseBuilder(4, path).build(workers=1)
+    directory = str(tmp_path / "data")
+    writer = DatasetWriter(directory, n=4, recordsPerShard=100, databasePath=path)
+    assert writer.manifest["solver"] == "database"
+    writer.write(1, workers=1)
+    reader = DatasetReader(directory)
+    for record in next(reader.batches(20)):
+        board = reader.makeBoard(record)
+        assert len(AStarSolver(board).solve()) == record["distance"]
@@ -0,0 +1,19 @@
+import numpy as np
+
+from environment import TetahedronEnvironment
+
+
+def testLargeBoardPosition():
+    """
+    The position of the piece is observed beyond column 127 (130 lines)
+    """
+    environment = TetahedronEnvironment(130)
+    observation = environment.reset(seed=0)
+    assert tuple(observation["piece"][:2]) == environment.board.playerPosition
+    assert observation["piece"][1] > 127
+
+    # Walk along the lines so that the column goes down and up again
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        observation, _, _, _ = environment.step(rng.choice(environment.legalActions()))
+        assert tuple(observation["piece"][:2]) == environment.board.playerPosition
@@ -0,0 +1,34 @@
+from database import DatabaseBuilder, openDatabase
+from generator import PuzzleGenerator
+from solver import AStarSolver
+
+
+def testDatabaseScreening(tmp_path):
+    """
+    The generator gives the same lengths with the database as with A*
+    """
+    path = str(tmp_path / "distances-4.bin")
+    DatabaseBuilder(4, path).build(workers=1)
+    generator = PuzzleGenerator(4, seed=0, database=openDatabase(4, path))
+    layouts = generator.sampleLayouts(50)
+    distances = generator.database.layoutDistances(generator.startCell, layouts)
+    for layout, distance in zip(layouts, distances):
+        generator.board.reset(colorCases=generator.colorCases(layout))
+        assert len(AStarSolver(generator.board).solve()) == distance
+
+    generator.minLength, generator.maxLength = 12, 14
+    for layout, solution in generator.generate(50):
+        generator.board.reset(colorCases=generator.colorCases(layout))
+        assert 12 <= len(solution) <= 14
+        for direction in solution:
+            generator.board.move(direction)
+        assert generator.board.checkWin()
+
+
+def testWithoutDatabase():
+    """
+    A* solves every layout when there is no database
+    """
+    generator = PuzzleGenerator(4, minLength=10, maxLength=12, seed=0, database=False)
+    assert generator.database is None
+    assert all(10 <= len(solution) <= 12 for _, solution in generator.generate(20))
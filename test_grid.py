@@ -0,0 +1,34 @@
+import os
+
+import numpy as np
+
+import grid
+from grid import GEOMETRY_FORMAT, TetraGrid, computeTetraGeometry
+
+
+def testUnwritableCache(tmp_path, monkeypatch):
+    # A directory under a regular file can not be created
+    (tmp_path / "file").write_text("")
+    monkeypatch.setattr(
+        grid, "GEOMETRY_CACHE_DIRECTORY", str(tmp_path / "file" / "sub")
+    )
+    monkeypatch.setattr(grid, "geometries", {})
+    tetraGrid = TetraGrid(64)
+    assert np.array_equal(tetraGrid.neighbors, computeTetraGeometry(64)["neighbors"])
+
+
+def testStaleCache(tmp_path, monkeypatch):
+    monkeypatch.setattr(grid, "GEOMETRY_CACHE_DIRECTORY", str(tmp_path))
+    monkeypatch.setattr(grid, "geometries", {})
+    # Archive of the right name lacking a table
+    path = tmp_path / ("tetraGrid-64-v%d.npz" % GEOMETRY_FORMAT)
+    np.savez(path, cellIds=np.zeros(1))
+    expected = computeTetraGeometry(64)
+    geometry = grid.tetraGeometry(64)
+    for name, array in expected.items():
+        assert np.array_equal(geometry[name], array)
+    # Rewritten and read back by the next process
+    monkeypatch.setattr(grid, "geometries", {})
+    assert os.path.exists(path)
+    geometry = grid.tetraGeometry(64)
+    assert np.array_equal(geometry["cellIds"], expected["cellIds"])
@@ -0,0 +1,48 @@
+import threading
+import time
+
+import numpy as np
+
+from board import Board
+from generator import COLORS
+from hints import HintEngine
+
+
+def newBoard(seed):
+    board = Board(COLORS, 8)
+    board.verbose = False
+    board.reset(np.random.default_rng(seed))
+    return board
+
+
+def testHintAfterSearch():
+    """
+    A hint searched in the background is announced by onReady
+    """
+    ready = threading.Event()
+    engine = HintEngine(onReady=ready.set)
+    board = newBoard(0)
+    assert engine.request(board) is None
+    assert ready.wait(30)
+    assert engine.currentHint() in board.legalMoves()
+    engine.close()
+
+
+def testNoCallbackAfterClose():
+    """
+    onReady is not called once close has returned, even when the search in
+    progress ends later (the hints toggled off before the game quits)
+    """
+    late = []
+    for seed in range(5):
+        closed = threading.Event()
+        engine = HintEngine(onReady=lambda: late.append(closed.is_set()))
+        engine.request(newBoard(seed))
+        thread = engine.thread
+        # Closed while the search runs
+        while engine.pending is not None:
+            time.sleep(0.001)
+        engine.close(wait=False)
+        closed.set()
+        thread.join(30)
+    assert True not in late
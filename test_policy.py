@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from batchEnvironment import BatchEnvironment
+from coloredPiece import FACE_BITS, FACE_MASK, FACES
+from dataset import DatasetReader, DatasetWriter
+from policy import COLOR_VALUES, PolicyNetwork, inputSize, train
+
+
+def states(n, size, seed=0):
+    environment = BatchEnvironment(n, size, seed)
+    return environment.cells, environment.playerCells, environment.faces
+
+
+def testEncodeColumns():
+    """
+    One plane of cases per color, the case of the piece, the color of each
+    face
+    """
+    network = PolicyNetwork.random(6, hidden=16, seed=0)
+    cells, playerCells, faces = states(6, 8)
+    inputs = network.encode(cells, playerCells, faces)
+    casesNumber = network.casesNumber
+    assert inputs.shape == (8, inputSize(casesNumber))
+    for row in range(8):
+        expected = np.zeros(inputs.shape[1], dtype=np.float32)
+        for cell, color in enumerate(cells[row].tolist()):
+            if color:
+                expected[(color - 1) * casesNumber + cell] = 1
+        expected[(COLOR_VALUES - 1) * casesNumber + int(playerCells[row])] = 1
+        for face in range(len(FACES)):
+            color = (int(faces[row]) >> (FACE_BITS * face)) & FACE_MASK
+            expected[COLOR_VALUES * (casesNumber + face) + color] = 1
+        assert np.array_equal(inputs[row], expected)
+
+
+def testChooseMovesValid():
+    """
+    A blocked direction is never chosen, whatever the logits
+    """
+    network = PolicyNetwork.random(6, hidden=16, seed=1)
+    # The blocked moves get the highest logits
+    network.weights["b3"][:4] = 1000
+    cells, playerCells, faces = states(6, 512)
+    choices = network.chooseMoves(cells, playerCells, faces)
+    assert np.all(network.grid.neighbors[playerCells, choices] >= 0)
+
+
+def testSaveLoad(tmp_path):
+    network = PolicyNetwork.random(4, hidden=16, seed=2)
+    path = str(tmp_path / "policy-4.npz")
+    network.save(path)
+    loaded = PolicyNetwork.load(path)
+    assert loaded.lines == 4
+    for name, value in network.weights.items():
+        assert np.array_equal(loaded.weights[name], value)
+    arrays = states(4, 16)
+    for expected, value in zip(network.forward(*arrays), loaded.forward(*arrays)):
+        assert np.array_equal(expected, value)
+
+
+@pytest.fixture
+def reader(tmp_path):
+    directory = str(tmp_path / "data")
+    DatasetWriter(directory, n=4, recordsPerShard=512).write(1, workers=1)
+    return DatasetReader(directory)
+
+
+def testTrainLowersLoss(reader):
+    network = PolicyNetwork.random(4, hidden=32, seed=3)
+    history = train(network, reader, epochs=6, batchSize=64, learningRate=3e-3, seed=0)
+    assert history[-1][0] < history[0][0]
+
+
+class InterruptedReader:
+    def __init__(self, reader):
+        self.manifest = reader.manifest
+        self.reader = reader
+
+    def batches(self, batchSize):
+        yield from self.reader.batches(batchSize)
+        raise KeyboardInterrupt
+
+
+def testInterruptedTraining(reader):
+    """
+    The value head is scaled back when the training stops early
+    """
+    network = PolicyNetwork.random(4, hidden=16, seed=4)
+    weights = {name: value.copy() for name, value in network.weights.items()}
+    with pytest.raises(KeyboardInterrupt):
+        train(network, InterruptedReader(reader), learningRate=0.0)
+    for name, value in weights.items():
+        assert np.allclose(network.weights[name], value)
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from board import Board
+from recording import TrajectoryReader, TrajectoryWriter
+
+COLORS = ["white", "black", "red", "green", "blue"]
+
+
+def state(board):
+    return (
+        board.grid.cells.tobytes(),
+        board.playerPosition,
+        board.playerPiece.packedFaces,
+    )
+
+
+def newBoard(seed):
+    board = Board(COLORS, 6)
+    board.verbose = False
+    board.reset(np.random.default_rng(seed))
+    return board
+
+
+def testPopEmptyHistory(tmp_path):
+    board = newBoard(0)
+    writer = TrajectoryWriter(str(tmp_path), n=6, checkpointInterval=2)
+    writer.attach(board)
+    board.move(next(board.legalMoves()))
+    with pytest.raises(IndexError):
+        board.pop()
+    # The move played without push is still recorded
+    assert len(writer.moves) == 1
+    writer.close()
+
+
+def testPopPastAttach(tmp_path):
+    board = newBoard(1)
+    for _ in range(3):
+        board.push(next(board.legalMoves()))
+    writer = TrajectoryWriter(str(tmp_path), n=6, checkpointInterval=2)
+    writer.attach(board)
+    board.pop()
+    board.pop()
+    rng = np.random.default_rng(0)
+    frames = [state(board)]
+    for _ in range(5):
+        board.push(rng.choice(list(board.legalMoves())))
+        frames.append(state(board))
+    writer.close()
+
+    # The game is recorded from the state reached by the pops
+    reader = TrajectoryReader(str(tmp_path))
+    assert len(reader) == 1
+    for frame, expected in enumerate(frames):
+        assert state(reader.frame(0, frame)) == expected
@@ -0,0 +1,78 @@
+import asyncio
+import os
+
+import server
+from server import GameServer, runLoad
+
+
+def failingBatch(n, keys):
+    raise RuntimeError("worker failure")
+
+
+def dyingBatch(n, keys):
+    os._exit(1)
+
+
+async def exchange(path, commands):
+    reader, writer = await asyncio.open_unix_connection(path)
+    answers = []
+    for command in commands:
+        writer.write((command + "\n").encode())
+        await writer.drain()
+        answer = await asyncio.wait_for(reader.readline(), 10)
+        answers.append(answer.decode().strip())
+    writer.close()
+    return answers
+
+
+def testWorkerFailure(tmp_path, monkeypatch):
+    # Patched before the pool is started so that the forked workers see it
+    monkeypatch.setattr(server, "solveBatch", failingBatch)
+    path = str(tmp_path / "tetra.sock")
+
+    async def run():
+        gameServer = GameServer(workers=1)
+        await gameServer.start(path=path)
+        try:
+            answers = await exchange(path, ["NEW 6 0", "HINT", "STATE"])
+            statistics = await runLoad(
+                path=path, sessions=4, concurrency=2, moves=10, hintRate=0.5, n=6
+            )
+            return answers, statistics
+        finally:
+            await gameServer.close()
+
+    (new, hint, state), statistics = asyncio.run(run())
+    assert hint.startswith("ERR search failed")
+    assert not state.startswith("ERR") and state
+    # The bots play on with random moves
+    assert statistics["failedHints"] > 0
+
+
+def testBrokenPool(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "solveBatch", dyingBatch)
+    path = str(tmp_path / "tetra.sock")
+    shutdowns = []
+
+    async def run():
+        gameServer = GameServer(workers=1)
+        await gameServer.start(path=path)
+        brokenPool = gameServer.pool
+        shutdown = brokenPool.shutdown
+        monkeypatch.setattr(
+            brokenPool,
+            "shutdown",
+            lambda **options: shutdowns.append(options) or shutdown(**options),
+        )
+        try:
+            # The first search breaks the pool, the second one finds it broken
+            answers = await exchange(path, ["NEW 6 0", "HINT", "HINT"])
+            return answers, gameServer.pool is not brokenPool
+        finally:
+            await gameServer.close()
+
+    (new, first, second), replaced = asyncio.run(run())
+    assert first.startswith("ERR search failed")
+    assert second.startswith("ERR search failed")
+    assert replaced
+    assert shutdowns[0] == {"wait": False, "cancel_futures": True}
@@ -0,0 +1,275 @@
+import math
+from collections import OrderedDict
+
+from grid import DOWN, LEFT, RIGHT, UP
+
+
+class GridSymmetries:
+    """
+    Python Class computing the symmetries of the hexagonal board of a
+    TetraGrid (the 6 rotations and the 6 reflections of the hexagon)
+
+    For each symmetry g:
+    - cellMaps[g][caseId] is the id of the image of the case
+    - directionMaps[g][caseId][directionCode] is the direction of the image of
+      the move (the direction blocked by the orientation of a case is mapped to
+      the one blocked on its image)
+    - componentMaps[g][k] is the image of the connected component k
+    - inverses[g] is the index of the inverse symmetry
+    The symmetry 0 is the identity.
+    """
+
+    def __init__(self, grid):
+        """
+        Compute the symmetries of [grid] from the centers of its cases drawn as
+        equilateral triangles
+
+        :grid: a TetraGrid
+        """
+        self.grid = grid
+        height = math.sqrt(3) / 2
+        cases = grid.cellPositionsTable
+        components = grid.cellComponents.tolist()
+
+        def center(i, j):
+            # Case facing up: its base is at the bottom of the line
+            third = 2 * height / 3 if grid.isCaseUp(i, j) else height / 3
+            return j / 2, i * height + third
+
+        def edges(i, j):
+            # Centers of the 3 cases sharing an edge with the case (on the
+            # board or not) by direction code
+            vertical = (DOWN, i + 1) if grid.isCaseUp(i, j) else (UP, i - 1)
+            return {
+                LEFT: center(i, j - 1),
+                RIGHT: center(i, j + 1),
+                vertical[0]: center(vertical[1], j),
+            }
+
+        def key(point):
+            return round(point[0], 6), round(point[1], 6)
+
+        centers = [center(i, j) for i, j in cases]
+        middleX = sum(x for x, _ in centers) / len(centers)
+        middleY = sum(y for _, y in centers) / len(centers)
+        ids = {key(point): caseId for caseId, point in enumerate(centers)}
+
+        self.cellMaps = []
+        self.directionMaps = []
+        self.componentMaps = []
+        for reflection in (False, True):
+            for rotation in range(6):
+                angle = rotation * math.pi / 3
+                cos, sin = math.cos(angle), math.sin(angle)
+
+                def transform(point):
+                    x, y = point[0] - middleX, point[1] - middleY
+                    if reflection:
+                        x = -x
+                    return (
+                        middleX + cos * x - sin * y,
+                        middleY + sin * x + cos * y,
+                    )
+
+                cellMap = [ids.get(key(transform(point))) for point in centers]
+                if None in cellMap:
+                    continue  # not a symmetry of this board
+                directionMap = []
+                componentMap = {}
+                for caseId, (i, j) in enumerate(cases):
+                    image = cases[cellMap[caseId]]
+                    imageEdges = {key(p): d for d, p in edges(*image).items()}
+                    directions = {
+                        d: imageEdges[key(transform(p))] for d, p in edges(i, j).items()
+                    }
+                    blocked = ({UP, DOWN} - set(directions)).pop()
+                    directions[blocked] = ({UP, DOWN} - set(imageEdges.values())).pop()
+                    directionMap.append([directions[d] for d in range(4)])
+                    componentMap[components[caseId]] = components[cellMap[caseId]]
+                self.cellMaps.append(cellMap)
+                self.directionMaps.append(directionMap)
+                self.componentMaps.append(componentMap)
+
+        identity = list(range(len(cases)))
+        self.inverses = []
+        for cellMap in self.cellMaps:
+            inverse = [0] * len(cases)
+            for caseId, image in enumerate(cellMap):
+                inverse[image] = caseId
+            self.inverses.append(self.cellMaps.index(inverse))
+        assert self.cellMaps[0] == identity
+
+    def __len__(self):
+        return len(self.cellMaps)
+
+    def transform(self, encoder, state, g):
+        """
+        Return the image of [state] by the symmetry [g]
+
+        The color living in the component k is moved to the image of its case,
+        or stays on the piece on the face touching the image of k, so the faces
+        of the piece are remapped with the components
+
+        :encoder: the StateEncoder of [state]
+        :state: a packed state
+        :g: index of the symmetry
+        :return: the packed state
+        """
+        cellMap = self.cellMaps[g]
+        componentMap = self.componentMaps[g]
+        mask, pieceCode = encoder.mask, encoder.pieceCode
+        image = cellMap[state & mask]
+        for k, shift in encoder.shifts.items():
+            field = (state >> shift) & mask
+            if field != pieceCode:
+                field = cellMap[field]
+            image |= field << encoder.shifts[componentMap[k]]
+        return image
+
+    def canonical(self, encoder, state):
+        """
+        Return the smallest image of [state] by the symmetries
+
+        :encoder: the StateEncoder of [state]
+        :state: a packed state
+        :return: the canonical state and the index of a symmetry giving it
+        """
+        best, bestSymmetry = state, 0
+        for g in range(1, len(self.cellMaps)):
+            image = self.transform(encoder, state, g)
+            if image < best:
+                best, bestSymmetry = image, g
+        return best, bestSymmetry
+
+
+class TranspositionTable:
+    """
+    Python Class caching the distance to win and an optimal move of the states
+    met by the solvers, shared by all the boards with the same number of lines
+
+    The states are stored in their canonical form under the symmetries of the
+    board (see GridSymmetries) with the move expressed in this form. The table
+    keeps at most [maxSize] states and evicts the least recently used ones.
+    The states are the ones of StateEncoder, which do not depend on the colors,
+    so a single table serves every game.
+    """
+
+    def __init__(self, grid, maxSize=1000000):
+        """
+        Creation of an empty table
+
+        :grid: the TetraGrid of the boards
+        :maxSize: maximal number of states kept (no limit if None)
+        """
+        self.symmetries = GridSymmetries(grid)
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        """
+        Remove all the states and reset the counters
+
+        :return: nothing
+        """
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def probe(self, encoder, state):
+        """
+        Return the cached distance and optimal move of [state] (without
+        counting a hit or a miss)
+
+        :encoder: the StateEncoder of [state]
+        :state: a packed state
+        :return: (distance, direction code) or None if [state] is not cached
+        (the direction is None for a winning state)
+        """
+        canonicalState, g = self.symmetries.canonical(encoder, state)
+        entry = self.entries.get(canonicalState)
+        if entry is None:
+            return None
+        self.entries.move_to_end(canonicalState)
+        distance, move = entry
+        if move is not None:
+            # Direction of the move seen from [state]
+            inverse = self.symmetries.inverses[g]
+            move = self.symmetries.directionMaps[inverse][
+                canonicalState & encoder.mask
+            ][move]
+        return distance, move
+
+    def bestMove(self, encoder, state):
+        """
+        Return the cached distance and optimal move of [state]
+
+        :encoder: the StateEncoder of [state]
+        :state: a packed state
+        :return: (distance, direction code) or None if [state] is not cached
+        """
+        entry = self.probe(encoder, state)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def solution(self, encoder, state):
+        """
+        Return a cached shortest list of moves from [state] to a win by
+        following the optimal moves of the table
+
+        :encoder: the StateEncoder of [state]
+        :state: a packed state
+        :return: list of direction codes or None if it is not cached
+        """
+        path = []
+        entry = self.probe(encoder, state)
+        while entry is not None and entry[1] is not None:
+            path.append(entry[1])
+            state = encoder.nextState(state, entry[1])
+            entry = self.probe(encoder, state)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def store(self, encoder, state, distance, move):
+        """
+        Cache the distance to win and an optimal move of [state]
+
+        :encoder: the StateEncoder of [state]
+        :state: a packed state
+        :distance: minimal number of moves to win from [state]
+        :move: direction code of an optimal move (None if [state] is won)
+        :return: nothing
+        """
+        canonicalState, g = self.symmetries.canonical(encoder, state)
+        if move is not None:
+            move = self.symmetries.directionMaps[g][state & encoder.mask][move]
+        self.entries[canonicalState] = (distance, move)
+        self.entries.move_to_end(canonicalState)
+        if self.maxSize is not None and len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def storeSolution(self, encoder, state, solution):
+        """
+        Cache every state of a shortest solution (each suffix of a shortest
+        solution is a shortest solution too)
+
+        :encoder: the StateEncoder of [state]
+        :state: a packed state
+        :solution: shortest list of direction codes from [state] to a win
+        :return: nothing
+        """
+        for k, move in enumerate(solution):
+            self.store(encoder, state, len(solution) - k, move)
+            state = encoder.nextState(state, move)
+        self.store(encoder, state, 0, None)